@@ -107,12 +107,16 @@ export default function ApiKeysPage() {
             <div style={{display: "grid", gap: 12, marginTop: 8}}>
               <div>
                 <div className={styles.muted} style={{fontSize: 12}}>Key</div>
-                <div className={styles.mono}>{maskKey(keyData.key)}</div>
-                <div style={{marginTop: 6}}>
-                  <button className="btn btn-primary" onClick={copyKey} disabled={!keyData?.key}>
-                    {copied ? "Copied" : "Copy key"}
-                  </button>
-                </div>
+                <div className={styles.mono}>{keyData.masked ? keyData.key : maskKey(keyData.key)}</div>
+                {keyData.masked ? (
+                  <div className={styles.muted} style={{fontSize: 12, marginTop: 6}}>Keys are only shown once. Regenerate to get a new one.</div>
+                ) : (
+                  <div style={{marginTop: 6}}>
+                    <button className="btn btn-primary" onClick={copyKey} disabled={!keyData?.key}>
+                      {copied ? "Copied" : "Copy key"}
+                    </button>
+                  </div>
+                )}
               </div>
               <div style={{display: "grid", gridTemplateColumns: "repeat(3, 1fr)", gap: 8}}>
                 <div>
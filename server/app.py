@@ -37,7 +37,8 @@ from resources.disbursment_resource import DisbursmentRequestResource, Disbursme
 from test_resources.wallet_test_transaction import WalletTransactionResource
 from test_resources.example_callback import TestWebhookResource
 
-import sqlalchemy.pool
+from utils.db_pool import engine_options
+from utils.mpesa_rate_limit import rate_limit_stats
 from celery_app import celery
 from celery_app import init_celery
 bcrypt = Bcrypt()
@@ -47,9 +48,7 @@ def create_app():
     app = Flask(__name__)
     
     app.config.from_object(Config)
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "poolclass": sqlalchemy.pool.NullPool
-    }
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
 
     # Extensions
     db.init_app(app)
@@ -102,7 +101,8 @@ def create_app():
         def get(self):
             try:
                 app.redis.ping()
-                return {"status": "healthy", "redis": "connected"}, 200
+                # queueing delay added by the shared Daraja rate limiter
+                return {"status": "healthy", "redis": "connected", "mpesa_rate_limit": rate_limit_stats(app.redis)}, 200
             except redis.ConnectionError:
                 return {"status": "healthy", "redis": "disconnected"}, 200
 
@@ -1,6 +1,7 @@
 from celery import Celery
 import os
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -18,6 +19,8 @@ celery.conf.update(
     enable_utc=True,
     imports=[
         'workers.initiate_mpesa',  # <-- import your task module here
+        'workers.wallet_logger',
+        'workers.outbox',
     ]
 )
 
@@ -27,6 +30,26 @@ celery.conf.beat_schedule = {
         'schedule': crontab(hour=9, minute=0, day_of_week='fri'),
         # 'schedule': crontab(minute='*/3'), 
     },
+    'refresh-mpesa-token-every-minute': {
+        'task': 'workers.refresh_mpesa_token',
+        'schedule': crontab(minute='*'),
+    },
+    'sweep-wallet-batches-every-minute': {
+        'task': 'workers.sweep_wallet_batches',
+        'schedule': crontab(minute='*'),
+    },
+    'compact-platform-fees-every-5-minutes': {
+        'task': 'workers.compact_platform_fees',
+        'schedule': crontab(minute='*/5'),
+    },
+    'publish-outbox-every-minute': {
+        'task': 'workers.publish_outbox',
+        'schedule': crontab(minute='*'),
+    },
+    'reconcile-wallet-stats-nightly': {
+        'task': 'workers.reconcile_wallet_stats',
+        'schedule': crontab(hour=2, minute=30),
+    },
 }
 
 def init_celery(app):
@@ -41,5 +64,18 @@ def init_celery(app):
     celery.flask_app = app  # Store app reference for tasks
     return celery
 
+@worker_process_init.connect
+def reset_db_pool(**kwargs):
+    """
+    Prefork children inherit the parent's pooled connections; drop them
+    (without closing the parent's sockets) so each child opens its own.
+    """
+    app = getattr(celery, "flask_app", None)
+    if app is None:
+        return
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
 # start celery worker and batching with:
 # celery -A app.celery worker --loglevel=info
\ No newline at end of file
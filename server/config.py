@@ -9,6 +9,15 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=40)  # <- Correct key
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///mpesa.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # connection pooling (see utils/db_pool.py)
+    PROCESS_TYPE = os.getenv('PROCESS_TYPE', 'web')  # web, worker
+    DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'queue')  # queue, pgbouncer, null
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0)) or None  # None -> default for PROCESS_TYPE
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW')) if os.getenv('DB_MAX_OVERFLOW') else None
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
     
     CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
     CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
@@ -24,6 +33,89 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = 300
     PROFILE_CACHE_TTL = 300
 
+    # M-Pesa OAuth (utils/mpesa_auth.py)
+    MPESA_CONSUMER_KEY = os.getenv('MPESA_CONSUMER_KEY')
+    MPESA_CONSUMER_SECRET = os.getenv('MPESA_CONSUMER_SECRET')
+    MPESA_TOKEN_REFRESH_MARGIN = int(os.getenv('MPESA_TOKEN_REFRESH_MARGIN', 300))  # seconds before expiry
+
+    # Daraja HTTP client (utils/mpesa_client.py)
+    MPESA_BASE_URL = os.getenv('MPESA_BASE_URL', 'https://api.safaricom.co.ke')
+    MPESA_CONNECT_TIMEOUT = float(os.getenv('MPESA_CONNECT_TIMEOUT', 5))  # seconds
+    MPESA_READ_TIMEOUT = float(os.getenv('MPESA_READ_TIMEOUT', 30))  # seconds
+    MPESA_POOL_MAXSIZE = int(os.getenv('MPESA_POOL_MAXSIZE', 20))
+    MPESA_MAX_RETRIES = int(os.getenv('MPESA_MAX_RETRIES', 3))
+    MPESA_STATS_LOG_INTERVAL = float(os.getenv('MPESA_STATS_LOG_INTERVAL', 300))  # seconds, 0 to disable
+
+    # Daraja rate limits, tokens per second and burst per bucket (utils/mpesa_rate_limit.py)
+    MPESA_RATE_LIMIT_ENABLED = os.getenv('MPESA_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    MPESA_RATE_LIMIT_TIMEOUT = float(os.getenv('MPESA_RATE_LIMIT_TIMEOUT', 30))  # seconds
+    MPESA_RATE_GLOBAL = float(os.getenv('MPESA_RATE_GLOBAL', 50))
+    MPESA_BURST_GLOBAL = float(os.getenv('MPESA_BURST_GLOBAL', 100))
+    MPESA_RATE_STK = float(os.getenv('MPESA_RATE_STK', 30))
+    MPESA_BURST_STK = float(os.getenv('MPESA_BURST_STK', 60))
+    MPESA_RATE_B2C = float(os.getenv('MPESA_RATE_B2C', 10))
+    MPESA_BURST_B2C = float(os.getenv('MPESA_BURST_B2C', 20))
+    MPESA_RATE_B2B = float(os.getenv('MPESA_RATE_B2B', 10))
+    MPESA_BURST_B2B = float(os.getenv('MPESA_BURST_B2B', 20))
+    MPESA_RATE_OAUTH = float(os.getenv('MPESA_RATE_OAUTH', 1))
+    MPESA_BURST_OAUTH = float(os.getenv('MPESA_BURST_OAUTH', 5))
+
+    # API key auth cache (utils/api_key_cache.py)
+    API_KEY_CACHE_SIZE = int(os.getenv('API_KEY_CACHE_SIZE', 10000))
+    API_KEY_LOCAL_TTL = float(os.getenv('API_KEY_LOCAL_TTL', 30))  # seconds
+    API_KEY_REDIS_TTL = int(os.getenv('API_KEY_REDIS_TTL', 300))  # seconds
+
+    # status cache (utils/status_cache.py)
+    STATUS_TERMINAL_TTL = int(os.getenv('STATUS_TERMINAL_TTL', 86400))  # seconds
+    STATUS_PENDING_TTL = int(os.getenv('STATUS_PENDING_TTL', 30))  # seconds
+
+    # payment status events and SSE (utils/subscribe_manager.py, sse_gateway.py)
+    EVENT_STREAM_MAXLEN = int(os.getenv('EVENT_STREAM_MAXLEN', 50))
+    EVENT_STREAM_TTL = int(os.getenv('EVENT_STREAM_TTL', 3600))  # seconds
+    EVENT_STREAM_TERMINAL_TTL = int(os.getenv('EVENT_STREAM_TERMINAL_TTL', 300))  # seconds, once finished
+    SSE_PORT = int(os.getenv('SSE_PORT', 5001))
+    SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+    SSE_MAX_SECONDS = float(os.getenv('SSE_MAX_SECONDS', 300))
+
+    # wallet posting
+    WALLET_BATCH_POSTING = os.getenv('WALLET_BATCH_POSTING', 'false').lower() == 'true'
+    WALLET_BATCH_MAX_SIZE = int(os.getenv('WALLET_BATCH_MAX_SIZE', 200))
+    WALLET_BATCH_MAX_DELAY = float(os.getenv('WALLET_BATCH_MAX_DELAY', 0.5))  # seconds
+    WALLET_BATCH_SWEEP_AGE = float(os.getenv('WALLET_BATCH_SWEEP_AGE', 10))  # seconds staged before the sweep drains it
+
+    # asyncio STK dispatcher (python -m workers.stk_dispatcher)
+    STK_DISPATCHER_ENABLED = os.getenv('STK_DISPATCHER_ENABLED', 'false').lower() == 'true'
+    STK_DISPATCHER_BATCH_SIZE = int(os.getenv('STK_DISPATCHER_BATCH_SIZE', 200))
+    STK_DISPATCHER_CONCURRENCY = int(os.getenv('STK_DISPATCHER_CONCURRENCY', 100))  # per shortcode
+    STK_DISPATCHER_MAX_BATCHES = int(os.getenv('STK_DISPATCHER_MAX_BATCHES', 4))  # batches in flight per process
+
+    # asyncio webhook delivery engine (python -m workers.webhook_engine)
+    WEBHOOK_ENGINE_ENABLED = os.getenv('WEBHOOK_ENGINE_ENABLED', 'false').lower() == 'true'
+    WEBHOOK_ENGINE_BATCH_SIZE = int(os.getenv('WEBHOOK_ENGINE_BATCH_SIZE', 200))
+    WEBHOOK_ENGINE_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_ENGINE_MAX_IN_FLIGHT', 2000))
+    WEBHOOK_TENANT_CONCURRENCY = int(os.getenv('WEBHOOK_TENANT_CONCURRENCY', 10))
+    WEBHOOK_TENANT_MAX_PENDING = int(os.getenv('WEBHOOK_TENANT_MAX_PENDING', 200))
+    WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 10))  # seconds
+    WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8))
+    WEBHOOK_RETRY_BASE = float(os.getenv('WEBHOOK_RETRY_BASE', 5))  # seconds
+    WEBHOOK_RETRY_CAP = float(os.getenv('WEBHOOK_RETRY_CAP', 3600))  # seconds
+    WEBHOOK_BATCH_MAX_SIZE = int(os.getenv('WEBHOOK_BATCH_MAX_SIZE', 100))  # events per batched POST
+    WEBHOOK_BATCH_MAX_DELAY = float(os.getenv('WEBHOOK_BATCH_MAX_DELAY', 0.5))  # seconds
+
+    # fast callback ingest (python -m workers.callback_consumer)
+    CALLBACK_INGEST_ENABLED = os.getenv('CALLBACK_INGEST_ENABLED', 'false').lower() == 'true'
+    CALLBACK_INGEST_BATCH_SIZE = int(os.getenv('CALLBACK_INGEST_BATCH_SIZE', 200))
+    CALLBACK_INGEST_CLAIM_IDLE = float(os.getenv('CALLBACK_INGEST_CLAIM_IDLE', 60))  # seconds
+    CALLBACK_CLAIM_TTL = int(os.getenv('CALLBACK_CLAIM_TTL', 120))  # seconds, while being processed
+    CALLBACK_DEDUPE_TTL = int(os.getenv('CALLBACK_DEDUPE_TTL', 86400))  # seconds
+
+    # payouts
+    PAYOUT_ENQUEUE_BATCH_SIZE = int(os.getenv('PAYOUT_ENQUEUE_BATCH_SIZE', 500))
+
+    # API rate limits, "<requests>/<seconds>" per tenant (decorators/rate_limit.py)
+    RATE_LIMIT_PAYMENT_STATUS = os.getenv('RATE_LIMIT_PAYMENT_STATUS', '1/10')
+    RATE_LIMIT_DISBURSEMENT_STATUS = os.getenv('RATE_LIMIT_DISBURSEMENT_STATUS', '1/10')
+
     # Google
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
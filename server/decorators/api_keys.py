@@ -1,6 +1,6 @@
 from functools import wraps
 from flask import request
-from models import ApiKey
+from utils.api_key_cache import lookup_tenant_id
 
 def api_key_required(fn):
     @wraps(fn)
@@ -10,14 +10,13 @@ def api_key_required(fn):
             return {"error": "Missing or invalid Authorization header"}, 401
 
         token = auth.split(" ")[1]
-        print(f"Received API key: {token}")
-        # Check API key validity
-        api_key = ApiKey.query.filter_by(key=token, revoked_at=None).first()
-        if not api_key:
+        # Check API key validity (in-process LRU -> Redis -> database)
+        tenant_id = lookup_tenant_id(token)
+        if not tenant_id:
             return {"error": "Invalid or revoked API key"}, 403
 
         # Optionally pass tenant_id to the route
-        kwargs["tenant_id"] = api_key.tenant_id
+        kwargs["tenant_id"] = tenant_id
         return fn(*args, **kwargs)
     return wrapper
 
@@ -0,0 +1,93 @@
+"""
+Redis-backed rate limiting for API routes (GCRA).
+
+Limits are configured per route as "<requests>/<seconds>" strings in
+Config and applied per tenant (or per client IP on unauthenticated routes),
+optionally narrowed to one resource by a view argument. Each key stores a
+single timestamp and expires once it no longer limits anything, so memory
+stays bounded.
+
+    @api_key_required
+    @rate_limit("RATE_LIMIT_PAYMENT_STATUS", key_arg="collection_identifier")
+    def get(self, collection_identifier, tenant_id=None):
+        ...
+"""
+import logging
+import math
+from functools import wraps
+
+from flask import current_app, request
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1]: limiter key
+# ARGV[1]: emission interval (ms), ARGV[2]: burst (requests)
+# Returns 0 if allowed, else milliseconds until the next request is allowed.
+_GCRA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - interval * burst
+if now < allow_at then
+    return allow_at - now
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return 0
+"""
+
+
+def parse_limit(value):
+    """
+    "5/60" -> (5, 60.0)
+    """
+    count, period = str(value).split("/", 1)
+    return int(count), float(period)
+
+
+def check_rate_limit(key, limit, period):
+    """
+    Take one request from `key`. Returns 0 if allowed, otherwise the seconds
+    to wait. Fails open when Redis is unreachable.
+    """
+    r = getattr(current_app, "redis", None)
+    if r is None:
+        return 0
+    interval_ms = max(1, int(period * 1000 / limit))
+    try:
+        wait_ms = r.eval(_GCRA, 1, key, interval_ms, limit)
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+        return 0
+    return int(wait_ms) / 1000
+
+
+def rate_limit(config_key, key_arg=None, message="Too many requests"):
+    """
+    Limit a view by the Config entry `config_key`. Must sit below
+    api_key_required so the tenant id is available.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            setting = current_app.config.get(config_key)
+            if not setting:
+                return fn(*args, **kwargs)
+            limit, period = parse_limit(setting)
+
+            identity = kwargs.get("tenant_id") or request.remote_addr
+            key = f"ratelimit:{config_key.lower()}:{identity}"
+            if key_arg:
+                key = f"{key}:{kwargs.get(key_arg)}"
+
+            wait = check_rate_limit(key, limit, period)
+            if wait:
+                return {"error": message, "retry_after": math.ceil(wait)}, 429, {"Retry-After": str(math.ceil(wait))}
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
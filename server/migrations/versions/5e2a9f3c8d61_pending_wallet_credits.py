@@ -0,0 +1,42 @@
+"""pending wallet credits
+
+Revision ID: 5e2a9f3c8d61
+Revises: c41d7e9a2b10
+Create Date: 2026-10-18 10:03:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2a9f3c8d61'
+down_revision = 'c41d7e9a2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('pending_wallet_credits',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tenant_id', sa.UUID(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('transaction_ref', sa.String(length=255), nullable=False),
+    sa.Column('gateway', sa.String(length=100), nullable=True),
+    sa.Column('account_no', sa.String(length=50), nullable=True),
+    sa.Column('payment_link_id', sa.UUID(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], name=op.f('fk_pending_wallet_credits_tenant_id_tenants')),
+    sa.ForeignKeyConstraint(['payment_link_id'], ['payment_links.id'], name=op.f('fk_pending_wallet_credits_payment_link_id_payment_links')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_pending_wallet_credits')),
+    sa.UniqueConstraint('tenant_id', 'transaction_ref', name='uq_pending_wallet_credits_tenant_ref')
+    )
+    with op.batch_alter_table('pending_wallet_credits', schema=None) as batch_op:
+        batch_op.create_index('idx_pending_credit_tenant_created', ['tenant_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('pending_wallet_credits', schema=None) as batch_op:
+        batch_op.drop_index('idx_pending_credit_tenant_created')
+
+    op.drop_table('pending_wallet_credits')
@@ -0,0 +1,43 @@
+"""unique transaction ref per tenant
+
+Revision ID: 8f4d2b6e1a37
+Revises: e7b3c1a94f25
+Create Date: 2026-10-18 11:26:58.140263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4d2b6e1a37'
+down_revision = 'e7b3c1a94f25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # earlier retries could double-post; keep the history but make the
+    # duplicate refs distinct so the constraint can be created
+    op.execute(
+        """
+        UPDATE transaction
+        SET transaction_ref = transaction.transaction_ref || ':dup:' || dups.rn
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY tenant_id, transaction_ref, charges ORDER BY created_at, id
+            ) AS rn
+            FROM transaction
+            WHERE transaction_ref IS NOT NULL
+        ) AS dups
+        WHERE transaction.id = dups.id AND dups.rn > 1
+        """
+    )
+
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_transaction_tenant_ref_charges', ['tenant_id', 'transaction_ref', 'charges'])
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_transaction_tenant_ref_charges', type_='unique')
@@ -0,0 +1,78 @@
+"""hash api keys
+
+Revision ID: a3c5e8f1b942
+Revises: 8f4d2b6e1a37
+Create Date: 2026-10-18 12:04:37.518902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+import hashlib
+import hmac
+import secrets
+import uuid
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e8f1b942'
+down_revision = '8f4d2b6e1a37'
+branch_labels = None
+depends_on = None
+
+# must match utils.api_key_hash
+PREFIX_LENGTH = 8
+
+
+def upgrade():
+    with op.batch_alter_table('api_keys', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('id', postgresql.UUID(as_uuid=True), nullable=True))
+        batch_op.add_column(sa.Column('prefix', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('key_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('salt', sa.String(length=32), nullable=True))
+
+    conn = op.get_bind()
+    for (key,) in conn.execute(sa.text("SELECT key FROM api_keys")).fetchall():
+        salt = secrets.token_hex(16)
+        conn.execute(
+            sa.text(
+                "UPDATE api_keys SET id = :id, prefix = :prefix, key_hash = :key_hash, salt = :salt "
+                "WHERE key = :key"
+            ),
+            {
+                "id": uuid.uuid4(),
+                "prefix": key[:PREFIX_LENGTH],
+                "key_hash": hmac.new(salt.encode(), key.encode(), hashlib.sha256).hexdigest(),
+                "salt": salt,
+                "key": key,
+            },
+        )
+
+    with op.batch_alter_table('api_keys', schema=None) as batch_op:
+        batch_op.alter_column('id', nullable=False)
+        batch_op.alter_column('prefix', nullable=False)
+        batch_op.alter_column('key_hash', nullable=False)
+        batch_op.alter_column('salt', nullable=False)
+        batch_op.drop_constraint('pk_api_keys', type_='primary')
+        batch_op.create_primary_key('pk_api_keys', ['id'])
+        batch_op.drop_column('key')
+        batch_op.create_index('idx_api_keys_prefix', ['prefix'], unique=False)
+
+
+def downgrade():
+    # the plaintext keys are gone; existing keys stop working and tenants
+    # have to regenerate them
+    with op.batch_alter_table('api_keys', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key', sa.String(length=255), nullable=True))
+
+    op.execute("UPDATE api_keys SET key = id::text")
+
+    with op.batch_alter_table('api_keys', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_keys_prefix')
+        batch_op.alter_column('key', nullable=False)
+        batch_op.drop_constraint('pk_api_keys', type_='primary')
+        batch_op.create_primary_key('pk_api_keys', ['key'])
+        batch_op.drop_column('salt')
+        batch_op.drop_column('key_hash')
+        batch_op.drop_column('prefix')
+        batch_op.drop_column('id')
@@ -0,0 +1,35 @@
+"""outbox messages
+
+Revision ID: a9e4f7c2d310
+Revises: f6c1d8b3a527
+Create Date: 2026-10-18 16:42:08.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e4f7c2d310'
+down_revision = 'f6c1d8b3a527'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_messages',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('task', sa.String(length=255), nullable=False),
+    sa.Column('kwargs', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_outbox_messages'))
+    )
+    with op.batch_alter_table('outbox_messages', schema=None) as batch_op:
+        batch_op.create_index('idx_outbox_messages_created', ['created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outbox_messages', schema=None) as batch_op:
+        batch_op.drop_index('idx_outbox_messages_created')
+
+    op.drop_table('outbox_messages')
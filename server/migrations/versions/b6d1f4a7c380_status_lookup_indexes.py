@@ -0,0 +1,32 @@
+"""tenant scoped request reference indexes
+
+Revision ID: b6d1f4a7c380
+Revises: a3c5e8f1b942
+Create Date: 2026-10-18 12:31:09.284417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d1f4a7c380'
+down_revision = 'a3c5e8f1b942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.create_index('idx_api_collections_tenant_ref', ['tenant_id', 'request_reference'], unique=False)
+
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.create_index('idx_api_disbursements_tenant_ref', ['tenant_id', 'request_reference'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_disbursements_tenant_ref')
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_tenant_ref')
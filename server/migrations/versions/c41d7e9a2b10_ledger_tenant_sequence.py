@@ -0,0 +1,82 @@
+"""ledger tenant sequence
+
+Revision ID: c41d7e9a2b10
+Revises: 45db10d1f9fe
+Create Date: 2026-10-18 09:12:04.318215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e9a2b10'
+down_revision = '45db10d1f9fe'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ledger', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tenant_id', sa.UUID(), nullable=True))
+        batch_op.add_column(sa.Column('sequence', sa.BigInteger(), nullable=True))
+        batch_op.create_foreign_key(batch_op.f('fk_ledger_tenant_id_tenants'), 'tenants', ['tenant_id'], ['id'])
+
+    # backfill tenant ownership from the parent transaction
+    op.execute(
+        """
+        UPDATE ledger
+        SET tenant_id = t.tenant_id
+        FROM transaction t
+        WHERE ledger.transaction_id = t.id
+        """
+    )
+
+    # number existing rows per tenant in posting order
+    op.execute(
+        """
+        UPDATE ledger
+        SET sequence = numbered.seq
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY tenant_id ORDER BY created_at, id
+            ) AS seq
+            FROM ledger
+            WHERE tenant_id IS NOT NULL
+        ) AS numbered
+        WHERE ledger.id = numbered.id
+        """
+    )
+
+    # Existing balances were carried along one global chain that mixed every
+    # tenant's entries. Rebase them per tenant so each tenant's latest entry
+    # (which log_transaction continues from) holds its wallet_balance, and
+    # earlier entries step back through the tenant's own signed amounts.
+    op.execute(
+        """
+        UPDATE ledger
+        SET balance = rebased.balance
+        FROM (
+            SELECT l.id, COALESCE(tn.wallet_balance, 0) - COALESCE(SUM(
+                CASE l.type WHEN 'credit' THEN l.amount WHEN 'debit' THEN -l.amount ELSE 0 END
+            ) OVER (
+                PARTITION BY l.tenant_id ORDER BY l.sequence
+                ROWS BETWEEN 1 FOLLOWING AND UNBOUNDED FOLLOWING
+            ), 0) AS balance
+            FROM ledger l
+            JOIN tenants tn ON tn.id = l.tenant_id
+        ) AS rebased
+        WHERE ledger.id = rebased.id
+        """
+    )
+
+    with op.batch_alter_table('ledger', schema=None) as batch_op:
+        batch_op.create_index('idx_ledger_tenant_sequence', ['tenant_id', 'sequence'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('ledger', schema=None) as batch_op:
+        batch_op.drop_index('idx_ledger_tenant_sequence')
+        batch_op.drop_constraint(batch_op.f('fk_ledger_tenant_id_tenants'), type_='foreignkey')
+        batch_op.drop_column('sequence')
+        batch_op.drop_column('tenant_id')
@@ -0,0 +1,54 @@
+"""unique request reference per tenant
+
+Revision ID: c8e2a5d9f163
+Revises: b6d1f4a7c380
+Create Date: 2026-10-18 12:52:44.903175
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e2a5d9f163'
+down_revision = 'b6d1f4a7c380'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the duplicate check in the API was racy; keep any duplicates but make
+    # their refs distinct so the constraint can be created
+    op.execute(
+        """
+        UPDATE api_collections
+        SET request_reference = api_collections.request_reference || ':dup:' || dups.rn
+        FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY tenant_id, request_reference ORDER BY created_at, id
+            ) AS rn
+            FROM api_collections
+        ) AS dups
+        WHERE api_collections.id = dups.id AND dups.rn > 1
+        """
+    )
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_collections_tenant_ref')
+        batch_op.create_unique_constraint('uq_api_collections_tenant_ref', ['tenant_id', 'request_reference'])
+
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_index('idx_api_disbursements_tenant_ref')
+        batch_op.drop_constraint('uq_api_disbursements_request_reference', type_='unique')
+        batch_op.create_unique_constraint('uq_api_disbursements_tenant_ref', ['tenant_id', 'request_reference'])
+
+
+def downgrade():
+    with op.batch_alter_table('api_disbursements', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_api_disbursements_tenant_ref', type_='unique')
+        batch_op.create_unique_constraint('uq_api_disbursements_request_reference', ['request_reference'])
+        batch_op.create_index('idx_api_disbursements_tenant_ref', ['tenant_id', 'request_reference'], unique=False)
+
+    with op.batch_alter_table('api_collections', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_api_collections_tenant_ref', type_='unique')
+        batch_op.create_index('idx_api_collections_tenant_ref', ['tenant_id', 'request_reference'], unique=False)
@@ -0,0 +1,28 @@
+"""webhook batching and signing secret
+
+Revision ID: d4f7a2c6e815
+Revises: c8e2a5d9f163
+Create Date: 2026-10-18 13:41:09.218364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f7a2c6e815'
+down_revision = 'c8e2a5d9f163'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tenant_config', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('webhook_batching', sa.Boolean(), nullable=True, server_default=sa.false()))
+        batch_op.add_column(sa.Column('webhook_secret', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('tenant_config', schema=None) as batch_op:
+        batch_op.drop_column('webhook_secret')
+        batch_op.drop_column('webhook_batching')
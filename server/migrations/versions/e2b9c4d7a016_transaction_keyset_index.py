@@ -0,0 +1,41 @@
+"""covering keyset index for transactions
+
+Revision ID: e2b9c4d7a016
+Revises: d4f7a2c6e815
+Create Date: 2026-10-18 14:22:37.540918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b9c4d7a016'
+down_revision = 'd4f7a2c6e815'
+branch_labels = None
+depends_on = None
+
+INCLUDED = [
+    'transaction_ref', 'amount', 'account_no', 'gateway', 'type', 'status',
+    'recieving_mpesa_number', 'recieving_b2b_account', 'updated_at',
+]
+
+
+def upgrade():
+    # built concurrently so the transaction table stays writable
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_transaction_tenant_created_id', 'transaction', ['tenant_id', 'created_at', 'id'],
+            unique=False, postgresql_include=INCLUDED, postgresql_concurrently=True,
+        )
+        # (tenant_id, created_at) is a prefix of the new index
+        op.drop_index('idx_tenant_created', table_name='transaction', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_tenant_created', 'transaction', ['tenant_id', 'created_at'],
+            unique=False, postgresql_concurrently=True,
+        )
+        op.drop_index('idx_transaction_tenant_created_id', table_name='transaction', postgresql_concurrently=True)
@@ -0,0 +1,39 @@
+"""platform fee entries
+
+Revision ID: e7b3c1a94f25
+Revises: 5e2a9f3c8d61
+Create Date: 2026-10-18 10:41:22.581930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3c1a94f25'
+down_revision = '5e2a9f3c8d61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('platform_fee_entries',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('tenant_id', sa.UUID(), nullable=True),
+    sa.Column('transaction_ref', sa.String(length=255), nullable=True),
+    sa.Column('amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], name=op.f('fk_platform_fee_entries_tenant_id_tenants')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_platform_fee_entries'))
+    )
+
+
+def downgrade():
+    # fold anything not yet compacted back into the wallet row before dropping
+    op.execute(
+        """
+        UPDATE platform_wallet
+        SET amount = amount + (SELECT COALESCE(SUM(amount), 0) FROM platform_fee_entries)
+        """
+    )
+    op.drop_table('platform_fee_entries')
@@ -0,0 +1,56 @@
+"""tenant wallet stats
+
+Revision ID: f6c1d8b3a527
+Revises: e2b9c4d7a016
+Create Date: 2026-10-18 15:06:12.384750
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c1d8b3a527'
+down_revision = 'e2b9c4d7a016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tenant_wallet_stats',
+    sa.Column('tenant_id', sa.UUID(), nullable=False),
+    sa.Column('credit_total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('debit_total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('charge_total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('credit_count', sa.BigInteger(), nullable=False),
+    sa.Column('debit_count', sa.BigInteger(), nullable=False),
+    sa.Column('charge_count', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('reconciled_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['tenant_id'], ['tenants.id'], name=op.f('fk_tenant_wallet_stats_tenant_id_tenants')),
+    sa.PrimaryKeyConstraint('tenant_id', name=op.f('pk_tenant_wallet_stats'))
+    )
+
+    # backfill from existing transactions
+    op.execute("""
+        INSERT INTO tenant_wallet_stats (
+            tenant_id, credit_total, debit_total, charge_total,
+            credit_count, debit_count, charge_count, updated_at, reconciled_at
+        )
+        SELECT
+            tenant_id,
+            COALESCE(SUM(amount) FILTER (WHERE type = 'credit'), 0),
+            COALESCE(SUM(amount) FILTER (WHERE type = 'debit' AND charges IS NOT TRUE), 0),
+            COALESCE(SUM(amount) FILTER (WHERE type = 'debit' AND charges IS TRUE), 0),
+            COUNT(*) FILTER (WHERE type = 'credit'),
+            COUNT(*) FILTER (WHERE type = 'debit' AND charges IS NOT TRUE),
+            COUNT(*) FILTER (WHERE type = 'debit' AND charges IS TRUE),
+            now(), now()
+        FROM transaction
+        WHERE tenant_id IS NOT NULL
+        GROUP BY tenant_id
+    """)
+
+
+def downgrade():
+    op.drop_table('tenant_wallet_stats')
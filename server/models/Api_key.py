@@ -7,7 +7,10 @@ import uuid
 class ApiKey(db.Model):
     __tablename__ = 'api_keys'
 
-    key = db.Column(db.String(255), primary_key=True)
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    prefix = db.Column(db.String(16), nullable=False)  # public part of the key, for lookup and display
+    key_hash = db.Column(db.String(64), nullable=False)  # hex HMAC-SHA256(salt, key)
+    salt = db.Column(db.String(32), nullable=False)
     created_at = db.Column(db.DateTime, nullable=False)
     revoked_at = db.Column(db.DateTime, nullable=True)
     tenant_id = db.Column(UUID(as_uuid=True), db.ForeignKey('tenants.id'))
@@ -16,4 +19,5 @@ class ApiKey(db.Model):
 
     __table_args__ = (
         db.Index("idx_tenant_id", "tenant_id"),
+        db.Index("idx_api_keys_prefix", "prefix"),
     )
@@ -11,6 +11,8 @@ class TenantConfig(db.Model):
     payment_method = db.Column(db.JSON, nullable=True)  # mpesa, card, bank
     api_callback_url = db.Column(db.String(255), nullable=True)
     auto_payout = db.Column(db.Boolean, default=False)
+    webhook_batching = db.Column(db.Boolean, default=False)  # coalesce webhooks into batched POSTs
+    webhook_secret = db.Column(db.String(64), nullable=True)  # HMAC key for X-Webhook-Signature
     __table_args__ = (
         db.Index("idx_tenant_config", "tenant_id"),
     )
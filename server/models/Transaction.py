@@ -27,7 +27,16 @@ class Transaction(db.Model):
     payment_links = db.relationship("PaymentLinks", backref="transaction", lazy=True)
 
     __table_args__ = (
-        db.Index("idx_tenant_created", "tenant_id", "created_at"),
+        # keyset pagination of a tenant's transactions; the included columns
+        # are everything serialize_transaction reads, for index-only scans
+        db.Index(
+            "idx_transaction_tenant_created_id", "tenant_id", "created_at", "id",
+            postgresql_include=[
+                "transaction_ref", "amount", "account_no", "gateway", "type", "status",
+                "recieving_mpesa_number", "recieving_b2b_account", "updated_at",
+            ],
+        ),
+        db.UniqueConstraint("tenant_id", "transaction_ref", "charges", name="uq_transaction_tenant_ref_charges"),
     )
     
     def to_dict(self):
@@ -22,4 +22,8 @@ from models.ledger import Ledger
 from models.payment_link import PaymentLinks
 from models.api_collection import ApiCollection
 from models.api_disbursement import ApiDisbursement
-from models.platform_wallet import Platform_wallet
\ No newline at end of file
+from models.platform_wallet import Platform_wallet
+from models.pending_wallet_credit import PendingWalletCredit
+from models.platform_fee_entry import PlatformFeeEntry
+from models.tenant_wallet_stats import TenantWalletStats
+from models.outbox_message import OutboxMessage
@@ -21,3 +21,7 @@ class ApiCollection(db.Model):
     tenant = db.relationship("Tenant", back_populates="api_collections")
     payment_link = db.relationship("PaymentLinks", backref="api_collections", lazy=True)
 
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "request_reference", name="uq_api_collections_tenant_ref"),
+    )
+
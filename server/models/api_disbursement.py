@@ -7,7 +7,7 @@ class ApiDisbursement(db.Model):
 
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     tenant_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('tenants.id'), nullable=False)
-    request_reference = db.Column(db.String(255), nullable=False, unique=True)
+    request_reference = db.Column(db.String(255), nullable=False)
     mpesa_transaction_id = db.Column(db.String(255), nullable=True)  # returned by Mpesa after payout
     mpesa_number = db.Column(db.String(20), nullable=True)  # phone number to send money to
     b2b_account = db.Column(db.JSON, nullable=True)  # Mpesa B2C account details
@@ -24,3 +24,7 @@ class ApiDisbursement(db.Model):
     )
 
     tenant = db.relationship("Tenant", back_populates="api_disbursements")
+
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "request_reference", name="uq_api_disbursements_tenant_ref"),
+    )
@@ -7,10 +7,15 @@ class Ledger(db.Model):
     __tablename__ = 'ledger'
 
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('tenants.id'), nullable=True)
+    sequence = db.Column(db.BigInteger, nullable=True)  # per-tenant, monotonically increasing
     gateway = db.Column(db.String(100))
     amount = db.Column(db.Numeric(12, 2))
     balance = db.Column(db.Numeric(12, 2))
     type = db.Column(db.String(50))  # e.g., "collection", "
     transaction_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('transaction.id'))
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    
\ No newline at end of file
+
+    __table_args__ = (
+        db.Index("idx_ledger_tenant_sequence", "tenant_id", "sequence", unique=True),
+    )
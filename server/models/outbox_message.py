@@ -0,0 +1,19 @@
+from models import db
+import uuid
+
+
+class OutboxMessage(db.Model):
+    """
+    Celery task recorded in the same commit as the status change that calls
+    for it, and published by workers.outbox once that commit has landed.
+    """
+    __tablename__ = 'outbox_messages'
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    task = db.Column(db.String(255), nullable=False)  # registered Celery task name
+    kwargs = db.Column(db.Text, nullable=False)  # kombu JSON, keeps UUIDs/datetimes/Decimals intact
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index("idx_outbox_messages_created", "created_at"),
+    )
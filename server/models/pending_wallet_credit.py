@@ -0,0 +1,23 @@
+from models import db
+import uuid
+
+
+class PendingWalletCredit(db.Model):
+    """
+    Staged credit waiting to be applied by the batched wallet posting task.
+    """
+    __tablename__ = 'pending_wallet_credits'
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('tenants.id'), nullable=False)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
+    transaction_ref = db.Column(db.String(255), nullable=False)
+    gateway = db.Column(db.String(100))
+    account_no = db.Column(db.String(50), nullable=True)
+    payment_link_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('payment_links.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.UniqueConstraint("tenant_id", "transaction_ref", name="uq_pending_wallet_credits_tenant_ref"),
+        db.Index("idx_pending_credit_tenant_created", "tenant_id", "created_at"),
+    )
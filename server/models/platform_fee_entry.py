@@ -0,0 +1,15 @@
+from models import db
+import uuid
+
+
+class PlatformFeeEntry(db.Model):
+    """
+    Append-only platform fee row; folded into Platform_wallet by compaction.
+    """
+    __tablename__ = 'platform_fee_entries'
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('tenants.id'), nullable=True)
+    transaction_ref = db.Column(db.String(255), nullable=True)
+    amount = db.Column(db.Numeric(12, 2), nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
@@ -0,0 +1,21 @@
+from models import db
+
+
+class TenantWalletStats(db.Model):
+    """
+    Running per-tenant transaction totals, kept up to date by WalletService
+    in the same commit as the transactions and checked by the nightly
+    reconciliation. Charges are debits with charges=True, counted apart
+    from other debits.
+    """
+    __tablename__ = 'tenant_wallet_stats'
+
+    tenant_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('tenants.id'), primary_key=True)
+    credit_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    debit_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    charge_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    credit_count = db.Column(db.BigInteger, nullable=False, default=0)
+    debit_count = db.Column(db.BigInteger, nullable=False, default=0)
+    charge_count = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    reconciled_at = db.Column(db.DateTime, nullable=True)
@@ -3,7 +3,8 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restful import Resource
 from sqlalchemy.exc import IntegrityError
 from models import db, Tenant, ApiKey
-import uuid
+from utils.api_key_cache import invalidate_tenant_keys
+from utils.api_key_hash import masked_key, set_api_key_secret
 from datetime import datetime
 from flask import current_app   # import cache instance
 
@@ -24,17 +25,18 @@ class ApiKeyResource(Resource):
             return {"error": "Tenant already has an API key"}, 400
 
         api_key = ApiKey(
-            key=str(uuid.uuid4()),
             tenant_id=tenant.id,
             created_at=datetime.utcnow()
         )
+        token = set_api_key_secret(api_key)
         db.session.add(api_key)
 
         try:
             db.session.commit()
-            # cache the new key
+            # cache the new key (masked, the plaintext is only returned here)
             cache.set(f"api_key:{tenant.id}", {
-                "key": api_key.key,
+                "key": masked_key(api_key),
+                "masked": True,
                 "created_at": api_key.created_at.isoformat(),
                 "revoked_at": None
             }, timeout=3600)
@@ -44,8 +46,10 @@ class ApiKeyResource(Resource):
 
         return {
             "tenant_id": str(tenant.id),
-            "api_key": api_key.key,
-            "created_at": api_key.created_at.isoformat()
+            "api_key": token,
+            "key": token,
+            "created_at": api_key.created_at.isoformat(),
+            "revoked_at": None
         }, 201
 
     @jwt_required()
@@ -63,7 +67,8 @@ class ApiKeyResource(Resource):
 
         api_key = tenant.api_key
         result = {
-            "key": api_key.key,
+            "key": masked_key(api_key),
+            "masked": True,
             "created_at": api_key.created_at.isoformat(),
             "revoked_at": api_key.revoked_at.isoformat() if api_key.revoked_at else None
         }
@@ -83,15 +88,17 @@ class ApiKeyDetailResource(Resource):
             return {"error": "No API key to regenerate"}, 404
 
         api_key = tenant.api_key
-        api_key.key = str(uuid.uuid4())
+        token = set_api_key_secret(api_key)
         api_key.created_at = datetime.utcnow()
         api_key.revoked_at = None
 
         try:
             db.session.commit()
+            invalidate_tenant_keys(tenant_id)
             # update cache
             cache.set(f"api_key:{tenant_id}", {
-                "key": api_key.key,
+                "key": masked_key(api_key),
+                "masked": True,
                 "created_at": api_key.created_at.isoformat(),
                 "revoked_at": None
             }, timeout=3600)
@@ -99,7 +106,12 @@ class ApiKeyDetailResource(Resource):
             db.session.rollback()
             return {"error": "Failed to regenerate key"}, 500
 
-        return {"new_key": api_key.key}, 200
+        return {
+            "new_key": token,
+            "key": token,
+            "created_at": api_key.created_at.isoformat(),
+            "revoked_at": None
+        }, 200
 
     @jwt_required()
     def delete(self, tenant_id):
@@ -114,6 +126,7 @@ class ApiKeyDetailResource(Resource):
             db.session.commit()
             # invalidate cache
             cache.delete(f"api_key:{tenant_id}")
+            invalidate_tenant_keys(tenant_id)
         except IntegrityError:
             db.session.rollback()
             return {"error": "Failed to revoke key"}, 500
@@ -140,17 +153,18 @@ class ApiKeyResourceTenant(Resource):
             return {"error": "Tenant already has an API key"}, 400
 
         api_key = ApiKey(
-            key=str(uuid.uuid4()),
             tenant_id=tenant.id,
             created_at=datetime.utcnow()
         )
+        token = set_api_key_secret(api_key)
         db.session.add(api_key)
 
         try:
             db.session.commit()
-            # cache the new key
+            # cache the new key (masked, the plaintext is only returned here)
             cache.set(f"api_key:{tenant.id}", {
-                "key": api_key.key,
+                "key": masked_key(api_key),
+                "masked": True,
                 "created_at": api_key.created_at.isoformat(),
                 "revoked_at": None
             }, timeout=3600)
@@ -160,8 +174,10 @@ class ApiKeyResourceTenant(Resource):
 
         return {
             "tenant_id": str(tenant.id),
-            "api_key": api_key.key,
-            "created_at": api_key.created_at.isoformat()
+            "api_key": token,
+            "key": token,
+            "created_at": api_key.created_at.isoformat(),
+            "revoked_at": None
         }, 201
 
     @jwt_required()
@@ -180,7 +196,8 @@ class ApiKeyResourceTenant(Resource):
 
         api_key = tenant.api_key
         result = {
-            "key": api_key.key,
+            "key": masked_key(api_key),
+            "masked": True,
             "created_at": api_key.created_at.isoformat(),
             "revoked_at": api_key.revoked_at.isoformat() if api_key.revoked_at else None
         }
@@ -205,15 +222,17 @@ class ApiKeyDetailResourceTenant(Resource):
             return {"error": "No API key to regenerate"}, 404
 
         api_key = tenant.api_key
-        api_key.key = str(uuid.uuid4())
+        token = set_api_key_secret(api_key)
         api_key.created_at = datetime.utcnow()
         api_key.revoked_at = None
 
         try:
             db.session.commit()
+            invalidate_tenant_keys(tenant_id)
             # update cache
             cache.set(f"api_key:{tenant_id}", {
-                "key": api_key.key,
+                "key": masked_key(api_key),
+                "masked": True,
                 "created_at": api_key.created_at.isoformat(),
                 "revoked_at": None
             }, timeout=3600)
@@ -221,7 +240,12 @@ class ApiKeyDetailResourceTenant(Resource):
             db.session.rollback()
             return {"error": "Failed to regenerate key"}, 500
 
-        return {"new_key": api_key.key}, 200
+        return {
+            "new_key": token,
+            "key": token,
+            "created_at": api_key.created_at.isoformat(),
+            "revoked_at": None
+        }, 200
 
     @jwt_required()
     def delete(self):
@@ -237,6 +261,7 @@ class ApiKeyDetailResourceTenant(Resource):
             db.session.commit()
             # invalidate cache
             cache.delete(f"api_key:{tenant_id}")
+            invalidate_tenant_keys(tenant_id)
         except IntegrityError:
             db.session.rollback()
             return {"error": "Failed to revoke key"}, 500
@@ -2,13 +2,16 @@ from flask_restful import Resource, request
 from flask_jwt_extended import jwt_required
 from models import Tenant, ApiDisbursement, db
 from decimal import Decimal, InvalidOperation
+from sqlalchemy.exc import IntegrityError
+from utils.db_errors import constraint_name
 from decorators.api_keys import api_key_required
+from decorators.rate_limit import rate_limit
 from workers.initiate_mpesa import initiate_disbursement
 from flask import current_app
 import logging
-from datetime import datetime, timedelta
 import uuid
-from typing import Optional
+from utils.tariffs import get_b2b_business_charge, get_b2c_business_charge
+from utils.status_cache import DISBURSEMENT, cache_status, get_cached_status
 
 logger = logging.getLogger(__name__)
 
@@ -48,9 +51,9 @@ class DisbursmentRequestResource(Resource):
         # -----------------------
 
         if b2b_account:
-            charge_val = get_b2b_business_charge(float(amount)) or 0
+            charge_val = get_b2b_business_charge(amount) or 0
         else:
-            charge_val = get_b2c_business_charge(float(amount)) or 0
+            charge_val = get_b2c_business_charge(amount) or 0
 
         total_deduction = amount + Decimal(charge_val)
 
@@ -62,14 +65,7 @@ class DisbursmentRequestResource(Resource):
             }, 402  # 402 Payment Required is semantically correct
 
         # -----------------------
-        # Check for duplicate request_ref first
-        # -----------------------
-        existing_request = ApiDisbursement.query.filter_by(request_reference=request_ref).first()
-        if existing_request:
-            return {"error": "Payment request with this reference already exists"}, 409
-
-        # -----------------------
-        # Create payment request
+        # Create payment request (request_ref is unique per tenant)
         # -----------------------
         disbursement = ApiDisbursement(
             tenant_id=tenant.id,
@@ -84,10 +80,17 @@ class DisbursmentRequestResource(Resource):
         try:
             db.session.add(disbursement)
             db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if constraint_name(e) != "uq_api_disbursements_tenant_ref":
+                return {"error": "Failed to create payment request: " + str(e)}, 500
+            return {"error": "Payment request with this reference already exists"}, 409
         except Exception as e:
             db.session.rollback()
             return {"error": "Failed to create payment request: " + str(e)}, 500
 
+        cache_status(DISBURSEMENT, disbursement)
+
         # -----------------------
         # Initiate payment asynchronously
         # -----------------------
@@ -102,171 +105,37 @@ class DisbursmentRequestResource(Resource):
             "total_required": str(total_deduction)
         }, 202
 
-def get_b2c_business_charge(amount: float) -> Optional[int]:
-    tariff_table = [
-        (1, 49, 0),
-        (50, 100, 0),
-        (101, 500, 5),
-        (501, 1000, 5),
-        (1001, 1500, 5),
-        (1501, 2500, 9),
-        (2501, 3500, 9),
-        (3501, 5000, 9),
-        (5001, 7500, 11),
-        (7501, 10000, 11),
-        (10001, 15000, 11),
-        (15001, 20000, 11),
-        (20001, 25000, 13),
-        (25001, 30000, 13),
-        (30001, 35000, 13),
-        (35001, 40000, 13),
-        (40001, 45000, 13),
-        (45001, 50000, 13),
-        (50001, 70000, 13),
-        (70001, 250000, 13),
-    ]
-
-    for min_amt, max_amt, business_charge in tariff_table:
-        if min_amt <= amount <= max_amt:
-            return business_charge
-
-    return None  # Out of range
-    
-
-def get_b2b_business_charge(amount: float) -> Optional[int]:
-    tariff_table = [
-        (1, 49, 2),
-        (50, 100, 3),
-        (101, 500, 8),
-        (501, 1000, 13),
-        (1001, 1500, 18),
-        (1501, 2500, 25),
-        (2501, 3500, 30),
-        (3501, 5000, 39),
-        (5001, 7500, 48),
-        (7501, 10000, 54),
-        (10001, 15000, 63),
-        (15001, 20000, 68),
-        (20001, 25000, 74),
-        (25001, 30000, 79),
-        (30001, 35000, 90),
-        (35001, 40000, 106),
-        (40001, 45000, 110),
-        (45001, 50000, 115),
-        (50001, 70000, 115),
-        (70001, 150000, 115),
-        (150001, 250000, 115),
-        (250001, 500000, 115),
-        (500001, 1000000, 115),
-        (1000001, 3000000, 115),
-        (3000001, 5000000, 115),
-        (5000001, 20000000, 115),
-        (20000001, 50000000, 115),
-    ]
-
-    for min_amt, max_amt, business_charge in tariff_table:
-        if min_amt <= amount <= max_amt:
-            return business_charge
-
-    return None  # Out of range
-
-
-# Simple in-memory rate-limit dict (demo only)
-_last_poll_times = {}
-
-
 class DisbursmentStatus(Resource):
 
     @api_key_required
-    def get(self, collection_identifier):
+    @rate_limit("RATE_LIMIT_DISBURSEMENT_STATUS", key_arg="collection_identifier",
+                message="Polling too frequently. Use callback URL instead.")
+    def get(self, collection_identifier, **kwargs):
         """
         Returns the status of a payment request.
         `collection_identifier` can be either the UUID (`id`) or `request_ref`.
         """
 
-        # -------------------
-        # Rate-limiting (basic example)
-        # -------------------
-        client_ip = request.remote_addr
-        now = datetime.utcnow()
-        last_poll = _last_poll_times.get((client_ip, collection_identifier))
-
-        if last_poll and now - last_poll < timedelta(seconds=10):
-            return {"error": "Polling too frequently. Use callback URL instead."}, 429
-
-        _last_poll_times[(client_ip, collection_identifier)] = now
+        cached = get_cached_status(DISBURSEMENT, collection_identifier, kwargs.get("tenant_id"))
+        if cached:
+            return cached, 200
 
         # -------------------
         # Determine if identifier is UUID
         # -------------------
+        tenant_id = kwargs.get("tenant_id")
         disbursement = None
         try:
             uid = uuid.UUID(collection_identifier)
-            disbursement = ApiDisbursement.query.filter_by(id=uid).first()
+            disbursement = ApiDisbursement.query.filter_by(id=uid, tenant_id=tenant_id).first()
         except ValueError:
             # Not a UUID, treat as request_reference
-            disbursement = ApiDisbursement.query.filter_by(request_reference=collection_identifier).first()
+            disbursement = ApiDisbursement.query.filter_by(tenant_id=tenant_id, request_reference=collection_identifier).first()
 
         if not disbursement:
             return {"error": "Payment request not found"}, 404
 
         # -------------------
-        # Return limited info
+        # Return limited info (and cache it for the next poll)
         # -------------------
-        return {
-            "request_id": str(disbursement.id),
-            "status": disbursement.status,
-            "amount": str(disbursement.amount),
-            "request_ref": disbursement.request_reference,
-            "currency": disbursement.currency,
-            "created_at": disbursement.created_at.isoformat(),
-            "updated_at": disbursement.updated_at.isoformat()
-        }, 200
-    
-class DisbursmentStatus(Resource):
-
-    @api_key_required
-    def get(self, collection_identifier):
-        """
-        Returns the status of a payment request.
-        `collection_identifier` can be either the UUID (`id`) or `request_ref`.
-        """
-
-        # -------------------
-        # Rate-limiting (basic example)
-        # -------------------
-        client_ip = request.remote_addr
-        now = datetime.utcnow()
-        last_poll = _last_poll_times.get((client_ip, collection_identifier))
-
-        if last_poll and now - last_poll < timedelta(seconds=10):
-            return {"error": "Polling too frequently. Use callback URL instead."}, 429
-
-        _last_poll_times[(client_ip, collection_identifier)] = now
-
-        # -------------------
-        # Determine if identifier is UUID
-        # -------------------
-        disbursement = None
-        try:
-            uid = uuid.UUID(collection_identifier)
-            disbursement = ApiDisbursement.query.filter_by(id=uid).first()
-        except ValueError:
-            # Not a UUID, treat as request_reference
-            disbursement = ApiDisbursement.query.filter_by(request_reference=collection_identifier).first()
-
-        if not disbursement:
-            return {"error": "Payment request not found"}, 404
-
-        # -------------------
-        # Return limited info
-        # -------------------
-        return {
-            "request_id": str(disbursement.id),
-            "status": disbursement.status,
-            "amount": str(disbursement.amount),
-            "request_ref": disbursement.request_reference,
-            "currency": disbursement.currency,
-            "created_at": disbursement.created_at.isoformat(),
-            "updated_at": disbursement.updated_at.isoformat()
-        }, 200
\ No newline at end of file
+        return cache_status(DISBURSEMENT, disbursement), 200
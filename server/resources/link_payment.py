@@ -2,6 +2,7 @@ from flask_restful import Resource, request
 from models import Tenant, ApiCollection, db, PaymentLinks
 from decimal import Decimal, InvalidOperation
 from workers.initiate_mpesa import initiate_payment
+from workers.stk_dispatcher import queue_stk_push
 from flask import current_app
 import logging
 from datetime import datetime
@@ -75,7 +76,7 @@ class LinkPayment(Resource):
         # Initiate payment asynchronously
         # -----------------------
         try:
-            initiate_payment.delay(api_collection.id)
+            queue_stk_push(api_collection.id)
             logger.info(f"Queued payment initiation for request {api_collection.id}")
         except Exception as e:
             logger.error(f"Failed to queue payment initiation: {e}")
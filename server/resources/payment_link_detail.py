@@ -2,6 +2,7 @@ from flask_restful import Resource, request
 from flask import current_app
 from flask_jwt_extended import jwt_required
 from models import db, PaymentLinks, Transaction
+from utils.pagination import paginate, parse_limit
 
 
 class PaymentLinkDetailResource(Resource):
@@ -38,8 +39,11 @@ class PaymentLinkDetailResource(Resource):
         # ---------------------------
         # 2. Pagination setup
         # ---------------------------
-        limit = int(request.args.get("limit", 10))   # default 10
-        cursor = request.args.get("cursor")          # cursor = transaction.created_at (ISO string)
+        try:
+            limit = parse_limit(request.args.get("limit"), default=10)
+        except ValueError:
+            return {"error": "Invalid limit, must be an integer"}, 400
+        cursor = request.args.get("cursor")          # opaque keyset cursor (utils.pagination)
 
         cache_key_txn = f"payment_link:{link_token}:txns:{cursor or 'first'}:{limit}"
         transactions_data = None
@@ -48,18 +52,11 @@ class PaymentLinkDetailResource(Resource):
             transactions_data = cache.get(cache_key_txn)
 
         if not transactions_data:
-            query = Transaction.query.filter_by(payment_link_id=payment_link.id).order_by(Transaction.created_at.desc())
-
-            if cursor:
-                query = query.filter(Transaction.created_at < cursor)
-
-            transactions = query.limit(limit + 1).all()
-
-            has_more = len(transactions) > limit
-            next_cursor = None
-            if has_more:
-                next_cursor = transactions[-1].created_at.isoformat()
-                transactions = transactions[:limit]
+            query = Transaction.query.filter_by(payment_link_id=payment_link.id)
+            try:
+                transactions, next_cursor, has_more = paginate(query, Transaction, cursor, limit)
+            except ValueError:
+                return {"error": "Invalid cursor"}, 400
 
             transactions_data = {
                 "transactions": [t.to_dict() for t in transactions],
@@ -1,11 +1,15 @@
 from flask_restful import Resource, request
 from decorators.api_keys import api_key_required
+from decorators.rate_limit import rate_limit
 from models import Tenant, ApiCollection, db
 from decimal import Decimal, InvalidOperation
+from sqlalchemy.exc import IntegrityError
+from utils.db_errors import constraint_name
 from workers.initiate_mpesa import initiate_payment
+from workers.stk_dispatcher import queue_stk_push
+from utils.status_cache import COLLECTION, cache_status, get_cached_status
 from flask import current_app
 import logging
-from datetime import datetime, timedelta
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -42,14 +46,7 @@ class PaymentRequestResource(Resource):
             return {"error": "Tenant not found"}, 404
 
         # -----------------------
-        # Check for duplicate request_ref first
-        # -----------------------
-        existing_request = ApiCollection.query.filter_by(request_reference=request_ref).first()
-        if existing_request:
-            return {"error": "Payment request with this reference already exists"}, 409
-
-        # -----------------------
-        # Create payment request
+        # Create payment request (request_ref is unique per tenant)
         # -----------------------
         api_collection = ApiCollection(
             tenant_id=tenant.id,
@@ -63,15 +60,22 @@ class PaymentRequestResource(Resource):
         try:
             db.session.add(api_collection)
             db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            if constraint_name(e) != "uq_api_collections_tenant_ref":
+                return {"error": "Failed to create payment request: " + str(e)}, 500
+            return {"error": "Payment request with this reference already exists"}, 409
         except Exception as e:
             db.session.rollback()
             return {"error": "Failed to create payment request: " + str(e)}, 500
 
+        cache_status(COLLECTION, api_collection)
+
         # -----------------------
         # Initiate payment asynchronously
         # -----------------------
         
-        initiate_payment.delay(api_collection.id)
+        queue_stk_push(api_collection.id)
 
         return {
             "message": "Payment request created",
@@ -89,54 +93,37 @@ class PaymentRequestResource(Resource):
             
             
 
-# Simple in-memory rate-limit dict (demo only)
-_last_poll_times = {}
-
-
 class PaymentStatusResource(Resource):
 
     @api_key_required
+    @rate_limit("RATE_LIMIT_PAYMENT_STATUS", key_arg="collection_identifier",
+                message="Polling too frequently. Use callback URL instead.")
     def get(self, collection_identifier, **kwargs):
         """
         Returns the status of a payment request.
         `collection_identifier` can be either the UUID (`id`) or `request_ref`.
         """
 
-        # -------------------
-        # Rate-limiting (basic example)
-        # -------------------
-        client_ip = request.remote_addr
-        now = datetime.utcnow()
-        last_poll = _last_poll_times.get((client_ip, collection_identifier))
-
-        if last_poll and now - last_poll < timedelta(seconds=10):
-            return {"error": "Polling too frequently. Use callback URL instead."}, 429
-
-        _last_poll_times[(client_ip, collection_identifier)] = now
+        cached = get_cached_status(COLLECTION, collection_identifier, kwargs.get("tenant_id"))
+        if cached:
+            return cached, 200
 
         # -------------------
         # Determine if identifier is UUID
         # -------------------
+        tenant_id = kwargs.get("tenant_id")
         api_collection = None
         try:
             uid = uuid.UUID(collection_identifier)
-            api_collection = ApiCollection.query.filter_by(id=uid).first()
+            api_collection = ApiCollection.query.filter_by(id=uid, tenant_id=tenant_id).first()
         except ValueError:
             # Not a UUID, treat as request_reference
-            api_collection = ApiCollection.query.filter_by(request_reference=collection_identifier).first()
+            api_collection = ApiCollection.query.filter_by(tenant_id=tenant_id, request_reference=collection_identifier).first()
 
         if not api_collection:
             return {"error": "Payment request not found"}, 404
 
         # -------------------
-        # Return limited info
+        # Return limited info (and cache it for the next poll)
         # -------------------
-        return {
-            "request_id": str(api_collection.id),
-            "status": api_collection.status,
-            "amount": str(api_collection.amount),
-            "request_ref": api_collection.request_reference,
-            "currency": api_collection.currency,
-            "created_at": api_collection.created_at.isoformat(),
-            "updated_at": api_collection.updated_at.isoformat()
-        }, 200
\ No newline at end of file
+        return cache_status(COLLECTION, api_collection), 200
\ No newline at end of file
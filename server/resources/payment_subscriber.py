@@ -1,14 +1,37 @@
-from flask import Response
+from flask import Response, current_app, request
 from flask_restful import Resource
-import json
-from utils.subscribe_manager import get_pubsub
+import time
+from utils.subscribe_manager import format_sse, is_terminal_event, stream_key
+
 
 class PaymentSubscribe(Resource):
+    """
+    Fallback SSE endpoint served by the Flask app. It holds a worker for the
+    whole connection, so checkout pages should use the async gateway
+    (sse_gateway.py) instead.
+    """
     def get(self, request_id):
+        last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+        app = current_app._get_current_object()
+        heartbeat = app.config.get("SSE_HEARTBEAT_SECONDS", 15)
+        max_seconds = app.config.get("SSE_MAX_SECONDS", 300)
+
         def stream():
-            q = get_pubsub(request_id)
-            while True:
-                msg = q.get()  # waits until backend pushes an update
-                yield f"data: {json.dumps(msg)}\n\n"
+            r = app.redis
+            key = stream_key(request_id)
+            # one cursor for both the recorded history and live events
+            cursor = last_event_id or "0-0"
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                result = r.xread({key: cursor}, count=100, block=int(heartbeat * 1000))
+                if not result:
+                    yield ": ping\n\n"
+                    continue
+
+                for event_id, fields in result[0][1]:
+                    cursor = event_id
+                    yield format_sse(event_id, fields["data"])
+                    if is_terminal_event(fields["data"]):
+                        return
 
-        return Response(stream(), mimetype="text/event-stream")
+        return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -1,11 +1,29 @@
 from flask import request, current_app
 from flask_restful import Resource
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Tenant, TenantConfig, Transaction
-from sqlalchemy import desc, func
-from sqlalchemy.orm import selectinload
+from models import db, Tenant, TenantConfig, Transaction, TenantWalletStats
+from sqlalchemy.orm import load_only, selectinload
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from utils.pagination import paginate, parse_limit
+
+# query args that filter the transaction list, in cache key order
+TRANSACTION_FILTERS = ("type", "status", "from", "to")
+
+# what serialize_transaction reads; all covered by idx_transaction_tenant_created_id
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.transaction_ref,
+    Transaction.amount,
+    Transaction.account_no,
+    Transaction.gateway,
+    Transaction.type,
+    Transaction.status,
+    Transaction.recieving_mpesa_number,
+    Transaction.recieving_b2b_account,
+    Transaction.created_at,
+    Transaction.updated_at,
+)
 
 
 def serialize_transaction(tx):
@@ -24,21 +42,67 @@ def serialize_transaction(tx):
     }
 
 
+def wallet_totals(tenant_id):
+    """
+    Credit/debit totals from the tenant's TenantWalletStats row; debits
+    include transaction charges, which are also given on their own.
+    """
+    stats = db.session.get(TenantWalletStats, tenant_id)
+    if not stats:
+        return {"credit": "0.00", "debit": "0.00", "charges": "0.00"}
+    return {
+        "credit": f"{stats.credit_total:.2f}",
+        "debit": f"{stats.debit_total + stats.charge_total:.2f}",
+        "charges": f"{stats.charge_total:.2f}",
+    }
+
+
+def transaction_filters(args):
+    """
+    Criteria for ?type=, ?status= and a ?from=/?to= created_at range (ISO
+    dates or datetimes; a date-only `to` includes that day), plus a stable
+    key for caching them. Raises ValueError for a bad date.
+    """
+    criteria = []
+    if args.get("type"):
+        criteria.append(Transaction.type == args["type"])
+    if args.get("status"):
+        criteria.append(Transaction.status == args["status"])
+    if args.get("from"):
+        criteria.append(Transaction.created_at >= datetime.fromisoformat(args["from"]))
+    if args.get("to"):
+        end = datetime.fromisoformat(args["to"])
+        if len(args["to"]) == 10:
+            end += timedelta(days=1)
+        criteria.append(Transaction.created_at < end)
+
+    key = "&".join(f"{name}={args[name]}" for name in TRANSACTION_FILTERS if args.get(name))
+    return criteria, key
+
+
 class TenantWalletResource(Resource):
     @jwt_required()
     def get(self, tenant_id):
         """
         Optimized tenant wallet endpoint:
-        - Uses cache for aggregates + transactions
+        - Running totals from TenantWalletStats, cached transaction pages
         - Efficient queries with limits + filters
         - Single tenant + config fetch with eager load
         """
-        limit = min(int(request.args.get("limit", 20)), 100)
+        try:
+            limit = parse_limit(request.args.get("limit"))
+        except ValueError:
+            return {"error": "Invalid limit, must be an integer"}, 400
         cursor = request.args.get("cursor")
         cache = current_app.cache
 
+        try:
+            filters, filter_key = transaction_filters(request.args)
+        except ValueError:
+            return {"error": "Invalid date filter, must be ISO date or datetime"}, 400
+
         # 🔹 Check cache first
-        cache_key = f"wallet:{tenant_id}:{cursor or 'first'}:{limit}"
+        cache_key = f"wallet:{tenant_id}:{cursor or 'first'}:{limit}:{filter_key}"
         cached = cache.get(cache_key)
         if cached:
             return json.loads(cached), 200
@@ -55,43 +119,19 @@ class TenantWalletResource(Resource):
 
         config = tenant.configs[0] if hasattr(tenant, "configs") and tenant.configs else None
 
-        # 🔹 Transactions (paginated)
+        # 🔹 Transactions (keyset paginated, served by idx_transaction_tenant_created_id)
         tx_query = (
             Transaction.query
-            .filter(Transaction.tenant_id == tenant.id)
-            .order_by(desc(Transaction.created_at))
-        )
-
-        if cursor:
-            try:
-                cursor_dt = datetime.fromisoformat(cursor)
-                tx_query = tx_query.filter(Transaction.created_at < cursor_dt)
-            except ValueError:
-                return {"error": "Invalid cursor format, must be ISO datetime"}, 400
-
-        transactions = tx_query.limit(limit + 1).all()
-        has_more = len(transactions) > limit
-        transactions = transactions[:limit]
-
-        next_cursor = (
-            transactions[-1].created_at.isoformat() if has_more and transactions else None
+            .options(load_only(*TRANSACTION_COLUMNS))
+            .filter(Transaction.tenant_id == tenant.id, *filters)
         )
+        try:
+            transactions, next_cursor, has_more = paginate(tx_query, Transaction, cursor, limit)
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
 
-        # 🔹 Aggregates (cache separately for 1 min)
-        agg_cache_key = f"wallet:agg:{tenant_id}"
-        totals = cache.get(agg_cache_key)
-        if not totals:
-            aggregates = (
-                db.session.query(
-                    Transaction.type,
-                    func.coalesce(func.sum(Transaction.amount), 0).label("total")
-                )
-                .filter(Transaction.tenant_id == tenant.id)
-                .group_by(Transaction.type)
-                .all()
-            )
-            totals = {t: f"{total:.2f}" for t, total in aggregates}
-            cache.set(agg_cache_key, totals, timeout=60)
+        # 🔹 Aggregates (running totals, one row per tenant)
+        totals = wallet_totals(tenant.id)
 
         response = {
             "wallet": {
@@ -100,10 +140,7 @@ class TenantWalletResource(Resource):
                 "balance": f"{tenant.wallet_balance:.2f}",
                 "account_no": config.account_no if config else None,
                 "link_id": config.link_id if config else None,
-                "totals": {
-                    "credit": totals.get("credit", "0.00"),
-                    "debit": totals.get("debit", "0.00"),
-                }
+                "totals": totals
             },
             "transactions": [serialize_transaction(tx) for tx in transactions],
             "pagination": {
@@ -125,17 +162,25 @@ class TenantDashboardWalletResource(Resource):
     def get(self):
         """
         Optimized tenant wallet endpoint:
-        - Uses cache for aggregates + transactions
+        - Running totals from TenantWalletStats, cached transaction pages
         - Efficient queries with limits + filters
         - Single tenant + config fetch with eager load
         """
-        limit = min(int(request.args.get("limit", 20)), 100)
+        try:
+            limit = parse_limit(request.args.get("limit"))
+        except ValueError:
+            return {"error": "Invalid limit, must be an integer"}, 400
         cursor = request.args.get("cursor")
         tenant_id = get_jwt_identity()
         cache = current_app.cache
 
+        try:
+            filters, filter_key = transaction_filters(request.args)
+        except ValueError:
+            return {"error": "Invalid date filter, must be ISO date or datetime"}, 400
+
         # 🔹 Check cache first
-        cache_key = f"wallet:{tenant_id}:{cursor or 'first'}:{limit}"
+        cache_key = f"wallet:{tenant_id}:{cursor or 'first'}:{limit}:{filter_key}"
         cached = cache.get(cache_key)
         if cached:
             return json.loads(cached), 200
@@ -152,43 +197,19 @@ class TenantDashboardWalletResource(Resource):
 
         config = tenant.configs[0] if hasattr(tenant, "configs") and tenant.configs else None
 
-        # 🔹 Transactions (paginated)
+        # 🔹 Transactions (keyset paginated, served by idx_transaction_tenant_created_id)
         tx_query = (
             Transaction.query
-            .filter(Transaction.tenant_id == tenant.id)
-            .order_by(desc(Transaction.created_at))
-        )
-
-        if cursor:
-            try:
-                cursor_dt = datetime.fromisoformat(cursor)
-                tx_query = tx_query.filter(Transaction.created_at < cursor_dt)
-            except ValueError:
-                return {"error": "Invalid cursor format, must be ISO datetime"}, 400
-
-        transactions = tx_query.limit(limit + 1).all()
-        has_more = len(transactions) > limit
-        transactions = transactions[:limit]
-
-        next_cursor = (
-            transactions[-1].created_at.isoformat() if has_more and transactions else None
+            .options(load_only(*TRANSACTION_COLUMNS))
+            .filter(Transaction.tenant_id == tenant.id, *filters)
         )
+        try:
+            transactions, next_cursor, has_more = paginate(tx_query, Transaction, cursor, limit)
+        except ValueError:
+            return {"error": "Invalid cursor"}, 400
 
-        # 🔹 Aggregates (cache separately for 1 min)
-        agg_cache_key = f"wallet:agg:{tenant_id}"
-        totals = cache.get(agg_cache_key)
-        if not totals:
-            aggregates = (
-                db.session.query(
-                    Transaction.type,
-                    func.coalesce(func.sum(Transaction.amount), 0).label("total")
-                )
-                .filter(Transaction.tenant_id == tenant.id)
-                .group_by(Transaction.type)
-                .all()
-            )
-            totals = {t: f"{total:.2f}" for t, total in aggregates}
-            cache.set(agg_cache_key, totals, timeout=60)
+        # 🔹 Aggregates (running totals, one row per tenant)
+        totals = wallet_totals(tenant.id)
 
         response = {
             "wallet": {
@@ -198,10 +219,7 @@ class TenantDashboardWalletResource(Resource):
                 "account_no": config.account_no if config else None,
                 "link_id": config.link_id if config else None,
                 "payment_method": config.payment_method if config else None,
-                "totals": {
-                    "credit": totals.get("credit", "0.00"),
-                    "debit": totals.get("debit", "0.00"),
-                }
+                "totals": totals
             },
             "transactions": [serialize_transaction(tx) for tx in transactions],
             "pagination": {
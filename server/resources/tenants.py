@@ -2,8 +2,10 @@ from flask import request, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restful import Resource
 from models import db, Tenant, TenantConfig
+from workers.webhook_engine import invalidate_webhook_secret
 import uuid
 import random
+import secrets
 import json
 import re
 
@@ -29,6 +31,7 @@ def serialize_tenant(tenant, config):
             "callback_url": config.api_callback_url,
             "payment_method": config.payment_method if config.payment_method else None,
             "auto_payout": config.auto_payout if hasattr(config, "auto_payout") else False,
+            "webhook_batching": bool(config.webhook_batching),
         }
     }
 
@@ -302,6 +305,14 @@ class TenantConfigManage(Resource):
         if "auto_payout" in data:
             tenant_config.auto_payout = bool(data["auto_payout"])
 
+        if "webhook_batching" in data:
+            tenant_config.webhook_batching = bool(data["webhook_batching"])
+
+        webhook_secret = None
+        if data.get("rotate_webhook_secret"):
+            webhook_secret = secrets.token_hex(32)
+            tenant_config.webhook_secret = webhook_secret
+
         db.session.commit()
 
         tenant_data = serialize_tenant(tenant, tenant_config)
@@ -310,6 +321,12 @@ class TenantConfigManage(Resource):
         cache = current_app.cache
         cache.set(f"tenant:{tenant.id}", json.dumps(tenant_data), timeout=3600)
 
+        if webhook_secret:
+            # kept out of tenant:<id>, which is returned to the dashboard
+            invalidate_webhook_secret(tenant.id)
+            # only shown once
+            tenant_data = dict(tenant_data, webhook_secret=webhook_secret)
+
         return tenant_data, 200
 
     @jwt_required()
@@ -0,0 +1,184 @@
+"""
+Async SSE gateway for payment status subscriptions.
+
+    python -m sse_gateway
+
+Serves GET /subscribe/<request_id> on one event loop. Status events live in
+a capped Redis stream per request (see utils.subscribe_manager); one reader
+task per process follows every stream that has a subscriber with a single
+blocking XREAD, so thousands of open checkout pages cost one process and
+one Redis connection instead of one gunicorn worker each.
+
+Each client keeps one cursor: it starts at Last-Event-ID (header or
+?last_event_id=) or the beginning of the stream, history is read from it
+and live events are only delivered past it. A comment heartbeat keeps
+proxies from closing idle connections, and the response ends once a
+terminal status has been sent.
+"""
+import asyncio
+import logging
+import ssl
+from collections import defaultdict
+
+import redis.asyncio as aioredis
+from aiohttp import web
+
+from config import Config
+from utils.subscribe_manager import (
+    format_sse,
+    is_newer,
+    is_terminal_event,
+    replay_start,
+    stream_key,
+)
+
+logger = logging.getLogger(__name__)
+
+SSE_QUEUE_SIZE = 100
+XREAD_BLOCK_MS = 500
+
+
+class SubscriptionHub:
+    """
+    Follows every watched stream with one XREAD and fans entries out to
+    per-client queues.
+    """
+    def __init__(self, r):
+        self.r = r
+        self.queues = defaultdict(set)
+        self.cursors = {}
+
+    def subscribe(self, request_id):
+        key = stream_key(request_id)
+        queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        if key not in self.cursors:
+            # replay from the start for the first subscriber; clients drop
+            # anything at or before their own cursor
+            self.cursors[key] = "0-0"
+        self.queues[key].add(queue)
+        return queue
+
+    def unsubscribe(self, request_id, queue):
+        key = stream_key(request_id)
+        queues = self.queues.get(key)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.queues[key]
+            self.cursors.pop(key, None)
+
+    async def history(self, request_id, last_event_id=None):
+        entries = await self.r.xrange(stream_key(request_id), min=replay_start(last_event_id))
+        return [(event_id, fields["data"]) for event_id, fields in entries]
+
+    async def run(self):
+        while True:
+            if not self.cursors:
+                await asyncio.sleep(XREAD_BLOCK_MS / 1000)
+                continue
+            try:
+                result = await self.r.xread(dict(self.cursors), count=100, block=XREAD_BLOCK_MS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Stream read failed, retrying: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for key, entries in result or ():
+                if key not in self.cursors:
+                    continue
+                for event_id, fields in entries:
+                    self.cursors[key] = event_id
+                    for queue in list(self.queues.get(key, ())):
+                        try:
+                            queue.put_nowait((event_id, fields["data"]))
+                        except asyncio.QueueFull:
+                            logger.warning(f"Dropping event for slow subscriber on {key}")
+
+
+async def subscribe(request):
+    request_id = request.match_info["request_id"]
+    last_id = request.headers.get("Last-Event-ID") or request.query.get("last_event_id")
+    hub = request.app["hub"]
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Access-Control-Allow-Origin": "*",
+    })
+    await response.prepare(request)
+
+    # register before reading history so nothing falls in between
+    queue = hub.subscribe(request_id)
+    try:
+        for event_id, data in await hub.history(request_id, last_id):
+            await response.write(format_sse(event_id, data).encode())
+            last_id = event_id
+            if is_terminal_event(data):
+                return response
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.SSE_MAX_SECONDS
+        while loop.time() < deadline:
+            try:
+                event_id, data = await asyncio.wait_for(queue.get(), Config.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await response.write(b": ping\n\n")
+                continue
+
+            if not is_newer(event_id, last_id):
+                continue
+            await response.write(format_sse(event_id, data).encode())
+            last_id = event_id
+            if is_terminal_event(data):
+                break
+
+    except ConnectionResetError:
+        pass
+    finally:
+        hub.unsubscribe(request_id, queue)
+    return response
+
+
+async def health(request):
+    return web.json_response({"status": "healthy", "streams": len(request.app["hub"].cursors)})
+
+
+def _redis():
+    url = Config.CACHE_REDIS_URL
+    kwargs = {"decode_responses": True}
+    if url.startswith("rediss://"):
+        kwargs["ssl_cert_reqs"] = ssl.CERT_NONE
+    return aioredis.Redis.from_url(url, **kwargs)
+
+
+async def _start_hub(app):
+    app["redis"] = _redis()
+    app["hub"] = SubscriptionHub(app["redis"])
+    app["hub_task"] = asyncio.create_task(app["hub"].run())
+
+
+async def _stop_hub(app):
+    app["hub_task"].cancel()
+    try:
+        await app["hub_task"]
+    except asyncio.CancelledError:
+        pass
+    await app["redis"].aclose()
+
+
+def create_gateway():
+    app = web.Application()
+    app.router.add_get("/subscribe/{request_id}", subscribe)
+    app.router.add_get("/health", health)
+    app.on_startup.append(_start_hub)
+    app.on_cleanup.append(_stop_hub)
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_gateway(), port=Config.SSE_PORT)
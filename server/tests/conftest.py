@@ -0,0 +1,66 @@
+"""
+Test fixtures.
+
+Tests run against sqlite by default. Set TEST_DATABASE_URL to a scratch
+PostgreSQL database to also run the tests that need PostgreSQL-only SQL
+(ON CONFLICT, gen_random_uuid, JSON operators); they are skipped otherwise.
+Redis is replaced by fakeredis and the Celery broker by sent_tasks.
+"""
+import os
+import uuid
+
+import fakeredis
+import pytest
+from flask import Flask
+
+from celery_app import celery
+from config import Config
+from models import Tenant, db
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+# published tasks never reach a broker (sent_tasks), so there are no results
+celery.conf.result_backend = "disabled://"
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=TEST_DATABASE_URL or "sqlite://",
+        CALLBACK_INGEST_ENABLED=False,
+    )
+    db.init_app(app)
+    app.redis = fakeredis.FakeRedis(decode_responses=True)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(autouse=True)
+def sent_tasks(monkeypatch):
+    """
+    (task name, kwargs) of every task published, instead of a broker.
+    """
+    sent = []
+    monkeypatch.setattr(celery, "send_task", lambda name, args=None, kwargs=None, **options: sent.append((name, kwargs)))
+    return sent
+
+
+@pytest.fixture
+def postgres(app):
+    if db.engine.dialect.name != "postgresql":
+        pytest.skip("needs TEST_DATABASE_URL pointing at PostgreSQL")
+
+
+@pytest.fixture
+def tenant(app):
+    tenant = Tenant(id=uuid.uuid4(), name="Acme", email=f"{uuid.uuid4().hex}@example.com", wallet_balance=0)
+    db.session.add(tenant)
+    db.session.commit()
+    return tenant
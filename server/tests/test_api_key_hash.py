@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from models import ApiKey, db
+from utils.api_key_hash import (
+    PREFIX_LENGTH, find_active_api_key, hash_api_key, masked_key, set_api_key_secret, verify_api_key,
+)
+
+
+def issue_key(tenant, token=None):
+    api_key = ApiKey(tenant_id=tenant.id, created_at=datetime.utcnow())
+    token = set_api_key_secret(api_key, token)
+    db.session.add(api_key)
+    db.session.commit()
+    return api_key, token
+
+
+def test_only_prefix_and_hash_are_stored(app, tenant):
+    api_key, token = issue_key(tenant)
+
+    assert api_key.prefix == token[:PREFIX_LENGTH]
+    assert api_key.key_hash == hash_api_key(token, api_key.salt)
+    assert token not in (api_key.key_hash, api_key.salt)
+    assert masked_key(api_key) == f"{api_key.prefix}********"
+
+
+def test_same_token_hashes_differently_per_salt(app, tenant):
+    first, token = issue_key(tenant)
+    second = ApiKey()
+    set_api_key_secret(second, token)
+
+    assert first.key_hash != second.key_hash
+    assert verify_api_key(second, token)
+
+
+def test_verify_api_key(app, tenant):
+    api_key, token = issue_key(tenant)
+
+    assert verify_api_key(api_key, token)
+    assert not verify_api_key(api_key, token[:-1] + ("0" if token[-1] != "0" else "1"))
+
+
+def test_find_active_api_key(app, tenant):
+    api_key, token = issue_key(tenant)
+    # same prefix, different key
+    issue_key(tenant, token[:PREFIX_LENGTH] + "-0000-0000-0000-000000000000")
+
+    assert find_active_api_key(token).id == api_key.id
+    assert find_active_api_key(token[:PREFIX_LENGTH] + "-ffff-ffff-ffff-ffffffffffff") is None
+    assert find_active_api_key(token[:PREFIX_LENGTH - 1]) is None
+
+
+def test_revoked_key_is_not_found(app, tenant):
+    api_key, token = issue_key(tenant)
+    api_key.revoked_at = datetime.utcnow()
+    db.session.commit()
+
+    assert find_active_api_key(token) is None
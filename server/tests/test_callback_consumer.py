@@ -0,0 +1,93 @@
+import uuid
+
+import pytest
+
+from celery_app import celery
+from models import ApiCollection, OutboxMessage, db
+from utils.callback_ingest import CALLBACK_GROUP, CALLBACK_STREAM_KEY, STK_CALLBACK, ingest_callback
+from workers.callback_consumer import CallbackConsumer
+
+
+@pytest.fixture
+def consumer(app):
+    consumer = CallbackConsumer(app)
+    consumer._create_group(app.redis)
+    return consumer
+
+
+def add_collection(tenant, status="initiated"):
+    collection = ApiCollection(
+        tenant_id=tenant.id, request_reference=uuid.uuid4().hex, amount=100, currency="KES", status=status
+    )
+    db.session.add(collection)
+    db.session.commit()
+    return collection
+
+
+def ingest(tenant, collection, result_code=0, checkout_id="ck1"):
+    body = {"ResultCode": result_code, "CheckoutRequestID": checkout_id, "ResultDesc": "done"}
+    if result_code == 0:
+        body["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": 100},
+            {"Name": "MpesaReceiptNumber", "Value": f"R-{checkout_id}"},
+        ]}
+    ingest_callback(STK_CALLBACK, tenant.id, collection.id, body)
+
+
+def pending(app):
+    return app.redis.xpending(CALLBACK_STREAM_KEY, CALLBACK_GROUP)["pending"]
+
+
+def test_batch_is_applied_and_acked(app, consumer, tenant, sent_tasks):
+    paid, cancelled = add_collection(tenant), add_collection(tenant)
+    ingest(tenant, paid)
+    ingest(tenant, cancelled, result_code=1032, checkout_id="ck2")
+
+    consumer._process(app.redis, consumer._read(app.redis))
+
+    db.session.expire_all()
+    assert (paid.status, cancelled.status) == ("completed", "failed")
+    assert pending(app) == 0
+    assert app.redis.xlen(CALLBACK_STREAM_KEY) == 0
+    assert sorted(name for name, _ in sent_tasks) == ["workers.send_webhook", "workers.send_webhook", "workers.wallet_logger"]
+
+
+def test_malformed_and_unknown_entries_are_dropped(app, consumer, tenant):
+    app.redis.xadd(CALLBACK_STREAM_KEY, {"kind": STK_CALLBACK, "body": "{}"})
+    ingest(tenant, ApiCollection(id=uuid.uuid4()))
+
+    consumer._process(app.redis, consumer._read(app.redis))
+
+    assert pending(app) == 0
+
+
+def test_entries_stay_pending_when_the_commit_fails(app, consumer, tenant, monkeypatch):
+    collection = add_collection(tenant)
+    ingest(tenant, collection)
+
+    def failing_commit():
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(db.session, "commit", failing_commit)
+    consumer._process(app.redis, consumer._read(app.redis))
+    monkeypatch.undo()
+
+    db.session.expire_all()
+    assert collection.status == "initiated"
+    assert OutboxMessage.query.count() == 0
+    assert pending(app) == 1
+
+
+def test_entries_are_acked_when_only_the_broker_is_down(app, consumer, tenant, monkeypatch):
+    collection = add_collection(tenant)
+    ingest(tenant, collection)
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(celery, "send_task", broker_down)
+    consumer._process(app.redis, consumer._read(app.redis))
+
+    # the follow-ups were committed to the outbox with the status change
+    assert pending(app) == 0
+    assert {m.task for m in OutboxMessage.query.all()} == {"workers.wallet_logger", "workers.send_webhook"}
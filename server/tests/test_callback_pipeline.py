@@ -0,0 +1,155 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from celery_app import celery
+from models import ApiCollection, ApiDisbursement, OutboxMessage, PaymentLinks, db
+from utils.callback_ingest import B2C_CALLBACK, STK_CALLBACK
+from workers.callback_pipeline import APPLIED, DUPLICATE, NOT_FOUND, parse_callback, process_callbacks
+from workers.outbox import publish_outbox
+
+
+def add(record):
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def collection(tenant, status="initiated", **values):
+    return add(ApiCollection(
+        tenant_id=tenant.id, request_reference=uuid.uuid4().hex, amount=100, currency="KES", status=status, **values
+    ))
+
+
+def disbursement(tenant, status="initiated", **values):
+    return add(ApiDisbursement(
+        tenant_id=tenant.id, request_reference=uuid.uuid4().hex, amount=50, status=status, **values
+    ))
+
+
+def stk(tenant, record_id, checkout_id="ck1", success=True):
+    body = {"ResultCode": 0 if success else 1032, "ResultDesc": "done", "CheckoutRequestID": checkout_id}
+    if success:
+        body["CallbackMetadata"] = {"Item": [
+            {"Name": "Amount", "Value": 100},
+            {"Name": "MpesaReceiptNumber", "Value": f"R-{checkout_id}"},
+            {"Name": "PhoneNumber", "Value": 254700000000},
+        ]}
+    return parse_callback(STK_CALLBACK, tenant.id, record_id, body)
+
+
+def b2c(tenant, record_id, success=True):
+    body = {"ResultCode": 0 if success else 2001, "ResultDesc": "done", "ConversationID": "cv1", "TransactionID": "T1"}
+    return parse_callback(B2C_CALLBACK, tenant.id, record_id, body)
+
+
+def tasks(sent_tasks):
+    return sorted(name for name, _ in sent_tasks)
+
+
+def test_parse_stk_callback(tenant):
+    record_id = uuid.uuid4()
+    event = stk(tenant, record_id)
+
+    assert event.record_id == str(record_id)
+    assert (event.success, event.dedupe_key, event.transaction_ref) == (True, "ck1", "R-ck1")
+    assert (event.amount, event.phone_number) == (Decimal("100"), 254700000000)
+
+
+@pytest.mark.parametrize("body", [
+    {},
+    {"ResultCode": 0},  # successful STK callback without metadata
+    None,
+])
+def test_parse_rejects_malformed_callbacks(tenant, body):
+    with pytest.raises(ValueError):
+        parse_callback(STK_CALLBACK, tenant.id, uuid.uuid4(), body)
+
+
+def test_outcomes(app, tenant):
+    paid, cancelled, settled = collection(tenant), collection(tenant), collection(tenant, status="completed")
+    sent = disbursement(tenant)
+
+    outcomes = process_callbacks([
+        stk(tenant, paid.id),
+        stk(tenant, cancelled.id, "ck2", success=False),
+        stk(tenant, settled.id, "ck3"),
+        b2c(tenant, sent.id),
+        b2c(tenant, uuid.uuid4()),
+    ])
+
+    assert outcomes == [APPLIED, APPLIED, DUPLICATE, APPLIED, NOT_FOUND]
+    db.session.expire_all()
+    assert [paid.status, cancelled.status, settled.status, sent.status] == ["completed", "failed", "completed", "completed"]
+    assert (paid.mpesa_checkout_request_id, cancelled.mpesa_checkout_request_id) == ("ck1", "ck2")
+
+
+def test_repeated_event_in_a_batch_applies_once(app, tenant, sent_tasks):
+    paid = collection(tenant)
+
+    outcomes = process_callbacks([stk(tenant, paid.id, "ck1"), stk(tenant, paid.id, "ck2")])
+
+    assert outcomes == [APPLIED, DUPLICATE]
+    db.session.refresh(paid)
+    assert paid.mpesa_checkout_request_id == "ck1"
+    assert tasks(sent_tasks) == ["workers.send_webhook", "workers.wallet_logger"]
+
+
+def test_followups(app, tenant, sent_tasks):
+    link = add(PaymentLinks(tenant_id=tenant.id, link_token="abc123", amount=100))
+    checkout = collection(tenant, payment_link_id=link.id)
+    payout = disbursement(tenant, payout=True)
+    refund = disbursement(tenant)
+
+    process_callbacks([
+        b2c(tenant, payout.id),
+        b2c(tenant, refund.id, success=False),
+        stk(tenant, checkout.id, "ck9", success=False),
+    ])
+
+    # payouts only post to the wallet, failed refunds only notify the tenant,
+    # and checkout pages hear about failed payments instead of a webhook
+    assert tasks(sent_tasks) == ["workers.send_webhook", "workers.wallet_logger"]
+    debit = dict(sent_tasks)["workers.wallet_logger"]
+    assert (debit["txn_type"], debit["amount"], debit["transaction_ref"]) == ("debit", 50.0, "T1")
+    webhook = dict(sent_tasks)["workers.send_webhook"]
+    assert (webhook["request_id"], webhook["status"]) == (refund.id, "failed")
+
+
+def test_followups_survive_a_broker_outage(app, tenant, sent_tasks, monkeypatch):
+    paid = collection(tenant)
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(celery, "send_task", broker_down)
+    assert process_callbacks([stk(tenant, paid.id)]) == [APPLIED]
+
+    db.session.refresh(paid)
+    assert paid.status == "completed"
+    assert OutboxMessage.query.count() == 2
+
+    monkeypatch.setattr(celery, "send_task", lambda name, args=None, kwargs=None, **options: sent_tasks.append((name, kwargs)))
+    assert publish_outbox() == 2
+    assert OutboxMessage.query.count() == 0
+    assert tasks(sent_tasks) == ["workers.send_webhook", "workers.wallet_logger"]
+    credit = dict(sent_tasks)["workers.wallet_logger"]
+    assert (credit["amount"], credit["transaction_ref"], credit["account_no"]) == (100.0, "R-ck1", 254700000000)
+
+
+def test_nothing_is_applied_when_the_commit_fails(app, tenant, monkeypatch):
+    paid = collection(tenant)
+
+    def failing_commit():
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(db.session, "commit", failing_commit)
+    with pytest.raises(RuntimeError):
+        process_callbacks([stk(tenant, paid.id)])
+    monkeypatch.undo()
+
+    db.session.rollback()
+    db.session.refresh(paid)
+    assert paid.status == "initiated"
+    assert OutboxMessage.query.count() == 0
@@ -0,0 +1,40 @@
+import pytest
+import sqlalchemy.pool
+
+from utils.db_pool import POOL_DEFAULTS, engine_options
+
+
+def test_queue_pool_defaults_per_process_type():
+    for process_type, (size, overflow) in POOL_DEFAULTS.items():
+        options = engine_options({"PROCESS_TYPE": process_type})
+        assert options["poolclass"] is sqlalchemy.pool.QueuePool
+        assert (options["pool_size"], options["max_overflow"]) == (size, overflow)
+        assert options["pool_pre_ping"] is True
+        assert "pool_use_lifo" not in options
+
+
+def test_unknown_process_type_uses_web_defaults():
+    options = engine_options({"PROCESS_TYPE": "beat"})
+    assert (options["pool_size"], options["max_overflow"]) == POOL_DEFAULTS["web"]
+
+
+def test_configured_sizes_override_defaults():
+    options = engine_options({"PROCESS_TYPE": "worker", "DB_POOL_SIZE": 20, "DB_MAX_OVERFLOW": 0})
+    assert (options["pool_size"], options["max_overflow"]) == (20, 0)
+
+
+def test_pgbouncer_mode_keeps_a_short_lived_lifo_pool():
+    options = engine_options({"DB_POOL_MODE": "pgbouncer", "DB_POOL_RECYCLE": 1800})
+    assert options["pool_use_lifo"] is True
+    assert options["pool_recycle"] == 300
+
+    assert engine_options({"DB_POOL_MODE": "pgbouncer", "DB_POOL_RECYCLE": 60})["pool_recycle"] == 60
+
+
+def test_null_mode():
+    assert engine_options({"DB_POOL_MODE": "null"}) == {"poolclass": sqlalchemy.pool.NullPool}
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match="DB_POOL_MODE"):
+        engine_options({"DB_POOL_MODE": "bogus"})
@@ -0,0 +1,120 @@
+import uuid
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from models import ApiDisbursement, db
+from utils.mpesa_rate_limit import RateLimitTimeout
+from workers import initiate_mpesa
+from workers.initiate_mpesa import initiate_disbursement
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.text = str(data)
+
+    def json(self):
+        return self.data
+
+
+class FakeClient:
+    def __init__(self, response=None, error=None):
+        self.response = response or FakeResponse({"ResponseCode": "0", "ConversationID": "cv1"})
+        self.error = error
+        self.calls = []
+
+    def post(self, path, **kwargs):
+        # the claim is committed and no transaction is open while Daraja is called
+        self.calls.append((path, db.session().in_transaction(), current_status(kwargs["json"])))
+        if self.error:
+            raise self.error
+        return self.response
+
+
+def current_status(payload):
+    record_id = payload.get("OriginatorConversationID")
+    if record_id is None:
+        return None
+    status = db.session.get(ApiDisbursement, uuid.UUID(record_id)).status
+    db.session.rollback()
+    return status
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(initiate_mpesa, "get_mpesa_client", lambda: client)
+    monkeypatch.setattr(initiate_mpesa, "get_mpesa_auth_token", lambda: "token")
+    return client
+
+
+@pytest.fixture
+def disbursement(app, tenant):
+    disbursement = ApiDisbursement(
+        tenant_id=tenant.id, request_reference="d1", amount=50, status="pending", mpesa_number="0712345678"
+    )
+    db.session.add(disbursement)
+    db.session.commit()
+    return disbursement
+
+
+def status_of(disbursement):
+    db.session.expire_all()
+    return disbursement.status
+
+
+def test_claimed_before_sending(client, disbursement):
+    initiate_disbursement(disbursement.id)
+
+    assert client.calls == [(initiate_mpesa.B2C_PATH, False, "processing")]
+    assert status_of(disbursement) == "initiated"
+
+
+def test_sent_once_when_queued_twice(client, disbursement):
+    initiate_disbursement(disbursement.id)
+    initiate_disbursement(disbursement.id)
+
+    assert len(client.calls) == 1
+
+
+def test_rejected_request_fails_the_disbursement(client, disbursement):
+    client.response = FakeResponse({"errorMessage": "Invalid Access Token"}, status_code=400)
+
+    initiate_disbursement(disbursement.id)
+
+    assert status_of(disbursement) == "failed"
+    assert disbursement.remarks == "Invalid Access Token"
+
+
+def test_claim_is_released_when_nothing_was_sent(client, disbursement):
+    client.error = RateLimitTimeout("b2c bucket full")
+    with pytest.raises(RateLimitTimeout):
+        initiate_disbursement(disbursement.id)
+    assert status_of(disbursement) == "pending"
+
+    refused = NewConnectionError(None, "connection refused")
+    client.error = requests.exceptions.ConnectionError(MaxRetryError(None, "/", reason=refused))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        initiate_disbursement(disbursement.id)
+    assert status_of(disbursement) == "pending"
+
+
+def test_claim_is_released_without_a_token(client, disbursement, monkeypatch):
+    monkeypatch.setattr(initiate_mpesa, "get_mpesa_auth_token", lambda: None)
+
+    initiate_disbursement(disbursement.id)
+
+    assert client.calls == []
+    assert status_of(disbursement) == "pending"
+
+
+def test_possibly_sent_request_is_not_retried(client, disbursement):
+    client.error = requests.exceptions.ReadTimeout("read timed out")
+
+    initiate_disbursement(disbursement.id)
+
+    # left for the result callback to settle
+    assert status_of(disbursement) == "processing"
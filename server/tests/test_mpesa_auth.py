@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from models import ApiCollection, db
+from utils import mpesa_auth
+from utils.mpesa_auth import FETCH_COUNTER_KEY, LOCK_KEY, TOKEN_KEY, get_mpesa_auth_token, refresh_if_expiring
+from utils.mpesa_client import AUTH_PATH, STK_PUSH_PATH, MpesaClient, set_mpesa_client
+from workers.initiate_mpesa import initiate_payment
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return f"token-{len(calls)}", 3600
+
+    monkeypatch.setattr(mpesa_auth, "fetch_mpesa_auth_token", fetch)
+    return calls
+
+
+def store_token(app, token, expires_in):
+    app.redis.set(TOKEN_KEY, json.dumps({"token": token, "expires_at": time.time() + expires_in}))
+
+
+def test_token_is_fetched_once_and_shared(app, fetches):
+    assert get_mpesa_auth_token() == "token-1"
+    assert get_mpesa_auth_token() == "token-1"
+
+    assert len(fetches) == 1
+    assert app.redis.get(FETCH_COUNTER_KEY) == "1"
+    assert 3500 < app.redis.ttl(TOKEN_KEY) <= 3570
+    assert not app.redis.exists(LOCK_KEY)
+
+
+def test_expiring_token_is_refreshed(app, fetches):
+    store_token(app, "old", expires_in=60)
+
+    assert get_mpesa_auth_token() == "token-1"
+
+
+def test_expiring_token_is_kept_while_another_worker_refreshes(app, fetches):
+    store_token(app, "old", expires_in=60)
+    app.redis.set(LOCK_KEY, "someone-else", ex=10)
+
+    assert get_mpesa_auth_token() == "old"
+    assert fetches == []
+
+
+def test_failed_fetch_is_not_cached(app, monkeypatch):
+    monkeypatch.setattr(mpesa_auth, "fetch_mpesa_auth_token", lambda: (None, None))
+
+    assert get_mpesa_auth_token() is None
+    assert not app.redis.exists(TOKEN_KEY)
+    assert not app.redis.exists(LOCK_KEY)
+
+
+def test_refresh_if_expiring(app, fetches):
+    store_token(app, "fresh", expires_in=3000)
+    assert refresh_if_expiring() is False
+
+    app.config["MPESA_TOKEN_REFRESH_MARGIN"] = 3300
+    assert refresh_if_expiring() is True
+    assert get_mpesa_auth_token() == "token-1"
+
+
+class FakeDaraja(BaseHTTPRequestHandler):
+    """
+    OAuth and STK push endpoints; counts the calls per path.
+    """
+    calls = Counter()
+
+    def do_GET(self):
+        self.calls[self.path] += 1
+        self.reply({"access_token": f"token-{self.calls[self.path]}", "expires_in": "3599"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.calls[self.path] += 1
+        self.reply({"ResponseCode": "0", "CheckoutRequestID": f"ck{self.calls[self.path]}"})
+
+    def reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def daraja(app):
+    FakeDaraja.calls = Counter()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeDaraja)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = MpesaClient(base_url=f"http://127.0.0.1:{server.server_port}")
+    set_mpesa_client(client)
+    app.config["MPESA_RATE_LIMIT_ENABLED"] = False
+    yield FakeDaraja.calls
+    set_mpesa_client(None)
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_one_token_fetch_per_thousand_payments(app, tenant, daraja):
+    collections = [
+        ApiCollection(tenant_id=tenant.id, request_reference=f"r{i}", amount=10, currency="KES",
+                      mpesa_number="0712345678", status="pending")
+        for i in range(1000)
+    ]
+    db.session.add_all(collections)
+    db.session.commit()
+
+    for collection in collections:
+        initiate_payment(collection.id)
+
+    assert daraja[STK_PUSH_PATH] == 1000
+    assert daraja[AUTH_PATH] == 1
+    assert app.redis.get(FETCH_COUNTER_KEY) == "1"
+    assert ApiCollection.query.filter_by(status="initiated").count() == 1000
@@ -0,0 +1,60 @@
+import logging
+
+import pytest
+import requests
+
+from utils.mpesa_client import MpesaClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = MpesaClient(base_url="http://daraja.test", stats_log_interval=60)
+    responses = []
+
+    def request(method, url, **kwargs):
+        if isinstance(responses[0], Exception):
+            raise responses.pop(0)
+        return responses.pop(0)
+
+    monkeypatch.setattr(client.session, "request", request)
+    client.responses = responses
+    return client
+
+
+def test_request_counters(client):
+    client.responses.extend(["ok", requests.exceptions.ConnectTimeout("timed out")])
+
+    assert client.get("/ping") == "ok"
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        client.get("/ping")
+
+    stats = client.stats()
+    assert (stats["requests"], stats["errors"], stats["in_flight"], stats["max_in_flight"]) == (2, 1, 0, 1)
+
+
+def test_stats_are_logged_once_per_interval(client, monkeypatch, caplog):
+    now = [1000.0]
+    monkeypatch.setattr("utils.mpesa_client.time.monotonic", lambda: now[0])
+    client._stats_logged_at = now[0]
+    client.responses.extend(["ok"] * 3)
+
+    with caplog.at_level(logging.INFO, logger="utils.mpesa_client"):
+        client.get("/ping")
+        now[0] += 61
+        client.get("/ping")
+        client.get("/ping")
+
+    logged = [record.getMessage() for record in caplog.records]
+    assert len(logged) == 1
+    assert logged[0].startswith("M-Pesa client stats") and "'requests': 2" in logged[0]
+
+
+def test_stats_logging_can_be_disabled(client, caplog):
+    client.stats_log_interval = 0
+    client._stats_logged_at = -1e9
+    client.responses.append("ok")
+
+    with caplog.at_level(logging.INFO, logger="utils.mpesa_client"):
+        client.get("/ping")
+
+    assert caplog.records == []
@@ -0,0 +1,26 @@
+import pytest
+
+from utils.mpesa_rate_limit import PRIORITY_HIGH, RateLimitTimeout, acquire, rate_limit_stats
+
+
+def test_queueing_delay_is_reported_per_bucket(app):
+    app.config.update(MPESA_RATE_OAUTH=20, MPESA_BURST_OAUTH=1)
+
+    assert acquire("oauth", PRIORITY_HIGH) < 0.01
+    assert acquire("oauth", PRIORITY_HIGH) >= 0.04
+
+    stats = rate_limit_stats()
+    assert stats["oauth"]["calls"] == 2
+    assert stats["oauth"]["total_delay_ms"] >= 40
+    assert stats["oauth"]["avg_delay_ms"] == stats["oauth"]["total_delay_ms"] / 2
+    assert stats["stk"] == {"calls": 0, "total_delay_ms": 0, "avg_delay_ms": 0.0}
+
+
+def test_call_that_times_out_is_not_counted(app):
+    app.config.update(MPESA_RATE_B2C=0.1, MPESA_BURST_B2C=1)
+    acquire("b2c")
+
+    with pytest.raises(RateLimitTimeout):
+        acquire("b2c", timeout=0.05)
+
+    assert rate_limit_stats()["b2c"]["calls"] == 1
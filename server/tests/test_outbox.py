@@ -0,0 +1,64 @@
+import pytest
+
+from celery_app import celery
+from models import OutboxMessage, db
+from workers.outbox import add_task, publish_outbox
+from workers.send_webhook import send_webhook
+from workers.wallet_logger import logg_wallet
+
+
+@pytest.fixture
+def producers(monkeypatch):
+    used = []
+    monkeypatch.setattr(
+        celery, "send_task", lambda name, args=None, kwargs=None, **options: used.append(options.get("producer"))
+    )
+    return used
+
+
+def record(count):
+    ids = [
+        add_task(send_webhook.s(
+            tenant_id="t", request_id=str(i), status="success", amount=1.0, request_ref=f"r{i}", currency="KES"
+        ))
+        for i in range(count)
+    ]
+    db.session.commit()
+    return ids
+
+
+def test_add_task_waits_for_the_commit(app):
+    message_id = add_task(logg_wallet.s(tenant_id="t", amount=1.0, transaction_ref="R1"))
+
+    assert [message.id for message in db.session.new] == [message_id]
+    db.session.commit()
+    assert db.session.get(OutboxMessage, message_id).task == "workers.wallet_logger"
+
+
+def test_messages_are_published_over_one_producer(app, producers):
+    ids = record(3)
+
+    assert publish_outbox(ids) == 3
+
+    assert len(producers) == 3
+    assert producers[0] is not None and len(set(map(id, producers))) == 1
+    assert OutboxMessage.query.count() == 0
+
+
+def test_only_the_given_messages_are_published(app, sent_tasks):
+    first, second = record(2)
+
+    assert publish_outbox([first]) == 1
+    assert publish_outbox([]) == 0
+    assert [m.id for m in OutboxMessage.query.all()] == [second]
+
+
+def test_broker_error_keeps_every_message(app, monkeypatch):
+    record(3)
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(celery, "send_task", broker_down)
+    assert publish_outbox() == 0
+    assert OutboxMessage.query.count() == 3
@@ -0,0 +1,76 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import Transaction, db
+from utils.pagination import decode_cursor, encode_cursor, paginate, parse_limit
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 10, 18, 9, 30, 15, 123456)
+    record_id = uuid.uuid4()
+
+    cursor = encode_cursor(created_at, record_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, record_id)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(datetime.utcnow(), "x"), "WzFd"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("value, limit", [
+    (None, 20),
+    ("", 20),
+    ("5", 5),
+    ("0", 1),
+    ("-3", 1),
+    ("100", 100),
+    ("5000", 100),
+])
+def test_parse_limit(value, limit):
+    assert parse_limit(value) == limit
+
+
+def test_parse_limit_rejects_non_integers():
+    for value in ("abc", "1.5"):
+        with pytest.raises(ValueError):
+            parse_limit(value)
+
+
+def test_paginate_walks_every_row_once(app, tenant):
+    # groups of rows sharing a timestamp, so pages split inside a group
+    start = datetime(2026, 10, 18, 9, 0)
+    for i in range(11):
+        db.session.add(Transaction(
+            tenant_id=tenant.id, transaction_ref=f"R{i}", amount=1, created_at=start + timedelta(seconds=i // 3)
+        ))
+    db.session.commit()
+    query = Transaction.query.filter_by(tenant_id=tenant.id)
+
+    seen = []
+    cursor = None
+    while True:
+        rows, cursor, has_more = paginate(query, Transaction, cursor, limit=4)
+        seen.extend(rows)
+        assert has_more == (cursor is not None)
+        if not has_more:
+            break
+
+    assert len(seen) == len({row.id for row in seen}) == 11
+    assert [(row.created_at, row.id) for row in seen] == sorted(
+        ((row.created_at, row.id) for row in seen), reverse=True
+    )
+
+
+def test_paginate_last_page(app, tenant):
+    db.session.add(Transaction(tenant_id=tenant.id, transaction_ref="R1", amount=1, created_at=datetime.utcnow()))
+    db.session.commit()
+
+    rows, cursor, has_more = paginate(Transaction.query, Transaction, limit=1)
+
+    assert (len(rows), cursor, has_more) == (1, None, False)
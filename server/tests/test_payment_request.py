@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+from flask_restful import Api
+from sqlalchemy.exc import IntegrityError
+
+from models import ApiKey, db
+from resources.payment_request import PaymentRequestResource
+from utils.api_key_hash import set_api_key_secret
+from workers.stk_dispatcher import STK_QUEUE_KEY
+
+
+@pytest.fixture
+def client(app, tenant):
+    app.config["STK_DISPATCHER_ENABLED"] = True
+    api = Api(app)
+    api.add_resource(PaymentRequestResource, "/payments")
+
+    api_key = ApiKey(tenant_id=tenant.id, created_at=datetime.utcnow())
+    token = set_api_key_secret(api_key)
+    db.session.add(api_key)
+    db.session.commit()
+
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    return client
+
+
+def payment(request_ref="r1"):
+    return {"amount": "100", "request_ref": request_ref, "mpesa_number": "0712345678"}
+
+
+def test_duplicate_reference(postgres, app, client):
+    assert client.post("/payments", json=payment()).status_code == 202
+
+    response = client.post("/payments", json=payment())
+
+    assert response.status_code == 409
+    assert response.get_json() == {"error": "Payment request with this reference already exists"}
+    assert app.redis.llen(STK_QUEUE_KEY) == 1
+
+
+def test_other_integrity_errors_are_not_duplicates(app, client, monkeypatch):
+    def failing_commit():
+        raise IntegrityError("INSERT INTO api_collections", {}, Exception("null value in column"))
+
+    monkeypatch.setattr(db.session, "commit", failing_commit)
+    response = client.post("/payments", json=payment())
+
+    assert response.status_code == 500
+    assert response.get_json()["error"].startswith("Failed to create payment request: ")
+    assert not app.redis.exists(STK_QUEUE_KEY)
@@ -0,0 +1,151 @@
+import uuid
+
+import pytest
+from flask_restful import Api
+from redis.exceptions import ConnectionError
+
+from models import ApiCollection, ApiDisbursement, db
+from resources.mpesa_callback import MpesaCallbackResource
+from utils.callback_ingest import STK_CALLBACK
+from utils.payment_state import (
+    COMPLETED, FAILED, INITIATED, PENDING, PROCESSING, claim_callback, confirm_callback, release_callback, transition,
+)
+
+
+def add_disbursement(tenant, status=PENDING):
+    disbursement = ApiDisbursement(tenant_id=tenant.id, request_reference=uuid.uuid4().hex, amount=50, status=status)
+    db.session.add(disbursement)
+    db.session.commit()
+    return disbursement
+
+
+@pytest.mark.parametrize("from_status, to_status, allowed", [
+    (PENDING, INITIATED, True),
+    (PENDING, COMPLETED, True),
+    (PENDING, FAILED, True),
+    (INITIATED, COMPLETED, True),
+    (INITIATED, FAILED, True),
+    (INITIATED, INITIATED, False),
+    (COMPLETED, FAILED, False),
+    (COMPLETED, COMPLETED, False),
+    (FAILED, COMPLETED, False),
+    (FAILED, INITIATED, False),
+    (PENDING, PROCESSING, True),
+    (PROCESSING, PROCESSING, False),
+    (PROCESSING, PENDING, True),
+    (PROCESSING, INITIATED, True),
+    (PROCESSING, COMPLETED, True),
+    (INITIATED, PENDING, False),
+    (COMPLETED, PENDING, False),
+])
+def test_transition(app, tenant, from_status, to_status, allowed):
+    disbursement = add_disbursement(tenant, from_status)
+
+    assert transition(ApiDisbursement, disbursement.id, to_status, remarks="x") is allowed
+    db.session.commit()
+
+    db.session.refresh(disbursement)
+    assert disbursement.status == (to_status if allowed else from_status)
+    assert disbursement.remarks == ("x" if allowed else None)
+
+
+def test_only_the_first_of_racing_transitions_wins(app, tenant):
+    disbursement = add_disbursement(tenant, INITIATED)
+
+    assert transition(ApiDisbursement, disbursement.id, COMPLETED)
+    assert not transition(ApiDisbursement, disbursement.id, FAILED)
+    assert not transition(ApiDisbursement, disbursement.id, COMPLETED)
+
+
+def test_missing_record(app):
+    assert not transition(ApiDisbursement, uuid.uuid4(), COMPLETED)
+
+
+def test_claim_confirm_release(app):
+    app.config.update(CALLBACK_CLAIM_TTL=120, CALLBACK_DEDUPE_TTL=86400)
+    key = "callback:seen:stk:ck1"
+
+    assert claim_callback(STK_CALLBACK, "ck1")
+    assert not claim_callback(STK_CALLBACK, "ck1")
+    assert 0 < app.redis.ttl(key) <= 120
+
+    confirm_callback(STK_CALLBACK, "ck1")
+    assert 120 < app.redis.ttl(key) <= 86400
+    assert not claim_callback(STK_CALLBACK, "ck1")
+
+    release_callback(STK_CALLBACK, "ck1")
+    assert claim_callback(STK_CALLBACK, "ck1")
+
+
+def test_claims_are_per_kind(app):
+    assert claim_callback(STK_CALLBACK, "same")
+    assert claim_callback("b2c", "same")
+
+
+def test_claim_fails_open(app, monkeypatch):
+    assert claim_callback(STK_CALLBACK, None)
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(app.redis, "set", unavailable)
+    assert claim_callback(STK_CALLBACK, "ck1")
+    assert claim_callback(STK_CALLBACK, "ck1")
+
+
+@pytest.fixture
+def client(app):
+    api = Api(app)
+    api.add_resource(MpesaCallbackResource, "/callback/<tenant_id>/<api_collection_id>")
+    return app.test_client()
+
+
+def stk_callback(checkout_id="ck1"):
+    return {"Body": {"stkCallback": {
+        "ResultCode": 0,
+        "ResultDesc": "The service request is processed successfully.",
+        "CheckoutRequestID": checkout_id,
+        "CallbackMetadata": {"Item": [
+            {"Name": "Amount", "Value": 100},
+            {"Name": "MpesaReceiptNumber", "Value": "RCT1"},
+            {"Name": "PhoneNumber", "Value": 254700000000},
+        ]},
+    }}}
+
+
+def test_repeated_callback_is_processed_once(app, client, tenant, sent_tasks):
+    collection = ApiCollection(
+        tenant_id=tenant.id, request_reference="r1", amount=100, currency="KES", status=INITIATED
+    )
+    db.session.add(collection)
+    db.session.commit()
+    url = f"/callback/{tenant.id}/{collection.id}"
+
+    assert client.post(url, json=stk_callback()).status_code == 200
+    sent = len(sent_tasks)
+    assert client.post(url, json=stk_callback()).status_code == 200
+    # a retry with a new checkout id gets past the claim but not the state machine
+    assert client.post(url, json=stk_callback("ck2")).status_code == 200
+
+    db.session.refresh(collection)
+    assert (collection.status, collection.mpesa_checkout_request_id) == (COMPLETED, "ck1")
+    assert sent == len(sent_tasks) == 2
+    assert app.redis.ttl("callback:seen:stk:ck1") > app.config["CALLBACK_CLAIM_TTL"]
+
+
+def test_callback_for_unknown_record_releases_its_claim(app, client, tenant):
+    response = client.post(f"/callback/{tenant.id}/{uuid.uuid4()}", json=stk_callback())
+
+    assert response.status_code == 404
+    assert not app.redis.exists("callback:seen:stk:ck1")
+
+
+def test_failed_callback_releases_its_claim(app, client, tenant, monkeypatch):
+    def failing_commit():
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(db.session, "commit", failing_commit)
+    response = client.post(f"/callback/{tenant.id}/{uuid.uuid4()}", json=stk_callback())
+
+    assert response.status_code == 500
+    assert not app.redis.exists("callback:seen:stk:ck1")
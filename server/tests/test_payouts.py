@@ -0,0 +1,87 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from models import ApiDisbursement, Tenant, TenantConfig, db
+from workers.initiate_mpesa import create_payout_disbursements
+
+pytestmark = pytest.mark.usefixtures("postgres")
+
+RUN_DATE = date(2026, 10, 18)
+
+
+def add_tenant(name, balance, payment_method, auto_payout=True):
+    tenant = Tenant(name=name, email=f"{name}@example.com", wallet_balance=balance)
+    db.session.add(tenant)
+    db.session.flush()
+    db.session.add(TenantConfig(
+        tenant_id=tenant.id, account_no=1, link_id=name,
+        payment_method=payment_method, auto_payout=auto_payout,
+    ))
+    db.session.commit()
+    return tenant
+
+
+def test_creates_one_payout_per_eligible_tenant(app):
+    mpesa = add_tenant("mpesa", 1000, {"mpesa_number": "254700000000"})
+    add_tenant("manual", 1000, {"mpesa_number": "254700000001"}, auto_payout=False)
+    add_tenant("low", 5, {"mpesa_number": "254700000002"})
+    add_tenant("no-method", 1000, {"mpesa_number": ""})
+
+    ids = create_payout_disbursements(run_date=RUN_DATE)
+
+    payout = db.session.get(ApiDisbursement, ids[0])
+    assert len(ids) == 1
+    assert payout.tenant_id == mpesa.id
+    assert payout.request_reference == f"PAYOUT-{mpesa.id}-20261018"
+    assert payout.amount == Decimal("995.00")  # less the 5 shilling B2C charge
+    assert (payout.payout, payout.status, payout.mpesa_number) == (True, "pending", "254700000000")
+
+
+def test_b2b_payout_uses_the_b2b_tariff(app):
+    add_tenant("b2b", 1000, {"b2b_account": {"paybill": "123456", "account": "ACME"}})
+
+    payout = db.session.get(ApiDisbursement, create_payout_disbursements(run_date=RUN_DATE)[0])
+
+    assert payout.amount == Decimal("987.00")
+    assert payout.b2b_account == {"paybill": "123456", "account": "ACME"}
+
+
+def test_rerun_returns_the_same_pending_payouts(app):
+    add_tenant("a", 1000, {"mpesa_number": "254700000000"})
+    add_tenant("b", 2000, {"mpesa_number": "254700000001"})
+
+    first = create_payout_disbursements(run_date=RUN_DATE)
+    again = create_payout_disbursements(run_date=RUN_DATE)
+
+    assert len(first) == 2
+    assert sorted(again) == sorted(first)
+    assert ApiDisbursement.query.count() == 2
+
+
+def test_rerun_skips_payouts_already_sent(app):
+    add_tenant("a", 1000, {"mpesa_number": "254700000000"})
+    add_tenant("b", 2000, {"mpesa_number": "254700000001"})
+    sent, pending = create_payout_disbursements(run_date=RUN_DATE)
+    db.session.get(ApiDisbursement, sent).status = "initiated"
+    db.session.commit()
+
+    assert create_payout_disbursements(run_date=RUN_DATE) == [pending]
+
+
+def test_rerun_can_be_limited_to_tenants(app):
+    a = add_tenant("a", 1000, {"mpesa_number": "254700000000"})
+    add_tenant("b", 2000, {"mpesa_number": "254700000001"})
+    create_payout_disbursements(run_date=RUN_DATE)
+
+    ids = create_payout_disbursements(tenant_ids=[a.id], run_date=RUN_DATE)
+
+    assert [db.session.get(ApiDisbursement, i).tenant_id for i in ids] == [a.id]
+
+
+def test_next_day_creates_new_payouts(app):
+    add_tenant("a", 1000, {"mpesa_number": "254700000000"})
+    first = create_payout_disbursements(run_date=RUN_DATE)
+
+    assert create_payout_disbursements(run_date=date(2026, 10, 19)) != first
@@ -0,0 +1,80 @@
+import pytest
+from flask_restful import Api, Resource
+from redis.exceptions import ConnectionError
+
+from decorators.rate_limit import check_rate_limit, parse_limit, rate_limit
+
+
+def test_parse_limit():
+    assert parse_limit("5/60") == (5, 60.0)
+    assert parse_limit("10/0.5") == (10, 0.5)
+
+
+def test_burst_then_one_request_per_interval(app):
+    # 3 per minute: a burst of 3, then one every 20 seconds
+    assert [check_rate_limit("k", 3, 60) for _ in range(3)] == [0, 0, 0]
+
+    wait = check_rate_limit("k", 3, 60)
+    assert 19 < wait <= 20
+
+
+def test_key_expires_once_it_no_longer_limits(app):
+    check_rate_limit("k", 3, 60)
+    assert 0 < app.redis.pttl("k") <= 20000
+
+
+def test_rejected_requests_are_not_counted(app):
+    for _ in range(3):
+        check_rate_limit("k", 3, 60)
+    stored = app.redis.get("k")
+
+    check_rate_limit("k", 3, 60)
+    assert app.redis.get("k") == stored
+
+
+def test_keys_are_independent(app):
+    check_rate_limit("a", 1, 60)
+    assert check_rate_limit("a", 1, 60) > 0
+    assert check_rate_limit("b", 1, 60) == 0
+
+
+def test_fails_open_without_redis(app, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(app.redis, "eval", unavailable)
+    assert check_rate_limit("k", 1, 60) == 0
+
+    del app.redis
+    assert check_rate_limit("k", 1, 60) == 0
+
+
+@pytest.fixture
+def client(app):
+    class Status(Resource):
+        @rate_limit("RATE_LIMIT_TEST", key_arg="collection_identifier")
+        def get(self, collection_identifier, tenant_id=None):
+            return {"id": collection_identifier}
+
+    api = Api(app)
+    api.add_resource(Status, "/status/<collection_identifier>")
+    app.config["RATE_LIMIT_TEST"] = "2/10"
+    return app.test_client()
+
+
+def test_decorator_returns_429_with_retry_after(client):
+    assert client.get("/status/a").status_code == 200
+    assert client.get("/status/a").status_code == 200
+
+    response = client.get("/status/a")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+    assert response.get_json() == {"error": "Too many requests", "retry_after": 5}
+
+    # limited per resource
+    assert client.get("/status/b").status_code == 200
+
+
+def test_decorator_is_off_without_a_setting(app, client):
+    app.config["RATE_LIMIT_TEST"] = None
+    assert all(client.get("/status/a").status_code == 200 for _ in range(5))
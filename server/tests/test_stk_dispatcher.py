@@ -0,0 +1,50 @@
+import asyncio
+
+import fakeredis
+
+from workers.stk_dispatcher import STK_QUEUE_KEY, StkDispatcher
+
+
+def test_batches_in_flight_are_bounded(app, monkeypatch):
+    app.config.update(STK_DISPATCHER_BATCH_SIZE=1, STK_DISPATCHER_MAX_BATCHES=2)
+    r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    dispatcher = StkDispatcher(app)
+    monkeypatch.setattr(dispatcher, "_redis", lambda: r)
+
+    # fakeredis blocks the whole event loop in BLMOVE; poll instead
+    async def blmove(source, destination, timeout, *where):
+        item = await r.lmove(source, destination, *where)
+        if item is None:
+            await asyncio.sleep(0.01)
+        return item
+
+    monkeypatch.setattr(r, "blmove", blmove)
+
+    started = []
+    finish = asyncio.Event()
+
+    async def dispatch(session, ids):
+        started.append(ids)
+        await finish.wait()
+        await dispatcher._queue.ack(ids)
+
+    monkeypatch.setattr(dispatcher, "_dispatch", dispatch)
+
+    async def scenario():
+        await r.rpush(STK_QUEUE_KEY, *[f"c{i}" for i in range(5)])
+        runner = asyncio.create_task(dispatcher.run())
+        await asyncio.sleep(0.2)
+
+        # the rest of the backlog stays on the shared queue
+        assert len(started) == 2
+        assert await r.llen(STK_QUEUE_KEY) == 3
+        assert await r.llen(dispatcher._queue.processing_key) == 2
+
+        finish.set()
+        while await r.llen(STK_QUEUE_KEY):
+            await asyncio.sleep(0.05)
+        dispatcher._stopping.set()
+        await asyncio.wait_for(runner, 5)
+
+    asyncio.run(scenario())
+    assert [ids for ids in started] == [["c0"], ["c1"], ["c2"], ["c3"], ["c4"]]
@@ -0,0 +1,89 @@
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import literal, select
+
+from models import db
+from utils import tariffs
+from utils.tariffs import B2C_TARIFF_2024, TariffTable, charges_for, get_tariff, load_tariffs, register_tariff
+
+
+@pytest.fixture(autouse=True)
+def restore_schedules(monkeypatch):
+    monkeypatch.setattr(tariffs, "_schedules", dict(tariffs._schedules))
+    monkeypatch.setattr(tariffs, "_effective_dates", dict(tariffs._effective_dates))
+
+
+@pytest.mark.parametrize("amount, charge", [
+    (1, 0),
+    (100, 0),
+    (101, 5),
+    ("1500", 5),
+    (Decimal("1500.50"), None),  # between bands
+    (1501, 9),
+    (250000, 13),
+    (0, None),
+    (250001, None),
+    ("abc", None),
+])
+def test_b2c_charge_bands(amount, charge):
+    assert B2C_TARIFF_2024.charge_for(amount) == charge
+
+
+def test_charges_for_many_amounts():
+    assert charges_for([50, 700, 6000], kind="b2c") == [0, 5, 11]
+    assert charges_for([50, 700, 6000], kind="b2b") == [3, 13, 48]
+
+
+def test_overlapping_bands_are_rejected():
+    with pytest.raises(ValueError, match="Overlapping"):
+        TariffTable("b2c", "bad", [(1, 100, 0), (100, 200, 5)])
+
+
+def test_tariff_versions_apply_from_their_effective_date():
+    newer = TariffTable("b2c", "2026", [(1, 1000, 7)])
+    register_tariff("b2c", newer, date(2026, 1, 1))
+
+    assert get_tariff("b2c", date(2025, 12, 31)) is B2C_TARIFF_2024
+    assert get_tariff("b2c", date(2026, 1, 1)) is newer
+    assert get_tariff("b2c", date(2027, 6, 1)) is newer
+
+
+def test_registering_a_date_again_replaces_that_version():
+    register_tariff("b2c", TariffTable("b2c", "a", [(1, 10, 1)]), date(2026, 1, 1))
+    replacement = TariffTable("b2c", "b", [(1, 10, 2)])
+    register_tariff("b2c", replacement, date(2026, 1, 1))
+
+    assert get_tariff("b2c", date(2026, 2, 1)) is replacement
+    assert len(tariffs._schedules["b2c"]) == len(tariffs._effective_dates["b2c"]) == 2
+
+
+def test_unknown_kind():
+    with pytest.raises(KeyError):
+        get_tariff("c2b")
+
+
+def test_load_tariffs(tmp_path):
+    path = tmp_path / "tariffs.json"
+    path.write_text(json.dumps({
+        "b2b": [{"version": "2026-03", "effective_from": "2026-03-01", "bands": [[1, 100, 1]]}]
+    }))
+
+    load_tariffs(str(path))
+
+    table = get_tariff("b2b", date(2026, 3, 1))
+    assert (table.version, table.bands) == ("2026-03", ((Decimal(1), Decimal(100), 1),))
+
+
+def test_sql_charge_matches_charge_for(app):
+    amounts = [1, 100, 101, 1500, 1501, 7500, 250000, 250001]
+    expected = B2C_TARIFF_2024.charges_for(amounts)
+
+    charged = [
+        db.session.execute(select(B2C_TARIFF_2024.sql_charge(literal(amount), default=None))).scalar()
+        for amount in amounts
+    ]
+
+    assert charged == expected
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+
+from models import Ledger, Tenant, TenantWalletStats, Transaction, db
+from utils.wallet import WalletService
+
+pytestmark = pytest.mark.usefixtures("postgres")
+
+
+def post(tenant, amount, ref, txn_type="credit"):
+    return WalletService.log_transaction(
+        tenant_id=tenant.id, amount=amount, gateway="mpesa", txn_type=txn_type, transaction_ref=ref
+    )
+
+
+def test_credit_posts_net_of_platform_fee(tenant):
+    txn, ledger = post(tenant, 1000, "R1")
+
+    assert txn.transaction_ref == "R1"
+    assert ledger.sequence == 1
+    assert ledger.balance == Decimal("985.00")
+    assert db.session.get(Tenant, tenant.id).wallet_balance == Decimal("985.00")
+
+
+def test_repeated_transaction_ref_is_claimed_once(tenant):
+    post(tenant, 1000, "R1")
+
+    assert post(tenant, 1000, "R1") == (None, None)
+
+    assert Transaction.query.filter_by(tenant_id=tenant.id).count() == 1
+    assert Ledger.query.filter_by(tenant_id=tenant.id).count() == 1
+    assert db.session.get(Tenant, tenant.id).wallet_balance == Decimal("985.00")
+    stats = db.session.get(TenantWalletStats, tenant.id)
+    assert (stats.credit_total, stats.credit_count) == (Decimal("1000.00"), 1)
+
+
+def test_same_ref_is_independent_per_tenant(tenant):
+    other = Tenant(name="Other", email="other@example.com", wallet_balance=0)
+    db.session.add(other)
+    db.session.commit()
+
+    assert post(tenant, 100, "R1")[0] is not None
+    assert post(other, 100, "R1")[0] is not None
+
+
+def test_ledger_sequence_and_balance_run_per_tenant(tenant):
+    post(tenant, 1000, "R1")
+    _, ledger = post(tenant, 1000, "R2")
+    assert (ledger.sequence, ledger.balance) == (2, Decimal("1970.00"))
+
+    # a 500 B2C debit carries a 5 shilling charge, posted as its own ledger row
+    _, ledger = post(tenant, 500, "D1", txn_type="debit")
+    assert (ledger.sequence, ledger.balance) == (4, Decimal("1465.00"))
+    charge = Ledger.query.filter_by(tenant_id=tenant.id, sequence=3).one()
+    assert charge.amount == Decimal("5.00")
+    assert db.session.get(Tenant, tenant.id).wallet_balance == Decimal("1465.00")
+
+
+def test_failed_debit_rolls_back_the_claim(tenant):
+    with pytest.raises(ValueError, match="Insufficient wallet balance"):
+        post(tenant, 500, "D1", txn_type="debit")
+
+    assert Transaction.query.filter_by(tenant_id=tenant.id).count() == 0
+    # nothing was claimed, so the retry is not mistaken for a duplicate
+    post(tenant, 1000, "R1")
+    assert post(tenant, 500, "D1", txn_type="debit")[0] is not None
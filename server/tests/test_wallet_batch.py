@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import PendingWalletCredit, db
+from workers import wallet_logger
+from workers.wallet_logger import schedule_wallet_batch, sweep_wallet_batches
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        wallet_logger.post_wallet_batch, "apply_async", lambda args, countdown: calls.append(args[0])
+    )
+    return calls
+
+
+def stage(tenant, ref, age):
+    db.session.add(PendingWalletCredit(
+        tenant_id=tenant.id, amount=100, transaction_ref=ref, created_at=datetime.utcnow() - timedelta(seconds=age)
+    ))
+    db.session.commit()
+
+
+def test_one_drain_is_scheduled_per_tenant(app, tenant, scheduled):
+    schedule_wallet_batch(tenant.id)
+    schedule_wallet_batch(tenant.id)
+
+    assert scheduled == [str(tenant.id)]
+
+
+def test_marker_is_cleared_when_scheduling_fails(app, tenant, monkeypatch):
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(wallet_logger.post_wallet_batch, "apply_async", broker_down)
+    with pytest.raises(ConnectionError):
+        schedule_wallet_batch(tenant.id)
+
+    assert not app.redis.exists(f"wallet:batch:{tenant.id}")
+
+
+def test_sweep_drains_stale_credits(app, tenant, scheduled):
+    app.config["WALLET_BATCH_SWEEP_AGE"] = 10
+    stage(tenant, "fresh", age=1)
+
+    sweep_wallet_batches()
+    assert scheduled == []
+
+    stage(tenant, "stale", age=60)
+    stage(tenant, "stale-2", age=60)
+    sweep_wallet_batches()
+    assert scheduled == [str(tenant.id)]
@@ -0,0 +1,229 @@
+"""
+Two-tier cache for API key authentication.
+
+Lookups go to a small in-process LRU first, then Redis, then Postgres. Both
+tiers hold sha256(key) -> tenant_id, so the plaintext key is never stored in
+a cache and the salted hash check (utils.api_key_hash) only runs on a miss.
+Redis also keeps the digests cached per tenant so a revoked or regenerated
+key can be dropped everywhere: the Redis entries are deleted and
+the tenant id is published on API_KEY_CHANNEL, where a listener thread in
+every process evicts it from its LRU.
+
+A miss fills both tiers after the database read, which can race with an
+invalidation of the same key. Every invalidation bumps a generation
+counter (in Redis, and per LRU); the fill is skipped if the counter moved
+since before the database read, so a revoked key is never written back.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app
+
+from utils.api_key_hash import find_active_api_key
+
+logger = logging.getLogger(__name__)
+
+API_KEY_CHANNEL = "apikey:invalidate"
+API_KEY_GENERATION_KEY = "apikey:generation"
+
+# KEYS: generation, digest key, tenant index
+# ARGV: generation seen before the database read, tenant id, digest, ttl
+_FILL = """
+if (redis.call('get', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[4])
+redis.call('sadd', KEYS[3], ARGV[3])
+redis.call('expire', KEYS[3], ARGV[4])
+return 1
+"""
+
+# KEYS: generation, tenant index; digest keys as built by _redis_key()
+_INVALIDATE = """
+redis.call('incr', KEYS[1])
+for _, digest in ipairs(redis.call('smembers', KEYS[2])) do
+    redis.call('del', 'apikey:' .. digest)
+end
+redis.call('del', KEYS[2])
+return 1
+"""
+
+
+def key_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class _LRU:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every eviction, see set()
+        self.generation = 0
+
+    def get(self, digest):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(digest)
+            if entry is None:
+                return None
+            tenant_id, expires_at = entry
+            if expires_at < now:
+                del self._data[digest]
+                return None
+            self._data.move_to_end(digest)
+            return tenant_id
+
+    def set(self, digest, tenant_id, generation=None):
+        """
+        Cache a lookup; skipped if `generation` (read before the lookup) is
+        no longer current, i.e. an eviction happened in between.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[digest] = (tenant_id, time.monotonic() + self.ttl)
+            self._data.move_to_end(digest)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def evict_tenant(self, tenant_id):
+        with self._lock:
+            self.generation += 1
+            for digest in [d for d, (t, _) in self._data.items() if t == tenant_id]:
+                del self._data[digest]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _local_cache(app):
+    """
+    This process's LRU, sized from API_KEY_CACHE_SIZE / API_KEY_LOCAL_TTL.
+    """
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                _local = _LRU(app.config.get("API_KEY_CACHE_SIZE", 10000), app.config.get("API_KEY_LOCAL_TTL", 30))
+    return _local
+
+
+def _redis_key(digest):
+    return f"apikey:{digest}"
+
+
+def _tenant_index_key(tenant_id):
+    return f"apikey:tenant:{tenant_id}"
+
+
+def _ensure_listener(app):
+    """
+    Start this process's invalidation listener (again after a fork, since
+    threads do not survive one).
+    """
+    global _listener_pid
+    pid = os.getpid()
+    if _listener_pid == pid:
+        return
+    with _listener_lock:
+        if _listener_pid == pid:
+            return
+        _local_cache(app).clear()
+        thread = threading.Thread(target=_listen, args=(app,), name="api-key-invalidation", daemon=True)
+        thread.start()
+        _listener_pid = pid
+
+
+def _listen(app):
+    local = _local_cache(app)
+    while True:
+        try:
+            pubsub = app.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(API_KEY_CHANNEL)
+            # anything cached while we were not subscribed may be stale
+            local.clear()
+            for message in pubsub.listen():
+                if message.get("type") == "message":
+                    local.evict_tenant(message["data"])
+        except Exception as e:
+            logger.warning(f"API key invalidation listener disconnected: {e}")
+            local.clear()
+            time.sleep(1)
+
+
+def lookup_tenant_id(token):
+    """
+    UUID of the tenant owning an active API key, or None.
+    """
+    app = current_app._get_current_object()
+    r = getattr(app, "redis", None)
+    if r is not None:
+        _ensure_listener(app)
+
+    local = _local_cache(app)
+    digest = key_digest(token)
+    tenant_id = local.get(digest)
+    if tenant_id:
+        return uuid.UUID(tenant_id)
+
+    local_generation = local.generation
+    generation = None
+    if r is not None:
+        try:
+            tenant_id, generation = r.mget(_redis_key(digest), API_KEY_GENERATION_KEY)
+        except Exception as e:
+            logger.warning(f"API key cache unavailable, falling back to database: {e}")
+            r = None
+        if tenant_id:
+            local.set(digest, tenant_id, generation=local_generation)
+            return uuid.UUID(tenant_id)
+
+    api_key = find_active_api_key(token)
+    if not api_key:
+        return None
+
+    tenant_id = str(api_key.tenant_id)
+    local.set(digest, tenant_id, generation=local_generation)
+    if r is not None:
+        try:
+            r.eval(
+                _FILL, 3, API_KEY_GENERATION_KEY, _redis_key(digest), _tenant_index_key(tenant_id),
+                generation or "0", tenant_id, digest, app.config.get("API_KEY_REDIS_TTL", 300),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cache API key for tenant {tenant_id}: {e}")
+    return api_key.tenant_id
+
+
+def invalidate_tenant_keys(tenant_id):
+    """
+    Drop every cached key of a tenant, in Redis and in every process.
+    Call after the key is revoked or regenerated and the change is committed.
+    """
+    tenant_id = str(tenant_id)
+    app = current_app._get_current_object()
+    _local_cache(app).evict_tenant(tenant_id)
+
+    r = getattr(app, "redis", None)
+    if r is None:
+        return
+    try:
+        r.eval(_INVALIDATE, 2, API_KEY_GENERATION_KEY, _tenant_index_key(tenant_id))
+        r.publish(API_KEY_CHANNEL, tenant_id)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cached API keys for tenant {tenant_id}: {e}")
@@ -0,0 +1,61 @@
+"""
+API keys are stored as a public prefix plus a salted HMAC-SHA256 of the
+whole key; the plaintext is only returned once, when the key is issued.
+
+Keys have the same shape as before (a uuid4 string), so the prefix is its
+first PREFIX_LENGTH characters. Verification looks up the candidates by the
+indexed prefix and compares hashes in constant time.
+"""
+import hashlib
+import hmac
+import secrets
+import uuid
+
+from models import ApiKey
+
+PREFIX_LENGTH = 8
+
+
+def generate_api_key():
+    return str(uuid.uuid4())
+
+
+def key_prefix(token):
+    return token[:PREFIX_LENGTH]
+
+
+def hash_api_key(token, salt):
+    return hmac.new(salt.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+
+def set_api_key_secret(api_key, token=None):
+    """
+    Store a new secret on `api_key` and return it in plaintext.
+    """
+    token = token or generate_api_key()
+    api_key.salt = secrets.token_hex(16)
+    api_key.prefix = key_prefix(token)
+    api_key.key_hash = hash_api_key(token, api_key.salt)
+    return token
+
+
+def verify_api_key(api_key, token):
+    return hmac.compare_digest(api_key.key_hash, hash_api_key(token, api_key.salt))
+
+
+def find_active_api_key(token):
+    """
+    Active ApiKey matching `token`, or None.
+    """
+    if len(token) < PREFIX_LENGTH:
+        return None
+
+    candidates = ApiKey.query.filter_by(prefix=key_prefix(token), revoked_at=None).all()
+    for api_key in candidates:
+        if verify_api_key(api_key, token):
+            return api_key
+    return None
+
+
+def masked_key(api_key):
+    return f"{api_key.prefix}{'*' * 8}"
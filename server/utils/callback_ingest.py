@@ -0,0 +1,32 @@
+"""
+Fast ingest of M-Pesa callbacks.
+
+With CALLBACK_INGEST_ENABLED the callback endpoints only validate the
+payload, append it to the Redis stream CALLBACK_STREAM_KEY with one XADD and
+ack Safaricom. The callback consumer (python -m workers.callback_consumer)
+reads the stream through the CALLBACK_GROUP consumer group and applies
+status changes, wallet posting and webhooks in batches.
+"""
+import json
+
+from flask import current_app
+
+CALLBACK_STREAM_KEY = "callbacks:ingest"
+CALLBACK_GROUP = "callback-consumers"
+
+STK_CALLBACK = "stk"
+B2C_CALLBACK = "b2c"
+B2B_CALLBACK = "b2b"
+
+
+def ingest_callback(kind, tenant_id, record_id, body):
+    """
+    Append a raw callback body to the ingest stream. Entries are deleted by
+    the consumer once applied, so the stream only holds the backlog.
+    """
+    return current_app.redis.xadd(CALLBACK_STREAM_KEY, {
+        "kind": kind,
+        "tenant_id": str(tenant_id),
+        "record_id": str(record_id),
+        "body": json.dumps(body),
+    })
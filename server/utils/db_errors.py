@@ -0,0 +1,6 @@
+def constraint_name(error):
+    """
+    Name of the constraint a psycopg2 IntegrityError violated, or None.
+    """
+    diag = getattr(getattr(error, "orig", None), "diag", None)
+    return getattr(diag, "constraint_name", None)
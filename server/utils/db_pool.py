@@ -0,0 +1,48 @@
+"""
+SQLAlchemy engine options per process type.
+
+DB_POOL_MODE picks the pooling strategy:
+
+    queue      keep a QueuePool of connections per process (default)
+    pgbouncer  DATABASE_URL points at PgBouncer in transaction pooling mode;
+               keep a small LIFO pool of client connections and let PgBouncer
+               share the server connections. psycopg2 never uses server-side
+               prepared statements, so nothing else has to change
+    null       open a new connection for every checkout (the old behaviour)
+
+Sizes come from DB_POOL_SIZE / DB_MAX_OVERFLOW, falling back to defaults for
+PROCESS_TYPE ("web" for gunicorn, "worker" for Celery and the dispatchers).
+"""
+import sqlalchemy.pool
+
+# process type -> (pool_size, max_overflow)
+POOL_DEFAULTS = {
+    "web": (5, 10),
+    "worker": (2, 4),
+}
+
+
+def engine_options(config):
+    mode = config.get("DB_POOL_MODE", "queue")
+    if mode == "null":
+        return {"poolclass": sqlalchemy.pool.NullPool}
+
+    default_size, default_overflow = POOL_DEFAULTS.get(config.get("PROCESS_TYPE"), POOL_DEFAULTS["web"])
+    options = {
+        "poolclass": sqlalchemy.pool.QueuePool,
+        "pool_size": config.get("DB_POOL_SIZE") or default_size,
+        "max_overflow": config.get("DB_MAX_OVERFLOW") if config.get("DB_MAX_OVERFLOW") is not None else default_overflow,
+        "pool_timeout": config.get("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": config.get("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": config.get("DB_POOL_PRE_PING", True),
+    }
+
+    if mode == "pgbouncer":
+        # reuse the most recent connection so the rest go idle and are
+        # closed by PgBouncer's client_idle_timeout instead of piling up
+        options["pool_use_lifo"] = True
+        options["pool_recycle"] = min(options["pool_recycle"], 300)
+    elif mode != "queue":
+        raise ValueError(f"Unknown DB_POOL_MODE: {mode}")
+
+    return options
@@ -0,0 +1,143 @@
+"""
+Shared M-Pesa OAuth token cache.
+
+The token lives in Redis so every Celery worker and web process reuses it
+until shortly before it expires. Only the worker holding the refresh lock
+calls the OAuth endpoint; the others keep using the current token, or wait
+briefly for the new one when there is none yet.
+"""
+import base64
+import json
+import logging
+import time
+import uuid
+
+from flask import current_app
+
+from utils.mpesa_client import AUTH_PATH, get_mpesa_client
+from utils.mpesa_rate_limit import PRIORITY_HIGH
+
+logger = logging.getLogger(__name__)
+
+TOKEN_KEY = "mpesa:oauth:token"
+LOCK_KEY = "mpesa:oauth:lock"
+FETCH_COUNTER_KEY = "mpesa:oauth:fetches"
+
+LOCK_TTL = 10
+LOCK_WAIT_INTERVAL = 0.05
+
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def fetch_mpesa_auth_token():
+    """
+    Call the OAuth endpoint. Returns (access_token, expires_in) or (None, None).
+    """
+    consumer_key = current_app.config.get("MPESA_CONSUMER_KEY")
+    consumer_secret = current_app.config.get("MPESA_CONSUMER_SECRET")
+    auth = base64.b64encode(f"{consumer_key}:{consumer_secret}".encode("utf-8")).decode("utf-8")
+    headers = {"Authorization": f"Basic {auth}"}
+    try:
+        response = get_mpesa_client().get(AUTH_PATH, headers=headers, priority=PRIORITY_HIGH)
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("access_token"), int(data.get("expires_in", 3599))
+        logger.error(f"Failed to get auth token, status code: {response.status_code}, response: {response.text}")
+        return None, None
+    except Exception as e:
+        logger.exception(f"Exception while fetching auth token: {e}")
+        return None, None
+
+
+def get_mpesa_auth_token():
+    """
+    Cached access token, refreshed by a single worker at a time.
+    """
+    r = getattr(current_app, "redis", None)
+    if r is None:
+        return fetch_mpesa_auth_token()[0]
+
+    try:
+        cached = _read_token(r)
+        if cached:
+            token, expires_at = cached
+            if expires_at - time.time() > _refresh_margin():
+                return token
+            # expiring soon: refresh if nobody else is, otherwise keep using it
+            return _refresh(r, wait=False) or token
+
+        return _refresh(r, wait=True)
+
+    except Exception as e:
+        logger.warning(f"M-Pesa token cache unavailable, fetching directly: {e}")
+        return fetch_mpesa_auth_token()[0]
+
+
+def refresh_if_expiring():
+    """
+    Background refresh (Celery beat) so request paths rarely see a cold cache.
+    Returns True when a new token was stored.
+    """
+    r = current_app.redis
+    cached = _read_token(r)
+    if cached and cached[1] - time.time() > _refresh_margin():
+        return False
+    return _refresh(r, wait=False) is not None
+
+
+def _refresh_margin():
+    # refresh this many seconds before the token expires
+    return current_app.config.get("MPESA_TOKEN_REFRESH_MARGIN", 300)
+
+
+def _read_token(r):
+    raw = r.get(TOKEN_KEY)
+    if not raw:
+        return None
+    data = json.loads(raw)
+    return data["token"], data["expires_at"]
+
+
+def _refresh(r, wait):
+    deadline = time.time() + LOCK_TTL
+    while True:
+        lock_id = uuid.uuid4().hex
+        if r.set(LOCK_KEY, lock_id, nx=True, ex=LOCK_TTL):
+            try:
+                return _fetch_and_store(r)
+            finally:
+                r.eval(_RELEASE_LOCK, 1, LOCK_KEY, lock_id)
+
+        if not wait:
+            return None
+
+        # another worker is refreshing; pick up its token when it lands
+        while time.time() < deadline:
+            time.sleep(LOCK_WAIT_INTERVAL)
+            cached = _read_token(r)
+            if cached:
+                return cached[0]
+            if not r.exists(LOCK_KEY):
+                break  # holder gave up without a token, try to take over
+        else:
+            logger.error("Timed out waiting for M-Pesa token refresh")
+            return None
+
+
+def _fetch_and_store(r):
+    token, expires_in = fetch_mpesa_auth_token()
+    r.incr(FETCH_COUNTER_KEY)
+    if not token:
+        return None
+
+    expires_at = time.time() + expires_in
+    # drop the key a little before Safaricom does so nobody is handed a dead token
+    ttl = max(expires_in - 30, 1)
+    r.set(TOKEN_KEY, json.dumps({"token": token, "expires_at": expires_at}), ex=ttl)
+    logger.info(f"Refreshed M-Pesa auth token, expires in {expires_in}s")
+    return token
@@ -0,0 +1,181 @@
+"""
+Pooled HTTP client for Safaricom Daraja calls.
+
+One keep-alive requests.Session per process, with connect/read timeouts and
+retry-with-backoff. Connection errors are retried for every method since the
+request never reached Safaricom; read errors and retryable statuses are only
+retried for idempotent GETs (OAuth), so an STK push or payout is never sent
+twice by the client.
+
+Each process logs its request counters and pool usage (stats()) at most
+every MPESA_STATS_LOG_INTERVAL seconds while it is making calls.
+
+Tests and local stacks can point it elsewhere with the MPESA_BASE_URL setting or swap
+the whole client with set_mpesa_client().
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import Config
+from utils.mpesa_rate_limit import PRIORITY_NORMAL, acquire
+
+logger = logging.getLogger(__name__)
+
+# Daraja endpoints
+AUTH_PATH = "/oauth/v1/generate?grant_type=client_credentials"
+STK_PUSH_PATH = "/mpesa/stkpush/v1/processrequest"
+B2C_PATH = "/mpesa/b2c/v3/paymentrequest"
+B2B_PATH = "/mpesa/b2b/v1/paymentrequest"
+
+# rate limit bucket per endpoint (see utils.mpesa_rate_limit)
+PATH_BUCKETS = {
+    AUTH_PATH: "oauth",
+    STK_PUSH_PATH: "stk",
+    B2C_PATH: "b2c",
+    B2B_PATH: "b2b",
+}
+
+
+class MpesaClient:
+    def __init__(
+        self,
+        base_url=Config.MPESA_BASE_URL,
+        connect_timeout=Config.MPESA_CONNECT_TIMEOUT,
+        read_timeout=Config.MPESA_READ_TIMEOUT,
+        pool_maxsize=Config.MPESA_POOL_MAXSIZE,
+        max_retries=Config.MPESA_MAX_RETRIES,
+        stats_log_interval=Config.MPESA_STATS_LOG_INTERVAL,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0, "rate_limit_wait_seconds": 0.0}
+        self.stats_log_interval = stats_log_interval
+        self._stats_logged_at = time.monotonic()
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def request(self, method, path, priority=PRIORITY_NORMAL, **kwargs):
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", self.timeout)
+
+        bucket = PATH_BUCKETS.get(path)
+        if bucket:
+            waited = acquire(bucket, priority)
+            with self._lock:
+                self._stats["rate_limit_wait_seconds"] += waited
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+        try:
+            return self.session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["in_flight"] -= 1
+            self._log_stats()
+
+    def stats(self):
+        """
+        Request counters plus per-host connection pool usage.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        pools = {}
+        for key in list(self._adapter.poolmanager.pools.keys()):
+            pool = self._adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool else 0,
+                "maxsize": pool.pool.maxsize if pool.pool else 0,
+            }
+        stats["pools"] = pools
+        return stats
+
+    def _log_stats(self):
+        if not self.stats_log_interval:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._stats_logged_at < self.stats_log_interval:
+                return
+            self._stats_logged_at = now
+        logger.info(f"M-Pesa client stats (pid {os.getpid()}): {self.stats()}")
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_mpesa_client():
+    """
+    Per-process client; rebuilt after a fork so pooled sockets are never shared.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                config = current_app.config
+                _client = MpesaClient(
+                    base_url=config.get("MPESA_BASE_URL", Config.MPESA_BASE_URL),
+                    connect_timeout=config.get("MPESA_CONNECT_TIMEOUT", Config.MPESA_CONNECT_TIMEOUT),
+                    read_timeout=config.get("MPESA_READ_TIMEOUT", Config.MPESA_READ_TIMEOUT),
+                    pool_maxsize=config.get("MPESA_POOL_MAXSIZE", Config.MPESA_POOL_MAXSIZE),
+                    max_retries=config.get("MPESA_MAX_RETRIES", Config.MPESA_MAX_RETRIES),
+                    stats_log_interval=config.get("MPESA_STATS_LOG_INTERVAL", Config.MPESA_STATS_LOG_INTERVAL),
+                )
+                _client_pid = pid
+    return _client
+
+
+def set_mpesa_client(client):
+    """
+    Inject a client (e.g. one pointed at a local stub server).
+    """
+    global _client, _client_pid
+    with _client_lock:
+        _client = client
+        _client_pid = os.getpid()
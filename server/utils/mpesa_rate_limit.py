@@ -0,0 +1,196 @@
+"""
+Redis token buckets shared by every process that calls Daraja.
+
+Each call takes one token from its endpoint bucket (stk, b2c, b2b, oauth)
+and one from the shared "global" bucket, atomically in one Lua script.
+Priority is enforced on the global bucket by reservation: a LOW priority
+call (batch payouts) only gets a token while a slice of the bucket is still
+left over for customer-facing STK pushes.
+
+Rates, bursts and the wait timeout come from the MPESA_RATE_* /
+MPESA_BURST_* settings in config.Config.
+
+A call that cannot get a token within MPESA_RATE_LIMIT_TIMEOUT raises
+RateLimitTimeout without being sent, so the caller can retry or requeue
+it later instead of bursting past Safaricom's limits.
+
+The time each call spent waiting is accumulated per bucket in the
+mpesa:ratelimit:stats hash (<bucket>:delay_ms, <bucket>:calls).
+"""
+import asyncio
+import logging
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = "high"
+PRIORITY_NORMAL = "normal"
+PRIORITY_LOW = "low"
+
+# share of the global bucket a priority must leave untouched
+PRIORITY_RESERVE = {
+    PRIORITY_HIGH: 0.0,
+    PRIORITY_NORMAL: 0.1,
+    PRIORITY_LOW: 0.3,
+}
+
+BUCKETS = ("global", "stk", "b2c", "b2b", "oauth")
+
+STATS_KEY = "mpesa:ratelimit:stats"
+
+
+class RateLimitTimeout(Exception):
+    """
+    No token was granted within the timeout; the call was not sent.
+    """
+
+# KEYS: bucket keys..., stats key
+# ARGV: waited_ms, stats field prefix, then (rate, capacity, reserve) per bucket
+# Returns 0 when every bucket granted a token, else the milliseconds to wait.
+_TAKE_TOKENS = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local n = #KEYS - 1
+local levels = {}
+local wait = 0
+for i = 1, n do
+    local rate = tonumber(ARGV[3 + (i - 1) * 3])
+    local capacity = tonumber(ARGV[4 + (i - 1) * 3])
+    local reserve = tonumber(ARGV[5 + (i - 1) * 3])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+    levels[i] = tokens
+    local needed = 1 + reserve * capacity
+    if tokens < needed then
+        wait = math.max(wait, math.ceil((needed - tokens) * 1000 / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i = 1, n do
+    redis.call('HSET', KEYS[i], 'tokens', levels[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], 60000)
+end
+redis.call('HINCRBY', KEYS[n + 1], ARGV[2] .. ':delay_ms', ARGV[1])
+redis.call('HINCRBY', KEYS[n + 1], ARGV[2] .. ':calls', 1)
+return 0
+"""
+
+
+def _limits(config, name):
+    """
+    (tokens per second, burst capacity) of a bucket.
+    """
+    suffix = name.upper()
+    return float(config.get(f"MPESA_RATE_{suffix}")), float(config.get(f"MPESA_BURST_{suffix}"))
+
+
+def _script_args(config, bucket, priority, waited_ms):
+    keys = [f"mpesa:ratelimit:{bucket}", "mpesa:ratelimit:global", STATS_KEY]
+    args = [int(waited_ms), bucket]
+    for name, reserve in ((bucket, 0.0), ("global", PRIORITY_RESERVE[priority])):
+        rate, capacity = _limits(config, name)
+        args.extend([rate, capacity, reserve])
+    return keys, args
+
+
+def acquire(bucket, priority=PRIORITY_NORMAL, redis_client=None, timeout=None):
+    """
+    Block until a token for `bucket` is granted. Returns the seconds waited;
+    raises RateLimitTimeout if none is granted within `timeout`. Fails open
+    (no wait) when rate limiting is off or Redis is unreachable.
+    """
+    config = current_app.config
+    if not config.get("MPESA_RATE_LIMIT_ENABLED", True) or bucket not in BUCKETS:
+        return 0.0
+
+    r = redis_client or getattr(current_app, "redis", None)
+    if r is None:
+        return 0.0
+
+    if timeout is None:
+        timeout = config.get("MPESA_RATE_LIMIT_TIMEOUT", 30)
+    started = time.monotonic()
+    deadline = started + timeout
+    try:
+        while True:
+            waited_ms = (time.monotonic() - started) * 1000
+            keys, args = _script_args(config, bucket, priority, waited_ms)
+            wait_ms = r.eval(_TAKE_TOKENS, len(keys), *keys, *args)
+            if not wait_ms:
+                return _record(bucket, priority, started)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitTimeout(f"Rate limit wait for {bucket} ({priority}) exceeded {timeout}s")
+            time.sleep(min(int(wait_ms) / 1000, remaining))
+
+    except RateLimitTimeout:
+        raise
+    except Exception as e:
+        logger.warning(f"M-Pesa rate limiter unavailable, not throttling: {e}")
+        return time.monotonic() - started
+
+
+async def acquire_async(bucket, redis_client, config, priority=PRIORITY_NORMAL, timeout=None):
+    """
+    acquire() for asyncio callers holding a redis.asyncio client; they pass
+    the app config since there is no app context on the event loop.
+    """
+    if not config.get("MPESA_RATE_LIMIT_ENABLED", True) or bucket not in BUCKETS:
+        return 0.0
+
+    if timeout is None:
+        timeout = config.get("MPESA_RATE_LIMIT_TIMEOUT", 30)
+    started = time.monotonic()
+    deadline = started + timeout
+    try:
+        while True:
+            waited_ms = (time.monotonic() - started) * 1000
+            keys, args = _script_args(config, bucket, priority, waited_ms)
+            wait_ms = await redis_client.eval(_TAKE_TOKENS, len(keys), *keys, *args)
+            if not wait_ms:
+                return _record(bucket, priority, started)
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RateLimitTimeout(f"Rate limit wait for {bucket} ({priority}) exceeded {timeout}s")
+            await asyncio.sleep(min(int(wait_ms) / 1000, remaining))
+
+    except RateLimitTimeout:
+        raise
+    except Exception as e:
+        logger.warning(f"M-Pesa rate limiter unavailable, not throttling: {e}")
+        return time.monotonic() - started
+
+
+def _record(bucket, priority, started):
+    waited = time.monotonic() - started
+    if waited >= 0.05:
+        logger.info(f"M-Pesa {bucket} call ({priority}) queued {waited * 1000:.0f}ms by rate limiter")
+    return waited
+
+
+def rate_limit_stats(redis_client=None):
+    """
+    Average queueing delay per bucket, in milliseconds.
+    """
+    r = redis_client or current_app.redis
+    raw = r.hgetall(STATS_KEY)
+    stats = {}
+    for bucket in BUCKETS:
+        if bucket == "global":
+            continue  # every call also takes a global token; delays are recorded per endpoint
+        calls = int(raw.get(f"{bucket}:calls", 0))
+        delay = int(raw.get(f"{bucket}:delay_ms", 0))
+        stats[bucket] = {
+            "calls": calls,
+            "total_delay_ms": delay,
+            "avg_delay_ms": round(delay / calls, 2) if calls else 0.0,
+        }
+    return stats
@@ -0,0 +1,60 @@
+"""
+Keyset pagination over (created_at, id).
+
+Cursors are opaque url-safe base64 tokens of the last row's created_at and
+id. Pages are ordered by created_at DESC, id DESC and continue with a row
+comparison, (created_at, id) < (cursor created_at, cursor id), so rows that
+share a timestamp are neither skipped nor repeated, and the comparison is
+served by a (..., created_at, id) index.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(created_at, record_id):
+    raw = json.dumps([created_at.isoformat(), str(record_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    (created_at, id) of a cursor. Raises ValueError if it is not one of ours.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, record_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(record_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def parse_limit(value, default=20, maximum=100):
+    """
+    Page size from a ?limit= query arg, clamped to 1..maximum. Raises
+    ValueError if it is not an integer.
+    """
+    if value is None or value == "":
+        return default
+    return max(1, min(int(value), maximum))
+
+
+def paginate(query, model, cursor=None, limit=20):
+    """
+    One page of `query` (filters applied, no ordering) newest first; `limit`
+    must be at least 1 (see parse_limit).
+    Returns (rows, next_cursor, has_more); raises ValueError for a bad cursor.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, record_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, record_id))
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    return rows, next_cursor, has_more
@@ -0,0 +1,109 @@
+"""
+Status state machine for collections and disbursements.
+
+    pending -> initiated -> completed / failed
+    pending ------------> completed / failed
+
+Disbursements are first claimed by the task that sends them:
+
+    pending -> processing -> initiated -> completed / failed
+               processing -> pending (released before anything was sent)
+
+Status changes are conditional UPDATEs (... WHERE status IN <allowed
+sources>), so of several workers or callbacks racing on one record exactly
+one wins, and only the winner records wallet posting and webhooks, in the
+outbox and in the same commit as the change (workers/outbox.py). Terminal
+states never change again.
+
+Safaricom retries callbacks; claim_callback() drops repeats keyed on
+CheckoutRequestID / ConversationID with a Redis SETNX before they reach the
+database. A claim only holds for CALLBACK_CLAIM_TTL until confirm_callback()
+marks the callback handled for CALLBACK_DEDUPE_TTL, so a process that dies
+mid-callback does not turn Safaricom's retry away. The conditional UPDATE
+still guards anything that gets past the claim.
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+INITIATED = "initiated"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# target status -> statuses it may be entered from
+TRANSITIONS = {
+    PENDING: (PROCESSING,),
+    PROCESSING: (PENDING,),
+    INITIATED: (PENDING, PROCESSING),
+    COMPLETED: (PENDING, PROCESSING, INITIATED),
+    FAILED: (PENDING, PROCESSING, INITIATED),
+}
+
+
+def transition(model, record_id, to_status, **values):
+    """
+    Move an ApiCollection/ApiDisbursement row to `to_status` if its current
+    status allows it (not committed). Returns True if this call made the
+    change. Loaded instances pick up the new state after the commit.
+    """
+    table = model.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id == record_id, table.c.status.in_(TRANSITIONS[to_status]))
+        .values(status=to_status, **values)
+    )
+    return result.rowcount == 1
+
+
+def _dedupe_key(kind, callback_key):
+    return f"callback:seen:{kind}:{callback_key}"
+
+
+def claim_callback(kind, callback_key):
+    """
+    True the first time a callback is seen (or its claim has lapsed). Fails
+    open when there is no key or Redis is unavailable.
+    """
+    if not callback_key:
+        return True
+    try:
+        ttl = current_app.config.get("CALLBACK_CLAIM_TTL", 120)
+        return bool(current_app.redis.set(_dedupe_key(kind, callback_key), 1, nx=True, ex=ttl))
+    except Exception as e:
+        logger.warning(f"Callback dedupe unavailable: {e}")
+        return True
+
+
+def confirm_callback(kind, callback_key):
+    """
+    Keep a claimed callback deduped for CALLBACK_DEDUPE_TTL; call once its
+    status change and follow-ups are committed (or handed to the ingest
+    stream).
+    """
+    if not callback_key:
+        return
+    try:
+        ttl = current_app.config.get("CALLBACK_DEDUPE_TTL", 86400)
+        current_app.redis.set(_dedupe_key(kind, callback_key), 1, ex=ttl)
+    except Exception as e:
+        logger.warning(f"Failed to confirm callback {callback_key}: {e}")
+
+
+def release_callback(kind, callback_key):
+    """
+    Forget a claimed callback that could not be processed, so Safaricom's
+    retry is let through.
+    """
+    if not callback_key:
+        return
+    try:
+        current_app.redis.delete(_dedupe_key(kind, callback_key))
+    except Exception as e:
+        logger.warning(f"Failed to release callback {callback_key}: {e}")
@@ -0,0 +1,128 @@
+"""
+Reliable Redis list queue for the asyncio worker processes.
+
+Producers RPUSH onto the queue list as before. A consumer takes items with
+LMOVE into its own processing list, <queue>:processing:<consumer>, and
+removes them with ack() once their outcome is recorded, or puts them back
+with requeue(). Nothing is lost if a consumer crashes mid-batch: every
+consumer keeps a heartbeat key alive, and reap() (run periodically by the
+live ones) moves the processing list of a consumer whose heartbeat expired
+back to the head of the queue.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# KEYS: queue, processing list
+# ARGV: max items
+_TAKE = """
+local items = {}
+for i = 1, tonumber(ARGV[1]) do
+    local item = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+    if not item then
+        break
+    end
+    items[#items + 1] = item
+end
+return items
+"""
+
+# KEYS: queue, processing list
+# ARGV: items
+_REQUEUE = """
+for i = 1, #ARGV do
+    if redis.call('LREM', KEYS[2], 1, ARGV[i]) > 0 then
+        redis.call('RPUSH', KEYS[1], ARGV[i])
+    end
+end
+return #ARGV
+"""
+
+# KEYS: queue, dead consumer's processing list
+# Moves the list back to the head of the queue, keeping its order.
+_RESTORE = """
+local moved = 0
+while redis.call('LMOVE', KEYS[2], KEYS[1], 'RIGHT', 'LEFT') do
+    moved = moved + 1
+end
+return moved
+"""
+
+
+class ReliableQueue:
+    def __init__(self, r, key, consumer, heartbeat_ttl=30):
+        self.r = r
+        self.key = key
+        self.consumer = consumer
+        self.heartbeat_ttl = heartbeat_ttl
+        self.processing_key = self._processing_key(consumer)
+
+    def _processing_key(self, consumer):
+        return f"{self.key}:processing:{consumer}"
+
+    def _alive_key(self, consumer):
+        return f"{self.key}:alive:{consumer}"
+
+    @property
+    def _consumers_key(self):
+        return f"{self.key}:consumers"
+
+    async def take(self, count, timeout=1):
+        """
+        Block up to `timeout` seconds for the first item, then take whatever
+        else is queued, up to `count` items in all.
+        """
+        first = await self.r.blmove(self.key, self.processing_key, timeout, "LEFT", "RIGHT")
+        if first is None:
+            return []
+        items = [first]
+        if count > 1:
+            items.extend(await self.r.eval(_TAKE, 2, self.key, self.processing_key, count - 1))
+        return items
+
+    async def ack(self, items):
+        if not items:
+            return
+        pipe = self.r.pipeline()
+        for item in items:
+            pipe.lrem(self.processing_key, 1, item)
+        await pipe.execute()
+
+    async def requeue(self, items):
+        """
+        Put items back at the tail of the queue for another attempt.
+        """
+        if items:
+            await self.r.eval(_REQUEUE, 2, self.key, self.processing_key, *items)
+
+    async def heartbeat(self):
+        pipe = self.r.pipeline()
+        pipe.sadd(self._consumers_key, self.consumer)
+        pipe.set(self._alive_key(self.consumer), 1, ex=self.heartbeat_ttl)
+        await pipe.execute()
+
+    async def reap(self):
+        """
+        Return the items of consumers whose heartbeat has expired. Returns
+        the number of items restored.
+        """
+        restored = 0
+        for consumer in await self.r.smembers(self._consumers_key):
+            if consumer == self.consumer or await self.r.exists(self._alive_key(consumer)):
+                continue
+            moved = await self.r.eval(_RESTORE, 2, self.key, self._processing_key(consumer))
+            await self.r.srem(self._consumers_key, consumer)
+            if moved:
+                logger.warning(f"Restored {moved} items of dead consumer {consumer} to {self.key}")
+            restored += moved
+        return restored
+
+    async def stop(self):
+        """
+        Hand back anything still held and deregister (clean shutdown).
+        """
+        await self.r.eval(_RESTORE, 2, self.key, self.processing_key)
+        pipe = self.r.pipeline()
+        pipe.srem(self._consumers_key, self.consumer)
+        pipe.delete(self._alive_key(self.consumer))
+        await pipe.execute()
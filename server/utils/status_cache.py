@@ -0,0 +1,110 @@
+"""
+Write-through cache of payment/disbursement status records.
+
+Whatever changes a collection's or disbursement's status (request creation,
+the STK/B2C workers, M-Pesa callbacks) writes the compact status record to
+Redis after committing, so status polling is served without touching the
+database:
+
+    status:<kind>:<id>                          JSON status record
+    status:<kind>:ref:<tenant_id>:<request_ref> id of the record
+
+Terminal states are cached for a long time; pending ones only briefly, in
+case a status change happens somewhere that does not write through.
+"""
+import json
+import logging
+import uuid
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "collection"
+DISBURSEMENT = "disbursement"
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _record_key(kind, record_id):
+    return f"status:{kind}:{record_id}"
+
+
+def _ref_key(kind, tenant_id, request_ref):
+    return f"status:{kind}:ref:{tenant_id}:{request_ref}"
+
+
+def status_record(obj):
+    """
+    Public status payload returned by the status endpoints.
+    """
+    return {
+        "request_id": str(obj.id),
+        "status": obj.status,
+        "amount": str(obj.amount),
+        "request_ref": obj.request_reference,
+        "currency": obj.currency,
+        "created_at": obj.created_at.isoformat() if obj.created_at else None,
+        "updated_at": obj.updated_at.isoformat() if obj.updated_at else None,
+    }
+
+
+def cache_status(kind, obj):
+    """
+    Write the status record of an ApiCollection/ApiDisbursement to Redis and
+    return it. Call after the status change is committed.
+    """
+    record = status_record(obj)
+    if obj.status in TERMINAL_STATUSES:
+        ttl = current_app.config.get("STATUS_TERMINAL_TTL", 86400)
+    else:
+        ttl = current_app.config.get("STATUS_PENDING_TTL", 30)
+    try:
+        pipe = current_app.redis.pipeline()
+        pipe.set(_record_key(kind, record["request_id"]), json.dumps(dict(record, tenant_id=str(obj.tenant_id))), ex=ttl)
+        pipe.set(_ref_key(kind, obj.tenant_id, obj.request_reference), record["request_id"], ex=ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to cache {kind} status for {record['request_id']}: {e}")
+    return record
+
+
+def invalidate_status(kind, record_ids):
+    """
+    Drop cached records whose status was changed in bulk (the ref aliases
+    point at the id and expire on their own).
+    """
+    if not record_ids:
+        return
+    try:
+        current_app.redis.delete(*[_record_key(kind, record_id) for record_id in record_ids])
+    except Exception as e:
+        logger.warning(f"Failed to invalidate {len(record_ids)} cached {kind} statuses: {e}")
+
+
+def get_cached_status(kind, identifier, tenant_id=None):
+    """
+    Cached status record for an id or request reference owned by
+    `tenant_id`, or None on a miss.
+    """
+    try:
+        r = current_app.redis
+        try:
+            record_id = str(uuid.UUID(identifier))
+        except ValueError:
+            record_id = r.get(_ref_key(kind, tenant_id, identifier))
+            if not record_id:
+                return None
+
+        raw = r.get(_record_key(kind, record_id))
+    except Exception as e:
+        logger.warning(f"Status cache unavailable: {e}")
+        return None
+
+    if not raw:
+        return None
+    record = json.loads(raw)
+    if tenant_id is not None and record.pop("tenant_id", None) != str(tenant_id):
+        return None
+    record.pop("tenant_id", None)
+    return record
@@ -2,26 +2,70 @@ from flask import current_app
 import json
 from datetime import datetime
 
-def get_pubsub(request_id):
-    """
-    Subscribe to a Redis channel named after the request_id.
-    """
-    r = current_app.redis
-    pubsub = r.pubsub()
-    pubsub.subscribe(f"request:{request_id}")
-    return pubsub
+# status events are appended to a capped stream per request (at most
+# EVENT_STREAM_MAXLEN entries); subscribers read history and live events from
+# it with a single cursor
+
+TERMINAL_EVENT_STATUSES = ("success", "failed")
+
+
+def stream_key(request_id):
+    return f"events:request:{request_id}"
 
 
 def push_to_queue(request_id, status_msg: dict):
     """
-    Publish status and logs in a single event.
+    Append a status event to the request's stream.
     """
     r = current_app.redis
+    config = current_app.config
 
     event_payload = {
         "type": "transaction_event",
         "status": status_msg,
         "sent_at": datetime.utcnow().isoformat()
     }
+    data = json.dumps(event_payload)
+
+    # after a terminal event only late subscribers still need the stream
+    if is_terminal_event(data):
+        ttl = config.get("EVENT_STREAM_TERMINAL_TTL", 300)
+    else:
+        ttl = config.get("EVENT_STREAM_TTL", 3600)
+    key = stream_key(request_id)
+    pipe = r.pipeline()
+    pipe.xadd(key, {"data": data}, maxlen=config.get("EVENT_STREAM_MAXLEN", 50), approximate=True)
+    pipe.expire(key, ttl)
+    pipe.execute()
+
+
+def replay_start(last_event_id=None):
+    """
+    XRANGE start for events after `last_event_id` (all events if None).
+    """
+    return f"({last_event_id}" if last_event_id else "-"
+
+
+def _id_tuple(event_id):
+    return tuple(int(part) for part in event_id.split("-"))
+
+
+def is_newer(event_id, last_event_id):
+    if not last_event_id:
+        return True
+    try:
+        return _id_tuple(event_id) > _id_tuple(last_event_id)
+    except ValueError:
+        return True
+
+
+def is_terminal_event(data):
+    try:
+        status = json.loads(data).get("status") or {}
+    except ValueError:
+        return False
+    return isinstance(status, dict) and status.get("status") in TERMINAL_EVENT_STATUSES
+
 
-    r.publish(f"request:{request_id}", json.dumps(event_payload))
+def format_sse(event_id, data):
+    return f"id: {event_id}\ndata: {data}\n\n"
@@ -0,0 +1,208 @@
+"""
+M-Pesa business charge tariffs.
+
+Each table is built once into sorted, immutable boundary tuples so a charge
+lookup is a single bisect. Safaricom revises the tariffs from time to time,
+so tables are versioned by the date they take effect; extra versions can be
+loaded from the JSON file named by TARIFF_TABLES_PATH:
+
+    {
+        "b2c": [
+            {"version": "2025-01", "effective_from": "2025-01-01",
+             "bands": [[1, 49, 0], [50, 100, 0], ...]}
+        ]
+    }
+"""
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _to_decimal(amount) -> Optional[Decimal]:
+    if isinstance(amount, Decimal):
+        return amount
+    try:
+        return Decimal(str(amount))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+class TariffTable:
+    """
+    Immutable set of (min, max, charge) bands, both bounds inclusive.
+    Amounts outside every band (including the gaps between bands) have no charge.
+    """
+    __slots__ = ("name", "version", "_mins", "_maxs", "_charges")
+
+    def __init__(self, name: str, version: str, bands: Iterable[Tuple]):
+        rows = sorted(
+            (Decimal(str(min_amt)), Decimal(str(max_amt)), int(charge))
+            for min_amt, max_amt, charge in bands
+        )
+        for (lo, hi, _), (next_lo, _, _) in zip(rows, rows[1:]):
+            if hi >= next_lo:
+                raise ValueError(f"Overlapping tariff bands in {name} {version}: {hi} >= {next_lo}")
+
+        self.name = name
+        self.version = version
+        self._mins = tuple(row[0] for row in rows)
+        self._maxs = tuple(row[1] for row in rows)
+        self._charges = tuple(row[2] for row in rows)
+
+    def charge_for(self, amount) -> Optional[int]:
+        amount = _to_decimal(amount)
+        if amount is None:
+            return None
+
+        # first band whose upper bound is >= amount
+        i = bisect_left(self._maxs, amount)
+        if i == len(self._maxs) or amount < self._mins[i]:
+            return None  # Out of range
+        return self._charges[i]
+
+    def charges_for(self, amounts: Iterable) -> List[Optional[int]]:
+        charge_for = self.charge_for
+        return [charge_for(amount) for amount in amounts]
+
+    @property
+    def bands(self) -> Tuple[Tuple[Decimal, Decimal, int], ...]:
+        return tuple(zip(self._mins, self._maxs, self._charges))
+
+    def sql_charge(self, amount_column, default=0):
+        """
+        SQL CASE expression equivalent of charge_for(), for set-based queries.
+        """
+        from sqlalchemy import case
+
+        return case(
+            *[
+                (amount_column.between(lo, hi), charge)
+                for lo, hi, charge in self.bands
+            ],
+            else_=default,
+        )
+
+
+B2C_TARIFF_2024 = TariffTable("b2c", "2024", [
+    (1, 49, 0),
+    (50, 100, 0),
+    (101, 500, 5),
+    (501, 1000, 5),
+    (1001, 1500, 5),
+    (1501, 2500, 9),
+    (2501, 3500, 9),
+    (3501, 5000, 9),
+    (5001, 7500, 11),
+    (7501, 10000, 11),
+    (10001, 15000, 11),
+    (15001, 20000, 11),
+    (20001, 25000, 13),
+    (25001, 30000, 13),
+    (30001, 35000, 13),
+    (35001, 40000, 13),
+    (40001, 45000, 13),
+    (45001, 50000, 13),
+    (50001, 70000, 13),
+    (70001, 250000, 13),
+])
+
+B2B_TARIFF_2024 = TariffTable("b2b", "2024", [
+    (1, 49, 2),
+    (50, 100, 3),
+    (101, 500, 8),
+    (501, 1000, 13),
+    (1001, 1500, 18),
+    (1501, 2500, 25),
+    (2501, 3500, 30),
+    (3501, 5000, 39),
+    (5001, 7500, 48),
+    (7501, 10000, 54),
+    (10001, 15000, 63),
+    (15001, 20000, 68),
+    (20001, 25000, 74),
+    (25001, 30000, 79),
+    (30001, 35000, 90),
+    (35001, 40000, 106),
+    (40001, 45000, 110),
+    (45001, 50000, 115),
+    (50001, 70000, 115),
+    (70001, 150000, 115),
+    (150001, 250000, 115),
+    (250001, 500000, 115),
+    (500001, 1000000, 115),
+    (1000001, 3000000, 115),
+    (3000001, 5000000, 115),
+    (5000001, 20000000, 115),
+    (20000001, 50000000, 115),
+])
+
+# kind -> versions sorted by effective date
+_schedules: Dict[str, List[Tuple[date, TariffTable]]] = {
+    "b2c": [(date.min, B2C_TARIFF_2024)],
+    "b2b": [(date.min, B2B_TARIFF_2024)],
+}
+# kind -> effective dates of _schedules[kind], kept in step by register_tariff
+_effective_dates: Dict[str, Tuple[date, ...]] = {
+    kind: tuple(v[0] for v in versions) for kind, versions in _schedules.items()
+}
+
+
+def register_tariff(kind: str, table: TariffTable, effective_from: date):
+    """
+    Add a tariff version; it applies to amounts charged on or after `effective_from`.
+    """
+    versions = [v for v in _schedules.get(kind, []) if v[0] != effective_from]
+    versions.append((effective_from, table))
+    versions.sort(key=lambda v: v[0])
+    _schedules[kind] = versions
+    _effective_dates[kind] = tuple(v[0] for v in versions)
+
+
+def get_tariff(kind: str, at: Optional[date] = None) -> TariffTable:
+    versions = _schedules.get(kind)
+    if not versions:
+        raise KeyError(f"Unknown tariff kind: {kind}")
+
+    at = at or date.today()
+    i = bisect_right(_effective_dates[kind], at)
+    return versions[max(i - 1, 0)][1]
+
+
+def load_tariffs(path: str):
+    """
+    Register every tariff version found in a JSON file (see module docstring).
+    """
+    with open(path) as f:
+        data = json.load(f)
+
+    for kind, versions in data.items():
+        for entry in versions:
+            table = TariffTable(kind, str(entry["version"]), entry["bands"])
+            effective_from = datetime.strptime(entry["effective_from"], "%Y-%m-%d").date()
+            register_tariff(kind, table, effective_from)
+            logger.info(f"Loaded {kind} tariff {table.version} effective {effective_from}")
+
+
+def get_b2c_business_charge(amount) -> Optional[int]:
+    return get_tariff("b2c").charge_for(amount)
+
+
+def get_b2b_business_charge(amount) -> Optional[int]:
+    return get_tariff("b2b").charge_for(amount)
+
+
+def charges_for(amounts: Iterable, kind: str = "b2c", at: Optional[date] = None) -> List[Optional[int]]:
+    """
+    Charges for many amounts against one tariff version (batch payouts, reporting).
+    """
+    return get_tariff(kind, at).charges_for(amounts)
+
+
+if os.getenv("TARIFF_TABLES_PATH"):
+    load_tariffs(os.getenv("TARIFF_TABLES_PATH"))
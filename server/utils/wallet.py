@@ -1,9 +1,19 @@
-from models import db, Transaction, Ledger, Tenant, Platform_wallet
+from models import db, Transaction, Ledger, Tenant, Platform_wallet, PendingWalletCredit, PlatformFeeEntry, TenantWalletStats
 import uuid
 from datetime import datetime
+from sqlalchemy import and_, insert, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from decimal import Decimal as decimal
-from typing import Optional
+from utils.tariffs import get_b2c_business_charge
+
+PLATFORM_FEE_RATE = decimal("1.5") / decimal("100")
+
+STAT_COLUMNS = (
+    "credit_total", "debit_total", "charge_total",
+    "credit_count", "debit_count", "charge_count",
+)
+
 
 class WalletService:
 
@@ -26,6 +36,24 @@ class WalletService:
         try:
             amount = decimal(amount)
 
+            # Claim the transaction first: a retried task conflicts on
+            # uq_transaction_tenant_ref_charges and stops before taking any lock
+            txn = WalletService.claim_transaction(
+                transaction_ref=transaction_ref,
+                tenant_id=tenant_id,
+                amount=amount,
+                account_no=account_no,
+                gateway=gateway,
+                type=txn_type,
+                status=status,
+                payment_link_id=payment_link_id,
+                recieving_mpesa_number=mpesa_account_number,
+                recieving_b2b_account=b2b_account
+            )
+            if txn is None:
+                db.session.rollback()
+                return None, None
+
             # Lock tenant row to prevent concurrent updates
             tenant = (
                 db.session.query(Tenant)
@@ -36,13 +64,11 @@ class WalletService:
             if not tenant:
                 raise ValueError("Tenant not found")
 
-            # Fetch last ledger entry
-            last_ledger = (
-                db.session.query(Ledger)
-                .order_by(Ledger.created_at.desc())
-                .first()
-            )
+            # Fetch this tenant's last ledger entry (served by idx_ledger_tenant_sequence);
+            # the tenant row lock above serializes sequence allocation per tenant
+            last_ledger = WalletService.last_ledger_entry(tenant_id)
             previous_balance = last_ledger.balance if last_ledger else decimal("0.00")
+            sequence = last_ledger.sequence if last_ledger and last_ledger.sequence else 0
 
             new_balance = previous_balance
             charge_amount = decimal("0.00")
@@ -50,24 +76,14 @@ class WalletService:
             # Compute new balance
             if status == "success":
                 if txn_type == "credit":
-                    # fetch or create the platform wallet
-                    platform_wallet = db.session.query(Platform_wallet).first()
-                    if not platform_wallet:
-                        platform_wallet = Platform_wallet(amount=0)
-                        db.session.add(platform_wallet)
-                        db.session.flush()  # make sure it has an ID
-
                    # calculate fee and net amount
-                    platform_fee = (decimal("1.5") / decimal("100")) * amount
+                    platform_fee = PLATFORM_FEE_RATE * amount
                     net_amount = amount - platform_fee
 
                     # update balances
-                    platform_wallet.amount += platform_fee
+                    WalletService.add_platform_fee(platform_fee, tenant_id, transaction_ref)
                     tenant.wallet_balance += net_amount
-                    new_balance += net_amount   
-
-
-                    db.session.commit()
+                    new_balance += net_amount
                 elif txn_type == "debit":
                     # Deduct amount
                     if previous_balance < amount:
@@ -76,7 +92,7 @@ class WalletService:
                     tenant.wallet_balance -= amount
 
                     # Check for business charge
-                    charge_val = get_b2c_business_charge(float(amount))
+                    charge_val = get_b2c_business_charge(amount)
                     if charge_val:
                         charge_amount = decimal(charge_val)
                         if new_balance < charge_amount:
@@ -104,8 +120,11 @@ class WalletService:
                         db.session.add(charge_txn)
 
                         # Ledger for charge
+                        sequence += 1
                         charge_ledger = Ledger(
                             id=uuid.uuid4(),
+                            tenant_id=tenant_id,
+                            sequence=sequence,
                             gateway=gateway,
                             amount=charge_amount,
                             balance=new_balance,
@@ -118,29 +137,26 @@ class WalletService:
                 else:
                     raise ValueError("Invalid txn_type")
 
-            db.session.add(tenant)
+            # running totals count every transaction row, like the totals they replace
+            if txn_type == "credit":
+                WalletService.record_stats(tenant_id, credit_total=amount, credit_count=1)
+            elif txn_type == "debit":
+                WalletService.record_stats(
+                    tenant_id,
+                    debit_total=amount,
+                    debit_count=1,
+                    charge_total=charge_amount,
+                    charge_count=1 if charge_amount else 0,
+                )
 
-            # Create main transaction
-            txn = Transaction(
-                id=uuid.uuid4(),
-                transaction_ref=transaction_ref,
-                tenant_id=tenant_id,
-                amount=amount,
-                account_no=account_no,
-                gateway=gateway,
-                type=txn_type,
-                status=status,
-                created_at=datetime.utcnow(),
-                payment_link_id=payment_link_id,
-                charges=False,
-                recieving_mpesa_number=mpesa_account_number,
-                recieving_b2b_account=b2b_account
-            )
-            db.session.add(txn)
+            db.session.add(tenant)
 
             # Create main ledger entry
+            sequence += 1
             ledger = Ledger(
                 id=uuid.uuid4(),
+                tenant_id=tenant_id,
+                sequence=sequence,
                 gateway=gateway,
                 amount=amount,
                 balance=new_balance,
@@ -150,6 +166,7 @@ class WalletService:
             )
             db.session.add(ledger)
 
+            # Single commit: transaction, balances, fee and ledger land together
             db.session.commit()
             return txn, ledger
 
@@ -157,33 +174,295 @@ class WalletService:
             db.session.rollback()
             raise e
 
+    @staticmethod
+    def claim_transaction(transaction_ref, tenant_id, **values):
+        """
+        Insert the main (non-charge) transaction row unless it already exists.
+        Returns the new Transaction, or None when the ref was already posted.
+        """
+        stmt = (
+            pg_insert(Transaction)
+            .values(
+                id=uuid.uuid4(),
+                transaction_ref=transaction_ref,
+                tenant_id=tenant_id,
+                charges=False,
+                created_at=datetime.utcnow(),
+                **values
+            )
+            .on_conflict_do_nothing(constraint="uq_transaction_tenant_ref_charges")
+            .returning(Transaction)
+        )
+        return db.session.scalars(stmt).first()
+
+    @staticmethod
+    def stage_credit(
+        tenant_id,
+        amount,
+        transaction_ref,
+        gateway="mpesa",
+        account_no=None,
+        payment_link_id=None
+    ):
+        """
+        Queue a successful credit for the batched posting task.
+        Re-staging the same transaction_ref for a tenant is a no-op.
+        """
+        stmt = (
+            pg_insert(PendingWalletCredit)
+            .values(
+                id=uuid.uuid4(),
+                tenant_id=tenant_id,
+                amount=decimal(amount),
+                transaction_ref=transaction_ref,
+                gateway=gateway,
+                account_no=account_no,
+                payment_link_id=payment_link_id,
+                created_at=datetime.utcnow(),
+            )
+            .on_conflict_do_nothing(constraint="uq_pending_wallet_credits_tenant_ref")
+        )
+        try:
+            db.session.execute(stmt)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
 
-def get_b2c_business_charge(amount: float) -> Optional[int]:
-    tariff_table = [
-        (1, 49, 0),
-        (50, 100, 0),
-        (101, 500, 5),
-        (501, 1000, 5),
-        (1001, 1500, 5),
-        (1501, 2500, 9),
-        (2501, 3500, 9),
-        (3501, 5000, 9),
-        (5001, 7500, 11),
-        (7501, 10000, 11),
-        (10001, 15000, 11),
-        (15001, 20000, 11),
-        (20001, 25000, 13),
-        (25001, 30000, 13),
-        (30001, 35000, 13),
-        (35001, 40000, 13),
-        (40001, 45000, 13),
-        (45001, 50000, 13),
-        (50001, 70000, 13),
-        (70001, 250000, 13),
-    ]
-
-    for min_amt, max_amt, business_charge in tariff_table:
-        if min_amt <= amount <= max_amt:
-            return business_charge
-
-    return None  # Out of range
+    @staticmethod
+    def post_credit_batch(tenant_id, max_batch):
+        """
+        Apply up to `max_batch` staged credits for a tenant under a single
+        tenant lock, one platform fee entry and one commit.
+        Returns (posted_count, has_more).
+        """
+        try:
+            tenant = (
+                db.session.query(Tenant)
+                .filter(Tenant.id == tenant_id)
+                .with_for_update()
+                .one_or_none()
+            )
+            if not tenant:
+                raise ValueError("Tenant not found")
+
+            pending = (
+                db.session.query(PendingWalletCredit)
+                .filter(PendingWalletCredit.tenant_id == tenant_id)
+                .order_by(PendingWalletCredit.created_at)
+                .with_for_update(skip_locked=True)
+                .limit(max_batch + 1)
+                .all()
+            )
+            has_more = len(pending) > max_batch
+            pending = pending[:max_batch]
+            if not pending:
+                db.session.rollback()
+                return 0, False
+
+            now = datetime.utcnow()
+            txn_ids = {credit.id: uuid.uuid4() for credit in pending}
+            txn_rows = [
+                {
+                    "id": txn_ids[credit.id],
+                    "transaction_ref": credit.transaction_ref,
+                    "tenant_id": tenant_id,
+                    "amount": credit.amount,
+                    "account_no": credit.account_no,
+                    "gateway": credit.gateway,
+                    "type": "credit",
+                    "status": "success",
+                    "created_at": now,
+                    "payment_link_id": credit.payment_link_id,
+                    "charges": False,
+                }
+                for credit in pending
+            ]
+
+            # Claim all transactions in one statement; refs that were already
+            # posted (e.g. through the unbatched path) are skipped below
+            claimed = set(db.session.scalars(
+                pg_insert(Transaction)
+                .values(txn_rows)
+                .on_conflict_do_nothing(constraint="uq_transaction_tenant_ref_charges")
+                .returning(Transaction.id)
+            ).all())
+
+            last_ledger = WalletService.last_ledger_entry(tenant_id)
+            balance = last_ledger.balance if last_ledger else decimal("0.00")
+            sequence = last_ledger.sequence if last_ledger and last_ledger.sequence else 0
+
+            total_fee = decimal("0.00")
+            total_net = decimal("0.00")
+            total_amount = decimal("0.00")
+            ledger_rows = []
+
+            for credit in pending:
+                txn_id = txn_ids[credit.id]
+                if txn_id not in claimed:
+                    continue
+
+                amount = decimal(credit.amount)
+                platform_fee = PLATFORM_FEE_RATE * amount
+                net_amount = amount - platform_fee
+                total_fee += platform_fee
+                total_net += net_amount
+                total_amount += amount
+                balance += net_amount
+                sequence += 1
+
+                ledger_rows.append({
+                    "id": uuid.uuid4(),
+                    "tenant_id": tenant_id,
+                    "sequence": sequence,
+                    "gateway": credit.gateway,
+                    "amount": amount,
+                    "balance": balance,
+                    "type": "credit",
+                    "transaction_id": txn_id,
+                    "created_at": now,
+                })
+
+            if ledger_rows:
+                WalletService.add_platform_fee(total_fee, tenant_id)
+                WalletService.record_stats(tenant_id, credit_total=total_amount, credit_count=len(ledger_rows))
+                tenant.wallet_balance += total_net
+                db.session.execute(insert(Ledger), ledger_rows)
+
+            db.session.query(PendingWalletCredit).filter(
+                PendingWalletCredit.id.in_([credit.id for credit in pending])
+            ).delete(synchronize_session=False)
+
+            db.session.commit()
+            return len(ledger_rows), has_more
+
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def record_stats(tenant_id, **increments):
+        """
+        Add to the tenant's TenantWalletStats totals inside the caller's
+        transaction (callers hold the tenant row lock).
+        """
+        values = {name: increments.get(name, 0) for name in STAT_COLUMNS}
+        stmt = pg_insert(TenantWalletStats).values(tenant_id=tenant_id, updated_at=datetime.utcnow(), **values)
+        updates = {name: getattr(TenantWalletStats, name) + getattr(stmt.excluded, name) for name in STAT_COLUMNS}
+        updates["updated_at"] = stmt.excluded.updated_at
+        db.session.execute(stmt.on_conflict_do_update(index_elements=["tenant_id"], set_=updates))
+
+    @staticmethod
+    def reconcile_stats(tenant_id):
+        """
+        Recompute a tenant's totals from its transactions and overwrite the
+        stats row. Returns {column: (stored, actual)} for any drift.
+        """
+        try:
+            # same lock as posting, so no transaction lands mid-count
+            tenant = (
+                db.session.query(Tenant)
+                .filter(Tenant.id == tenant_id)
+                .with_for_update()
+                .one_or_none()
+            )
+            if not tenant:
+                db.session.rollback()
+                return {}
+
+            credit = Transaction.type == "credit"
+            debit = and_(Transaction.type == "debit", Transaction.charges.isnot(True))
+            charge = and_(Transaction.type == "debit", Transaction.charges.is_(True))
+            actual = db.session.query(
+                func.coalesce(func.sum(Transaction.amount).filter(credit), 0),
+                func.coalesce(func.sum(Transaction.amount).filter(debit), 0),
+                func.coalesce(func.sum(Transaction.amount).filter(charge), 0),
+                func.count().filter(credit),
+                func.count().filter(debit),
+                func.count().filter(charge),
+            ).filter(Transaction.tenant_id == tenant_id).one()
+
+            stats = db.session.get(TenantWalletStats, tenant.id)
+            if stats is None:
+                stats = TenantWalletStats(tenant_id=tenant.id)
+                db.session.add(stats)
+
+            drift = {}
+            for name, value in zip(STAT_COLUMNS, actual):
+                stored = getattr(stats, name) or 0
+                if stored != value:
+                    drift[name] = (str(stored), str(value))
+                setattr(stats, name, value)
+            stats.reconciled_at = datetime.utcnow()
+
+            db.session.commit()
+            return drift
+
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def add_platform_fee(platform_fee, tenant_id=None, transaction_ref=None):
+        """
+        Record a platform fee inside the caller's transaction. Fees are
+        appended rather than added to the Platform_wallet row, so credits
+        for different tenants never wait on each other.
+        """
+        db.session.add(PlatformFeeEntry(
+            id=uuid.uuid4(),
+            tenant_id=tenant_id,
+            transaction_ref=transaction_ref,
+            amount=platform_fee,
+            created_at=datetime.utcnow(),
+        ))
+
+    @staticmethod
+    def platform_balance():
+        """
+        Compacted platform wallet amount plus fees not yet compacted.
+        """
+        compacted = db.session.query(func.coalesce(func.sum(Platform_wallet.amount), 0)).scalar()
+        pending = db.session.query(func.coalesce(func.sum(PlatformFeeEntry.amount), 0)).scalar()
+        return decimal(compacted) + decimal(pending)
+
+    @staticmethod
+    def compact_platform_fees():
+        """
+        Fold appended fee entries into the Platform_wallet row.
+        Returns the amount moved.
+        """
+        try:
+            platform_wallet = db.session.query(Platform_wallet).with_for_update().first()
+            if not platform_wallet:
+                platform_wallet = Platform_wallet(amount=0)
+                db.session.add(platform_wallet)
+                db.session.flush()  # make sure it has an ID
+
+            # delete + sum in one statement so rows inserted meanwhile are left for the next run
+            moved = db.session.execute(
+                text(
+                    "WITH moved AS (DELETE FROM platform_fee_entries RETURNING amount) "
+                    "SELECT COALESCE(SUM(amount), 0) FROM moved"
+                )
+            ).scalar()
+
+            platform_wallet.amount += decimal(moved)
+            db.session.commit()
+            return decimal(moved)
+
+        except Exception as e:
+            db.session.rollback()
+            raise e
+
+    @staticmethod
+    def last_ledger_entry(tenant_id):
+        """
+        Latest ledger row for a tenant, looked up on (tenant_id, sequence).
+        """
+        return (
+            db.session.query(Ledger)
+            .filter(Ledger.tenant_id == tenant_id, Ledger.sequence.isnot(None))
+            .order_by(Ledger.sequence.desc())
+            .first()
+        )
@@ -0,0 +1,149 @@
+"""
+Batched consumer for ingested M-Pesa callbacks.
+
+    python -m workers.callback_consumer
+
+Reads the callback ingest stream (see utils.callback_ingest) through a
+consumer group and hands each batch to the callback pipeline
+(workers/callback_pipeline.py), which applies every status change and
+records its follow-up tasks in the outbox with a single commit. Entries are
+acked only once that commit has landed, so a crash or broker outage before
+it leaves them pending for redelivery, and nothing acked can lose its
+follow-ups. If a batch fails to commit the callbacks are retried one by one so a single bad
+entry cannot hold up the rest; entries that still fail stay pending and are
+reclaimed from dead or stuck consumers after CALLBACK_INGEST_CLAIM_IDLE.
+
+Status changes go through the conditional transitions in
+utils.payment_state, so a redelivered entry or a repeated callback for a
+record that is already settled is acked without running follow-up work.
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import time
+
+from flask import current_app
+from redis.exceptions import ResponseError
+
+from models import db
+from utils.callback_ingest import CALLBACK_GROUP, CALLBACK_STREAM_KEY
+from workers.callback_pipeline import NOT_FOUND, parse_callback, process_callbacks
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_MS = 1000
+
+
+class CallbackConsumer:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get("CALLBACK_INGEST_BATCH_SIZE", 200)
+        self.claim_idle = app.config.get("CALLBACK_INGEST_CLAIM_IDLE", 60)
+        self.name = f"{socket.gethostname()}-{os.getpid()}"
+        self._next_claim = 0
+        self._stopping = False
+
+    def run(self):
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._stop)
+
+        with self.app.app_context():
+            r = current_app.redis
+            self._create_group(r)
+            logger.info(f"Callback consumer {self.name} started")
+            while not self._stopping:
+                entries = self._reclaim(r) or self._read(r)
+                if not entries:
+                    continue
+                try:
+                    self._process(r, entries)
+                finally:
+                    db.session.remove()
+        logger.info(f"Callback consumer {self.name} stopped")
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _create_group(self, r):
+        try:
+            r.xgroup_create(CALLBACK_STREAM_KEY, CALLBACK_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _read(self, r):
+        result = r.xreadgroup(
+            CALLBACK_GROUP, self.name, {CALLBACK_STREAM_KEY: ">"},
+            count=self.batch_size, block=READ_BLOCK_MS,
+        )
+        return result[0][1] if result else []
+
+    def _reclaim(self, r):
+        """
+        Take over entries another consumer read but never acked.
+        """
+        if time.monotonic() < self._next_claim:
+            return []
+        self._next_claim = time.monotonic() + self.claim_idle
+        result = r.xautoclaim(
+            CALLBACK_STREAM_KEY, CALLBACK_GROUP, self.name,
+            min_idle_time=int(self.claim_idle * 1000), start_id="0-0", count=self.batch_size,
+        )
+        entries = result[1]
+        if entries:
+            logger.warning(f"Reclaimed {len(entries)} unacked callbacks")
+        return entries
+
+    def _process(self, r, entries):
+        events = []
+        done = []
+        for entry_id, fields in entries:
+            try:
+                event = parse_callback(
+                    fields["kind"], fields["tenant_id"], fields["record_id"], json.loads(fields["body"])
+                )
+            except (KeyError, TypeError, ValueError):
+                logger.error(f"Dropping malformed callback entry {entry_id}")
+                done.append(entry_id)
+                continue
+            events.append((entry_id, event))
+
+        try:
+            done.extend(self._apply(events))
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Callback batch of {len(events)} failed, applying one by one: {e}")
+            for entry_id, event in events:
+                try:
+                    done.extend(self._apply([(entry_id, event)]))
+                except Exception as e:
+                    db.session.rollback()
+                    logger.exception(f"Callback {entry_id} for {event.record_id} failed, left pending: {e}")
+
+        # only entries whose status change and follow-ups are committed
+        if done:
+            pipe = r.pipeline()
+            pipe.xack(CALLBACK_STREAM_KEY, CALLBACK_GROUP, *done)
+            pipe.xdel(CALLBACK_STREAM_KEY, *done)
+            pipe.execute()
+
+    def _apply(self, events):
+        """
+        Apply a batch of callbacks with one commit; returns the entry ids
+        that are finished with. Raises, leaving the entries unacked, if the
+        status changes and their outbox messages were not committed.
+        """
+        outcomes = process_callbacks([event for _, event in events])
+        for (entry_id, event), outcome in zip(events, outcomes):
+            if outcome == NOT_FOUND:
+                logger.warning(f"Callback {entry_id}: {event.kind} record {event.record_id} not found")
+        return [entry_id for entry_id, _ in events]
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    CallbackConsumer(app).run()
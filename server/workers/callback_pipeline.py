@@ -0,0 +1,296 @@
+"""
+Shared processing pipeline for M-Pesa callbacks.
+
+Each callback body is parsed once into a CallbackEvent. process_callbacks()
+then settles a batch of events against the database with one conditional
+UPDATE ... RETURNING per record type and target status (the transitions in
+utils.payment_state), and records the wallet posting and webhook tasks of
+every winning transition in the outbox (workers/outbox.py) in the same
+commit. After the commit it refreshes the status cache, tells checkout
+pages, and publishes the recorded tasks.
+
+Used inline by the callback resources and in batches by the callback
+consumer (workers/callback_consumer.py).
+"""
+import logging
+import uuid
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, select, update
+
+from models import ApiCollection, ApiDisbursement, db
+from utils.callback_ingest import STK_CALLBACK
+from utils.payment_state import COMPLETED, FAILED, TRANSITIONS
+from utils.status_cache import COLLECTION, DISBURSEMENT, cache_status
+from utils.subscribe_manager import push_to_queue
+from workers.outbox import add_task, publish_outbox
+from workers.send_webhook import send_webhook
+from workers.wallet_logger import logg_wallet
+
+logger = logging.getLogger(__name__)
+
+# process_callbacks() outcomes
+APPLIED = "applied"
+DUPLICATE = "duplicate"
+NOT_FOUND = "not_found"
+
+
+class CallbackEvent(NamedTuple):
+    kind: str  # STK_CALLBACK, B2C_CALLBACK or B2B_CALLBACK
+    tenant_id: str
+    record_id: str
+    success: bool
+    dedupe_key: Optional[str]  # CheckoutRequestID / ConversationID
+    transaction_ref: Optional[str] = None
+    amount: Optional[Decimal] = None
+    phone_number: Optional[str] = None
+    remarks: Optional[str] = None
+
+
+def parse_callback(kind, tenant_id, record_id, body):
+    """
+    Parse an stkCallback (STK) or Result (B2C/B2B) body into a
+    CallbackEvent. Raises ValueError for malformed callbacks.
+    """
+    if not isinstance(body, dict) or "ResultCode" not in body:
+        raise ValueError("callback has no ResultCode")
+    record_id = str(uuid.UUID(str(record_id)))
+    success = body.get("ResultCode") == 0
+
+    if kind != STK_CALLBACK:
+        return CallbackEvent(
+            kind, str(tenant_id), record_id, success,
+            dedupe_key=body.get("ConversationID"),
+            transaction_ref=body.get("TransactionID"),
+            remarks=body.get("ResultDesc"),
+        )
+
+    amount = None
+    transaction_ref = None
+    phone_number = None
+    if success:
+        metadata = body.get("CallbackMetadata", {}).get("Item", [])
+        parsed_metadata = {item["Name"]: item.get("Value") for item in metadata}
+        try:
+            amount = Decimal(str(parsed_metadata.get("Amount")))
+        except InvalidOperation:
+            raise ValueError("successful STK callback without an amount")
+        transaction_ref = parsed_metadata.get("MpesaReceiptNumber")
+        phone_number = parsed_metadata.get("PhoneNumber")
+
+    return CallbackEvent(
+        kind, str(tenant_id), record_id, success,
+        dedupe_key=body.get("CheckoutRequestID"),
+        transaction_ref=transaction_ref,
+        amount=amount,
+        phone_number=phone_number,
+        remarks=body.get("ResultDesc"),
+    )
+
+
+def _webhook(event, record, status, event_type, **extra):
+    return send_webhook.s(
+        tenant_id=event.tenant_id,
+        request_id=record.id,
+        status=status,
+        amount=float(record.amount if event.amount is None else event.amount),
+        request_ref=record.request_reference,
+        currency="KES",
+        created_at=record.updated_at,
+        event_type=event_type,
+        **extra
+    )
+
+
+def _checkout_event(event, record, status, **extra):
+    push_to_queue(str(record.id), dict({
+        "tenant_id": event.tenant_id,
+        "request_id": str(record.id),
+        "status": status,
+        "amount": float(record.amount if event.amount is None else event.amount),
+        "request_ref": record.request_reference,
+        "currency": "KES",
+        "created_at": record.updated_at.isoformat(),
+    }, **extra))
+
+
+def _collection_followups(event, api_collection):
+    if not event.success:
+        logger.info(f"STK Callback failed for collection {api_collection.id}: {event.remarks}")
+        if api_collection.payment_link_id is not None:
+            # the checkout page is told instead (_notify)
+            return []
+        return [_webhook(
+            event, api_collection, "failed", "COLLECTION",
+            remarks=event.remarks,
+            mpesa_number=api_collection.mpesa_number if api_collection.mpesa_number else None,
+        )]
+
+    logger.info(f"STK Callback successful for collection {api_collection.id}")
+    signatures = [logg_wallet.s(
+        tenant_id=event.tenant_id,
+        amount=float(event.amount),
+        transaction_ref=event.transaction_ref,
+        gateway="mpesa",
+        txn_type="credit",
+        account_no=event.phone_number,
+        payment_link_id=api_collection.payment_link_id,
+    )]
+    if api_collection.payment_link_id is None:
+        signatures.append(_webhook(
+            event, api_collection, "success", "COLLECTION", transaction_ref=event.transaction_ref
+        ))
+    return signatures
+
+
+def _disbursement_followups(event, api_disbursement):
+    accounts = {
+        "mpesa_account_number": api_disbursement.mpesa_number if api_disbursement.mpesa_number else None,
+        "b2b_account": api_disbursement.b2b_account if api_disbursement.b2b_account else None,
+    }
+    signatures = []
+
+    if event.success:
+        signatures.append(logg_wallet.s(
+            tenant_id=event.tenant_id,
+            amount=float(api_disbursement.amount),
+            transaction_ref=event.transaction_ref,
+            gateway="mpesa",
+            txn_type="debit",
+            **accounts
+        ))
+
+    # payouts are internal; refunds and API disbursements notify the tenant
+    if api_disbursement.payout is not True:
+        if event.success:
+            signatures.append(_webhook(
+                event, api_disbursement, "success", "DISBURSEMENT",
+                transaction_ref=event.transaction_ref, **accounts
+            ))
+        else:
+            signatures.append(_webhook(
+                event, api_disbursement, "failed", "DISBURSEMENT", remarks=event.remarks, **accounts
+            ))
+
+    outcome = "successful" if event.success else f"failed: {event.remarks}"
+    logger.info(f"Disbursement Callback {outcome} for disbursement {api_disbursement.id}")
+    return signatures
+
+
+def _notify(event, model, record):
+    """
+    Status cache and checkout page event; derived state, best effort.
+    """
+    if model is ApiDisbursement:
+        cache_status(DISBURSEMENT, record)
+        return
+
+    cache_status(COLLECTION, record)
+    if record.payment_link_id is not None:
+        if event.success:
+            _checkout_event(event, record, "success", transaction_ref=event.transaction_ref)
+        else:
+            # let the checkout page know instead of leaving it waiting
+            _checkout_event(event, record, "failed", remarks=event.remarks)
+
+
+FOLLOWUPS = {
+    ApiCollection: _collection_followups,
+    ApiDisbursement: _disbursement_followups,
+}
+
+
+def _model(event):
+    return ApiCollection if event.kind == STK_CALLBACK else ApiDisbursement
+
+
+def _settle(model, to_status, events):
+    """
+    One conditional UPDATE ... RETURNING for every event of a model moving
+    to the same status (not committed). Returns the updated rows by id.
+    """
+    table = model.__table__
+    ids = {uuid.UUID(event.record_id) for event in events}
+    values = {"status": to_status}
+    if model is ApiCollection:
+        # the first callback of a record is the one that wins below
+        checkout_ids = {}
+        for event in events:
+            if event.dedupe_key:
+                checkout_ids.setdefault(uuid.UUID(event.record_id), event.dedupe_key)
+        if checkout_ids:
+            values["mpesa_checkout_request_id"] = case(
+                checkout_ids, value=table.c.id, else_=table.c.mpesa_checkout_request_id
+            )
+    result = db.session.execute(
+        update(table)
+        .where(table.c.id.in_(ids), table.c.status.in_(TRANSITIONS[to_status]))
+        .values(**values)
+        .returning(*table.c)
+    )
+    return {str(row.id): row for row in result}
+
+
+def process_callbacks(events):
+    """
+    Settle a batch of callback events with one UPDATE per record type and
+    target status, and record their follow-up tasks in the outbox in the
+    same commit. Returns an outcome per event (APPLIED, DUPLICATE or
+    NOT_FOUND). Raises if the commit fails, leaving nothing applied; once it
+    returns, the follow-ups are durable even if publishing them fails.
+    """
+    batches = {}
+    for event in events:
+        to_status = COMPLETED if event.success else FAILED
+        batches.setdefault((_model(event), to_status), []).append(event)
+
+    settled = {}
+    for (model, to_status), batch in batches.items():
+        for record_id, row in _settle(model, to_status, batch).items():
+            settled[(model, to_status, record_id)] = row
+
+    outcomes = []
+    winners = []
+    losers = {}
+    for event in events:
+        model = _model(event)
+        row = settled.pop((model, COMPLETED if event.success else FAILED, event.record_id), None)
+        if row is None:
+            outcomes.append(None)
+            losers.setdefault(model, set()).add(uuid.UUID(event.record_id))
+        else:
+            outcomes.append(APPLIED)
+            winners.append((event, model, row))
+
+    # a lost transition is a duplicate unless the record does not exist
+    existing = set()
+    for model, ids in losers.items():
+        existing.update(
+            (model, str(record_id))
+            for (record_id,) in db.session.execute(select(model.id).where(model.id.in_(ids)))
+        )
+    outcomes = [
+        outcome or (DUPLICATE if (_model(event), event.record_id) in existing else NOT_FOUND)
+        for event, outcome in zip(events, outcomes)
+    ]
+
+    message_ids = [
+        add_task(signature)
+        for event, model, row in winners
+        for signature in FOLLOWUPS[model](event, row)
+    ]
+    db.session.commit()
+
+    for event, model, row in winners:
+        try:
+            _notify(event, model, row)
+        except Exception as e:
+            logger.exception(f"Status notification for {event.kind} callback on {event.record_id} failed: {e}")
+    try:
+        publish_outbox(message_ids)
+    except Exception as e:
+        # the messages are committed; the publish_outbox beat task sends them
+        db.session.rollback()
+        logger.warning(f"Deferred {len(message_ids)} callback tasks to the outbox sweep: {e}")
+    return outcomes
@@ -4,6 +4,7 @@ import logging
 from dotenv import load_dotenv
 from models import ApiCollection, db, ApiDisbursement
 import requests
+from urllib3.exceptions import NewConnectionError
 import base64
 import re
 from datetime import datetime
@@ -12,21 +13,20 @@ from flask import current_app
 import os
 
 from celery_app import celery
+from utils.mpesa_auth import get_mpesa_auth_token, refresh_if_expiring
+from utils.mpesa_client import B2B_PATH, B2C_PATH, STK_PUSH_PATH, get_mpesa_client
+from utils.mpesa_rate_limit import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, RateLimitTimeout
+from utils.payment_state import FAILED, INITIATED, PENDING, PROCESSING, transition
+from utils.status_cache import COLLECTION, DISBURSEMENT, cache_status
 load_dotenv()
 
 # M-Pesa API credentials (loaded from .env file)
 MPESA_SHORTCODE = os.getenv("MPESA_SHORTCODE")
-B2C_URL = "https://api.safaricom.co.ke/mpesa/b2c/v3/paymentrequest"
-B2B_URL = "https://api.safaricom.co.ke/mpesa/b2b/v1/paymentrequest"
 MPESA_PASSKEY = os.getenv("MPESA_PASSKEY")
-MPESA_CONSUMER_KEY = os.getenv("MPESA_CONSUMER_KEY")
-MPESA_CONSUMER_SECRET = os.getenv("MPESA_CONSUMER_SECRET")
 INITIATOR_NAME = os.getenv("INITIATOR_NAME")
 SECURITY_CREDENTIAL = os.getenv("SECURITY_CREDENTIAL")
 
 # URLs
-MPESA_URL = "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-MPESA_AUTH_URL = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
 API_BASE_URL = os.getenv("API_BASE_URL", "https://rhtr3fc9-5000.uks1.devtunnels.ms")
 
 logger = logging.getLogger(__name__)
@@ -46,28 +46,8 @@ def initiate_payment(self, api_collection_id):
             logger.error(f"ApiCollection with ID {api_collection_id} not found.")
             return
 
-        phone_number = api_collection.mpesa_number
-        tenant_name = api_collection.tenant.name if api_collection.tenant else "Unknown"
-        amount = api_collection.amount
-        tenant_id = api_collection.tenant_id
-        call_back_url = f"{API_BASE_URL}/payment/mpesa/call_back/{tenant_id}/{api_collection_id}"
-
-        if not phone_number or not amount:
-            logger.error(f"Missing phone number or amount for ApiCollection {api_collection_id}.")
-            return
-
-        def format_phone_number(number):
-            digits = re.sub(r'\D', '', number)
-            if re.match(r'^254\d{9}$', digits):
-                return digits
-            if re.match(r'^0[17]\d{8}$', digits):
-                return '254' + digits[1:]
-            logger.warning(f"Invalid phone number format: {number}")
-            return None
-
-        formatted_number = format_phone_number(phone_number)
-        if not formatted_number:
-            logger.error(f"Failed to format phone number: {phone_number}")
+        payload = build_stk_payload(api_collection)
+        if not payload:
             return
 
         auth_token = get_mpesa_auth_token()
@@ -75,63 +55,120 @@ def initiate_payment(self, api_collection_id):
             logger.error("Failed to get M-Pesa authorization token.")
             return
 
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        combined_string = f"{MPESA_SHORTCODE}{MPESA_PASSKEY}{timestamp}"
-        password = base64.b64encode(combined_string.encode()).decode()
-
-        payload = {
-            "BusinessShortCode": MPESA_SHORTCODE,
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": str(int(amount)),
-            "PartyA": formatted_number,
-            "PartyB": MPESA_SHORTCODE,
-            "PhoneNumber": formatted_number,
-            "CallBackURL": call_back_url,
-            "AccountReference": tenant_name,
-            "TransactionDesc": "Wallet Funding"
-        }
-
         try:
-            response = requests.post(MPESA_URL, headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}, json=payload)
+            response = get_mpesa_client().post(STK_PUSH_PATH, headers={"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}, json=payload, priority=PRIORITY_HIGH)
             response_data = response.json()
             if response.status_code == 200:
-                api_collection.mpesa_checkout_request_id = response_data.get("CheckoutRequestID")
-                api_collection.status = "initiated"
+                # a fast callback may already have settled the collection
+                transition(
+                    ApiCollection, api_collection.id, INITIATED,
+                    mpesa_checkout_request_id=response_data.get("CheckoutRequestID"),
+                )
                 db.session.commit()
+                cache_status(COLLECTION, api_collection)
                 logger.info(f"Payment request {api_collection_id} successfully initiated: {response_data}")
             else:
                 logger.error(f"Failed to initiate payment for {api_collection_id}: {response_data}")
+        except RateLimitTimeout as e:
+            # not sent; try again once the bucket has drained
+            logger.warning(f"Payment request {api_collection_id} deferred: {e}")
+            raise self.retry(exc=e)
         except Exception as e:
             db.session.rollback()
             logger.exception(f"Error initiating payment for {api_collection_id}: {e}")
 
 
-def get_mpesa_auth_token():
-    auth = base64.b64encode(f"{MPESA_CONSUMER_KEY}:{MPESA_CONSUMER_SECRET}".encode("utf-8")).decode("utf-8")
-    headers = {"Authorization": f"Basic {auth}"}
-    try:
-        response = requests.get(MPESA_AUTH_URL, headers=headers)
-        if response.status_code == 200:
-            return response.json().get("access_token")
-        logger.error(f"Failed to get auth token, status code: {response.status_code}, response: {response.text}")
+def format_phone_number(number):
+    digits = re.sub(r'\D', '', number)
+    if re.match(r'^254\d{9}$', digits):
+        return digits
+    if re.match(r'^0[17]\d{8}$', digits):
+        return '254' + digits[1:]
+    logger.warning(f"Invalid phone number format: {number}")
+    return None
+
+
+def build_stk_payload(api_collection):
+    """
+    STK push request body for a collection, or None if it cannot be sent.
+    Shared by the Celery task and the asyncio dispatcher.
+    """
+    api_collection_id = api_collection.id
+    phone_number = api_collection.mpesa_number
+    tenant_name = api_collection.tenant.name if api_collection.tenant else "Unknown"
+    amount = api_collection.amount
+    tenant_id = api_collection.tenant_id
+    call_back_url = f"{API_BASE_URL}/payment/mpesa/call_back/{tenant_id}/{api_collection_id}"
+
+    if not phone_number or not amount:
+        logger.error(f"Missing phone number or amount for ApiCollection {api_collection_id}.")
         return None
-    except Exception as e:
-        logger.exception(f"Exception while fetching auth token: {e}")
+
+    formatted_number = format_phone_number(phone_number)
+    if not formatted_number:
+        logger.error(f"Failed to format phone number: {phone_number}")
         return None
 
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    combined_string = f"{MPESA_SHORTCODE}{MPESA_PASSKEY}{timestamp}"
+    password = base64.b64encode(combined_string.encode()).decode()
+
+    return {
+        "BusinessShortCode": MPESA_SHORTCODE,
+        "Password": password,
+        "Timestamp": timestamp,
+        "TransactionType": "CustomerPayBillOnline",
+        "Amount": str(int(amount)),
+        "PartyA": formatted_number,
+        "PartyB": MPESA_SHORTCODE,
+        "PhoneNumber": formatted_number,
+        "CallBackURL": call_back_url,
+        "AccountReference": tenant_name,
+        "TransactionDesc": "Wallet Funding"
+    }
+
+
+@celery.task(bind=True, name="workers.refresh_mpesa_token")
+def refresh_mpesa_token(self):
+    """
+    Refresh the shared OAuth token ahead of expiry (Celery beat).
+    """
+    with current_app.app_context():
+        if refresh_if_expiring():
+            logger.info("M-Pesa auth token refreshed ahead of expiry")
+
+
+
 
+def _release_disbursement(api_disbursement_id):
+    """
+    Hand a claimed disbursement back (processing -> pending) when nothing
+    was sent, so a retry or payout re-run can send it.
+    """
+    transition(ApiDisbursement, api_disbursement_id, PENDING)
+    db.session.commit()
+
+
+def _not_sent(error):
+    """
+    True if a Daraja request failed before it reached Safaricom.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
 
 
 @celery.task(bind=True, name="workers.disbursment_initiate", max_retries=3, default_retry_delay=30)
 def initiate_disbursement(self, api_disbursement_id):
     logger.info(f"Initiating disbursement for request {api_disbursement_id}")
+    claimed = False
+    sent = False
     try:
         with current_app.app_context():
-            api_disbursement = ApiDisbursement.query.get(api_disbursement_id)
-            if not api_disbursement:
-                logger.error(f"ApiDisbursement with ID {api_disbursement_id} not found.")
+            api_disbursement = db.session.get(ApiDisbursement, api_disbursement_id)
+            if not api_disbursement or api_disbursement.status != PENDING:
+                logger.warning(f"ApiDisbursement {api_disbursement_id} not found, already sent or being sent.")
                 return
             
             amount = api_disbursement.amount
@@ -146,15 +183,6 @@ def initiate_disbursement(self, api_disbursement_id):
                     logger.error(f"Missing phone number or amount for ApiDisbursement {api_disbursement_id}.")
                     return
 
-                def format_phone_number(number):
-                    digits = re.sub(r'\D', '', number)
-                    if re.match(r'^254\d{9}$', digits):
-                        return digits
-                    if re.match(r'^0[17]\d{8}$', digits):
-                        return '254' + digits[1:]
-                    logger.warning(f"Invalid phone number format: {number}")
-                    return None
-
                 formatted_number = format_phone_number(phone_number)
                 if not formatted_number:
                     logger.error(f"Failed to format phone number: {phone_number}")
@@ -179,17 +207,6 @@ def initiate_disbursement(self, api_disbursement_id):
             result_url_b2b = f"{API_BASE_URL}/payment/mpesa/disburse_call_back_b2b/{tenant_id}/{api_disbursement_id}/result"
             timeout_url_b2b = f"{API_BASE_URL}/payment/mpesa/disburse_call_back_b2b/{tenant_id}/{api_disbursement_id}/timeout"
 
-            # Get auth token
-            auth_token = get_mpesa_auth_token()
-            if not auth_token:
-                logger.error("Failed to get M-Pesa authorization token.")
-                return
-
-            headers = {
-                "Authorization": f"Bearer {auth_token}",
-                "Content-Type": "application/json"
-            }
-            
             # Build payload based on disbursement type
             if disbursement_type == "B2C":
                 payload = {
@@ -205,7 +222,7 @@ def initiate_disbursement(self, api_disbursement_id):
                     "ResultURL": result_url_b2c,
                     "Occasion": "Payment"
                 }
-                api_url = B2C_URL
+                api_path = B2C_PATH
                 
             else:  # B2B
                 payload = {
@@ -222,43 +239,90 @@ def initiate_disbursement(self, api_disbursement_id):
                     "QueueTimeOutURL": timeout_url_b2b,
                     "ResultURL": result_url_b2b
                 }
-                api_url = B2B_URL
+                api_path = B2B_PATH
+
+            # scheduled payouts yield to customer-facing traffic
+            priority = PRIORITY_LOW if api_disbursement.payout else PRIORITY_NORMAL
+
+            # Claim the row and commit before any network I/O: a disbursement
+            # queued twice (e.g. by a payout re-run) is only ever sent once, and
+            # no row lock or pooled connection is held while Daraja is called
+            claimed = transition(ApiDisbursement, api_disbursement_id, PROCESSING)
+            db.session.commit()
+            if not claimed:
+                logger.warning(f"ApiDisbursement {api_disbursement_id} already sent or being sent.")
+                return
+
+            # Get auth token
+            auth_token = get_mpesa_auth_token()
+            if not auth_token:
+                logger.error("Failed to get M-Pesa authorization token.")
+                _release_disbursement(api_disbursement_id)
+                return
+
+            headers = {
+                "Authorization": f"Bearer {auth_token}",
+                "Content-Type": "application/json"
+            }
 
             # Make the request
             logger.info(f"Sending {disbursement_type} request with payload: {payload}")
-            response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+            sent = True
+            response = get_mpesa_client().post(api_path, headers=headers, json=payload, priority=priority)
             
             try:
                 response_data = response.json()
                 logger.info(f"M-Pesa response: {response_data}")
                 
                 if response.status_code == 200 and response_data.get("ResponseCode") == "0":
-                    api_disbursement.status = "initiated"
-                    api_disbursement.mpesa_conversation_id = response_data.get("ConversationID")
-                    api_disbursement.mpesa_originator_conversation_id = response_data.get("OriginatorConversationID")
+                    transition(ApiDisbursement, api_disbursement_id, INITIATED)
                     db.session.commit()
+                    cache_status(DISBURSEMENT, api_disbursement)
                     logger.info(f"Disbursement {api_disbursement_id} successfully initiated")
                 else:
                     error_msg = response_data.get("errorMessage") or response_data.get("ResponseDescription", "Unknown error")
                     logger.error(f"Failed to initiate disbursement {api_disbursement_id}: {error_msg}")
-                    api_disbursement.status = "failed"
-                    api_disbursement.error_message = error_msg
+                    transition(ApiDisbursement, api_disbursement_id, FAILED, remarks=error_msg[:255])
                     db.session.commit()
+                    cache_status(DISBURSEMENT, api_disbursement)
                     
             except ValueError as json_error:
                 logger.error(f"Invalid JSON response: {response.text}")
-                api_disbursement.status = "failed"
-                api_disbursement.error_message = f"Invalid response from M-Pesa: {response.text}"
+                transition(
+                    ApiDisbursement, api_disbursement_id, FAILED,
+                    remarks=f"Invalid response from M-Pesa: {response.text}"[:255],
+                )
                 db.session.commit()
+                cache_status(DISBURSEMENT, api_disbursement)
                 
+    except RateLimitTimeout as e:
+        # raised before the request went out
+        db.session.rollback()
+        if claimed:
+            _release_disbursement(api_disbursement_id)
+        logger.warning(f"Disbursement {api_disbursement_id} deferred: {e}")
+        raise self.retry(exc=e)
+
     except requests.exceptions.RequestException as e:
         db.session.rollback()
+        if claimed and not _not_sent(e):
+            # Safaricom may have accepted it; its result callback settles the
+            # row, and sending it again could pay out twice
+            logger.exception(f"Disbursement {api_disbursement_id} may have been sent, left {PROCESSING}: {e}")
+            return
         logger.exception(f"Network error initiating disbursement for {api_disbursement_id}: {e}")
+        if claimed:
+            _release_disbursement(api_disbursement_id)
         self.retry(exc=e, countdown=2 ** self.request.retries)
         
     except Exception as e:
         db.session.rollback()
+        if sent:
+            logger.exception(f"Error recording disbursement {api_disbursement_id}, left {PROCESSING}: {e}")
+            return
         logger.exception(f"Error initiating disbursement for {api_disbursement_id}: {e}")
+        if claimed:
+            _release_disbursement(api_disbursement_id)
         self.retry(exc=e, countdown=2 ** self.request.retries)
 
 
@@ -266,63 +330,129 @@ import logging
 from dotenv import load_dotenv
 from datetime import datetime
 from flask import current_app
-from sqlalchemy.orm import joinedload
-from models import Tenant, ApiDisbursement, db
+from sqlalchemy import and_, case, cast, func, literal, select, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import Tenant, TenantConfig, ApiDisbursement, db
+from celery import group
 from celery_app import celery
 from workers.initiate_mpesa import initiate_disbursement
 from decimal import Decimal
-from typing import Optional
+from utils.tariffs import get_tariff
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+PAYOUT_MIN_BALANCE = Decimal(10)
+
+
+def create_payout_disbursements(tenant_ids=None, run_date=None):
+    """
+    Create today's payout disbursement for every eligible tenant in one
+    INSERT ... SELECT and return the ids of all of today's payouts that are
+    still pending.
+
+    Eligibility and the M-Pesa charge are worked out in SQL. The request
+    reference is PAYOUT-<tenant>-<YYYYMMDD>, so running this again on the
+    same day inserts nothing new and nothing is paid out twice, while the
+    payouts an earlier run created but failed to queue are returned again.
+    """
+    run_date = run_date or datetime.utcnow().date()
+
+    mpesa_number = TenantConfig.payment_method["mpesa_number"].as_string()
+    b2b_raw = TenantConfig.payment_method["b2b_account"].as_string()
+    has_mpesa = and_(mpesa_number.isnot(None), mpesa_number != "")
+    has_b2b = and_(b2b_raw.isnot(None), b2b_raw.notin_(["", "{}"]))
+
+    balance = Tenant.wallet_balance
+    charge = case(
+        (has_b2b, get_tariff("b2b", run_date).sql_charge(balance)),
+        else_=get_tariff("b2c", run_date).sql_charge(balance),
+    )
+    amount = (balance - charge).label("amount")
+
+    eligible = (
+        select(
+            func.gen_random_uuid(),
+            Tenant.id,
+            func.concat("PAYOUT-", cast(Tenant.id, String), "-", run_date.strftime("%Y%m%d")),
+            case((has_mpesa, mpesa_number), else_=None),
+            case((has_b2b, TenantConfig.payment_method["b2b_account"]), else_=None),
+            amount,
+            literal(True),
+            literal("KES"),
+            literal("pending"),
+            func.now(),
+            func.now(),
+        )
+        .select_from(Tenant)
+        .join(TenantConfig, TenantConfig.tenant_id == Tenant.id)
+        .where(
+            Tenant.wallet_balance > PAYOUT_MIN_BALANCE,
+            Tenant.email.isnot(None),
+            TenantConfig.payment_method.isnot(None),
+            TenantConfig.auto_payout.is_(True),
+            has_mpesa | has_b2b,
+            balance - charge > 0,
+        )
+    )
+    if tenant_ids is not None:
+        eligible = eligible.where(Tenant.id.in_(tenant_ids))
+
+    stmt = (
+        pg_insert(ApiDisbursement)
+        .from_select(
+            [
+                "id", "tenant_id", "request_reference", "mpesa_number", "b2b_account",
+                "amount", "payout", "currency", "status", "created_at", "updated_at",
+            ],
+            eligible,
+        )
+        .on_conflict_do_nothing(index_elements=["tenant_id", "request_reference"])
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+    pending = select(ApiDisbursement.id).where(
+        ApiDisbursement.payout.is_(True),
+        ApiDisbursement.status == PENDING,
+        ApiDisbursement.request_reference.like(f"PAYOUT-%-{run_date.strftime('%Y%m%d')}"),
+    )
+    if tenant_ids is not None:
+        pending = pending.where(ApiDisbursement.tenant_id.in_(tenant_ids))
+    return [str(row_id) for row_id in db.session.execute(pending).scalars()]
+
+
+def enqueue_disbursements(disbursement_ids, batch_size=None):
+    """
+    Publish initiate_disbursement tasks in groups, one broker round trip per
+    batch instead of one per tenant. Each disbursement stays its own task so
+    a failed payout retries on its own.
+    """
+    batch_size = batch_size or current_app.config.get("PAYOUT_ENQUEUE_BATCH_SIZE", 500)
+    for i in range(0, len(disbursement_ids), batch_size):
+        batch = disbursement_ids[i:i + batch_size]
+        group(initiate_disbursement.s(disbursement_id) for disbursement_id in batch).apply_async()
+
 
 @celery.task(bind=True, name="workers.schedule_billing", max_retries=3, default_retry_delay=30)
 def schedule_billing(self):
     """
     Weekly billing scheduler — runs every Friday via Celery Beat.
-    Gathers all tenants with valid configs and queues payouts.
+    Creates payouts for all eligible tenants in one statement and queues them.
     """
     logger.info("🔁 Initiating weekly billing schedule")
     try:
         with current_app.app_context():
-            tenants = (
-                db.session.query(Tenant)
-                .options(joinedload(Tenant.configs))
-                .filter(
-                    Tenant.configs.any(),
-                    Tenant.wallet_balance > Decimal(10),
-                    Tenant.email.isnot(None)
-                )
-            .all()
-            )
-
-            valid_tenants = []
-            for tenant in tenants:
-                config = tenant.configs[0] if tenant.configs else None
-                if not config or not config.payment_method:
-                    logger.warning(f"⚠️ Skipping tenant {tenant.id} — missing config or payment method")
-                    continue
-                if not config.auto_payout:
-                    logger.info(f"ℹ️ Skipping tenant {tenant.id} — auto_payout disabled")
-                    continue
-
-                valid_tenants.append(tenant.id)
-
-            # Batch process in groups (optional)
-            batch_size = 30
-            for i in range(0, len(valid_tenants), batch_size):
-                batch = valid_tenants[i:i + batch_size]
-                handle_payouts.delay(batch)
-
-            logger.info(f"✅ Scheduled {len(valid_tenants)} tenants for payout processing")
+            disbursement_ids = create_payout_disbursements()
+            enqueue_disbursements(disbursement_ids)
+            logger.info(f"✅ Scheduled {len(disbursement_ids)} tenants for payout processing")
 
     except Exception as exc:
+        db.session.rollback()
         logger.exception(f"❌ Error in schedule_billing: {exc}")
         raise self.retry(exc=exc)
 
 
-
 @celery.task(bind=True, name="workers.handle_payouts", max_retries=3, default_retry_delay=30)
 def handle_payouts(self, tenant_ids):
     """
@@ -331,133 +461,11 @@ def handle_payouts(self, tenant_ids):
     logger.info(f"💸 Initiating payouts for batch: {tenant_ids}")
     try:
         with current_app.app_context():
-            tenants = (
-                db.session.query(Tenant)
-                .options(joinedload(Tenant.configs))
-                .filter(Tenant.id.in_(tenant_ids))
-                .all()
-            )
-
-            for tenant in tenants:
-                amount = tenant.wallet_balance
-                if not amount or amount <= 0:
-                    logger.info(f"Skipping tenant {tenant.id} — not available wallet balance")
-                    continue
-
-                currency = "KES"
-                request_ref = f"PAYOUT-{tenant.id}-{int(datetime.utcnow().timestamp())}"
-                config = tenant.configs[0] if tenant.configs else None
-                if not config or not config.payment_method:
-                    logger.warning(f"⚠️ Skipping tenant {tenant.id} — missing config")
-                    continue
-
-                payment_method = config.payment_method
-                mpesa_number = payment_method.get("mpesa_number")
-                b2b_account = payment_method.get("b2b_account")
-
-                if not mpesa_number and not b2b_account:
-                    logger.warning(f"⚠️ Skipping tenant {tenant.id} — no valid payment method")
-                    continue
-
-                if b2b_account:
-                    charge_val = get_b2b_business_charge(float(amount)) or 0
-                else:
-                    charge_val = get_b2c_business_charge(float(amount)) or 0
-
-                total_deduction = amount - Decimal(charge_val)
-
-
-                disbursement = ApiDisbursement(
-                    tenant_id=tenant.id,
-                    amount=total_deduction,
-                    currency=currency,
-                    request_reference=request_ref,
-                    mpesa_number=mpesa_number,
-                    b2b_account=b2b_account,
-                    payout=True,
-                    status="pending"
-                )
-
-                try:
-                    db.session.add(disbursement)
-                    db.session.commit()
-                except Exception as e:
-                    db.session.rollback()
-                    logger.error(f"❌ Failed to create payment request for tenant {tenant.id}: {e}")
-                    continue
-
-                # Trigger async disbursement
-                initiate_disbursement.delay(disbursement.id)
-                logger.info(f"✅ Initiated disbursement for tenant {tenant.id}")
+            disbursement_ids = create_payout_disbursements(tenant_ids)
+            enqueue_disbursements(disbursement_ids)
+            logger.info(f"✅ Initiated {len(disbursement_ids)} disbursements")
 
     except Exception as exc:
+        db.session.rollback()
         logger.exception(f"❌ Unexpected error in handle_payouts: {exc}")
         raise self.retry(exc=exc)
-
-def get_b2c_business_charge(amount: float) -> Optional[int]:
-    tariff_table = [
-        (1, 49, 0),
-        (50, 100, 0),
-        (101, 500, 5),
-        (501, 1000, 5),
-        (1001, 1500, 5),
-        (1501, 2500, 9),
-        (2501, 3500, 9),
-        (3501, 5000, 9),
-        (5001, 7500, 11),
-        (7501, 10000, 11),
-        (10001, 15000, 11),
-        (15001, 20000, 11),
-        (20001, 25000, 13),
-        (25001, 30000, 13),
-        (30001, 35000, 13),
-        (35001, 40000, 13),
-        (40001, 45000, 13),
-        (45001, 50000, 13),
-        (50001, 70000, 13),
-        (70001, 250000, 13),
-    ]
-
-    for min_amt, max_amt, business_charge in tariff_table:
-        if min_amt <= amount <= max_amt:
-            return business_charge
-
-    return None  # Out of range
-    
-
-def get_b2b_business_charge(amount: float) -> Optional[int]:
-    tariff_table = [
-        (1, 49, 2),
-        (50, 100, 3),
-        (101, 500, 8),
-        (501, 1000, 13),
-        (1001, 1500, 18),
-        (1501, 2500, 25),
-        (2501, 3500, 30),
-        (3501, 5000, 39),
-        (5001, 7500, 48),
-        (7501, 10000, 54),
-        (10001, 15000, 63),
-        (15001, 20000, 68),
-        (20001, 25000, 74),
-        (25001, 30000, 79),
-        (30001, 35000, 90),
-        (35001, 40000, 106),
-        (40001, 45000, 110),
-        (45001, 50000, 115),
-        (50001, 70000, 115),
-        (70001, 150000, 115),
-        (150001, 250000, 115),
-        (250001, 500000, 115),
-        (500001, 1000000, 115),
-        (1000001, 3000000, 115),
-        (3000001, 5000000, 115),
-        (5000001, 20000000, 115),
-        (20000001, 50000000, 115),
-    ]
-
-    for min_amt, max_amt, business_charge in tariff_table:
-        if min_amt <= amount <= max_amt:
-            return business_charge
-
-    return None  # Out of range
@@ -0,0 +1,92 @@
+"""
+Transactional outbox for Celery follow-up tasks.
+
+Code that changes a payment's state and needs tasks to run because of it
+(wallet posting, webhooks) records them with add_task() in the same session,
+so the state change and its follow-ups commit or roll back together. After
+the commit the caller publishes its own messages right away with
+publish_outbox(); anything left behind because the broker was unreachable is
+picked up by the publish_outbox beat task.
+
+Publishing is at-least-once: a message is deleted only after it was handed
+to the broker, so a crash in between sends it again. Wallet posting claims
+its transaction reference and ignores the repeat; a webhook may then be
+delivered twice, which receivers already have to tolerate.
+"""
+import logging
+import uuid
+
+from celery import group
+from flask import current_app
+from kombu.utils.json import dumps, loads
+
+from celery_app import celery
+from models import OutboxMessage, db
+
+logger = logging.getLogger(__name__)
+
+
+def add_task(signature):
+    """
+    Record a task signature (e.g. send_webhook.s(...)) in the current
+    session, not committed; the rows are inserted together at commit.
+    Returns the message id.
+    """
+    message = OutboxMessage(id=uuid.uuid4(), task=signature.task, kwargs=dumps(dict(signature.kwargs)))
+    db.session.add(message)
+    return message.id
+
+
+def publish_outbox(message_ids=None, limit=500):
+    """
+    Send recorded tasks to the broker as one group, over one producer
+    connection, and delete them; only `message_ids` if given, otherwise the
+    oldest `limit`. Messages locked by another publisher are skipped.
+    Returns the number published. On a broker error every message is kept
+    for the next run, including any the broker already took.
+    """
+    query = OutboxMessage.query
+    if message_ids is not None:
+        if not message_ids:
+            return 0
+        query = query.filter(OutboxMessage.id.in_(message_ids))
+    messages = (
+        query.order_by(OutboxMessage.created_at)
+        .with_for_update(skip_locked=True)
+        .limit(limit)
+        .all()
+    )
+
+    if not messages:
+        db.session.commit()
+        return 0
+
+    try:
+        group(celery.signature(message.task, kwargs=loads(message.kwargs)) for message in messages).apply_async()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Outbox publish of {len(messages)} messages failed: {e}")
+        return 0
+
+    OutboxMessage.query.filter(
+        OutboxMessage.id.in_([message.id for message in messages])
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return len(messages)
+
+
+@celery.task(bind=True, name="workers.publish_outbox", max_retries=3, default_retry_delay=30)
+def publish_outbox_task(self):
+    """
+    Periodic (Celery beat) sweep for messages whose immediate publish failed.
+    """
+    try:
+        with current_app.app_context():
+            published = publish_outbox()
+            if published:
+                logger.warning(f"Published {published} outbox messages left behind")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to publish outbox: {e}")
+        raise self.retry(exc=e)
@@ -5,6 +5,7 @@ from celery_app import celery
 from models import db, Tenant, TenantConfig
 from decimal import Decimal
 from flask import current_app
+from workers.webhook_engine import get_webhook_secret, queue_webhook, sign_webhook
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +17,96 @@ def serialize_tenant(tenant, config):
         "config": {
             "account_no": config.account_no,
             "link_id": config.link_id,
-            "callback_url": config.api_callback_url
+            "callback_url": config.api_callback_url,
+            "webhook_batching": bool(config.webhook_batching)
         }
     }
 
+def get_tenant_webhook_data(tenant_id):
+    """
+    Serialized tenant + config (cached under tenant:<id>), or None.
+    """
+    cache = current_app.cache
+
+    cached = cache.get(f"tenant:{tenant_id}") if tenant_id else None
+    if cached:
+        return json.loads(cached)
+
+    result = (
+        db.session.query(Tenant, TenantConfig)
+        .join(TenantConfig)
+        .filter(Tenant.id == tenant_id)
+        .first()
+    )
+    if not result:
+        return None
+
+    tenant, config = result
+    tenant_data = serialize_tenant(tenant, config)
+
+    # Save to cache
+    cache.set(f"tenant:{tenant_id}", json.dumps(tenant_data), timeout=3600)
+    return tenant_data
+
+
+def build_webhook_payload(
+    tenant_id,
+    request_id,
+    status,
+    amount,
+    request_ref,
+    currency,
+    transaction_ref=None,
+    remarks=None,
+    created_at=None,
+    event_type="COLLECTION",
+    mpesa_account_number=None,
+    b2b_account=None,
+    mpesa_number=None
+):
+    # --- BASE PAYLOAD ---
+    webhook_payload = {
+        "event_type": event_type.upper(),   # <---- include type
+        "tenant_id": str(tenant_id),
+        "request_id": str(request_id),
+        "status": status,
+        "amount": str(amount) if isinstance(amount, Decimal) else amount,
+        "request_ref": str(request_ref),
+        "currency": currency,
+        "created_at": created_at.isoformat() if hasattr(created_at, "isoformat") else created_at,
+    }
+
+    # --- CONDITIONAL FIELDS ---
+    if event_type.upper() == "COLLECTION":
+        if status.upper() == "FAILED":
+            webhook_payload["remarks"] = remarks or "Collection failed"
+        elif status.upper() == "SUCCESS":
+            webhook_payload["transaction_ref"] = transaction_ref
+            mpesa_number = mpesa_number if mpesa_number else None
+            webhook_payload["mpesa_number"] = mpesa_number
+    elif event_type.upper() == "DISBURSEMENT":
+        if status.upper() == "FAILED":
+            webhook_payload["remarks"] = remarks or "Disbursement failed"
+        elif status.upper() == "SUCCESS":
+            webhook_payload["transaction_ref"] = transaction_ref
+            mpesa_account_number = mpesa_account_number if mpesa_account_number else None
+            b2b_account = b2b_account if b2b_account else None
+            webhook_payload["mpesa_account_number"] = mpesa_account_number
+            webhook_payload["b2b_account"] = b2b_account
+            # you can also add destination account details if available
+            # webhook_payload["to_account"] = "..." 
+
+    elif event_type.upper() == "PAYOUT":
+        if status.upper() == "FAILED":
+            webhook_payload["remarks"] = remarks or "Payout failed"
+        elif status.upper() == "SUCCESS":
+            webhook_payload["transaction_ref"] = transaction_ref
+            webhook_payload["mpesa_account_number"] = mpesa_account_number
+            webhook_payload["b2b_account"] = b2b_account
+
+    return webhook_payload
+
+
 @celery.task(bind=True, name="workers.send_webhook", max_retries=3, default_retry_delay=30)
 def send_webhook(
     self,
@@ -39,79 +126,45 @@ def send_webhook(
 ):
     """
     Celery task to send webhook (collection or disbursement) to tenant.
+    With WEBHOOK_ENGINE_ENABLED the delivery itself is handed to the
+    webhook engine (workers/webhook_engine.py).
     """
     try:
         with current_app.app_context():
-            cache = current_app.cache
-
-            # --- CACHE CHECK ---
-            cached = cache.get(f"tenant:{tenant_id}") if tenant_id else None
-            if cached:
-                tenant_data = json.loads(cached)
-            else:
-                result = (
-                    db.session.query(Tenant, TenantConfig)
-                    .join(TenantConfig)
-                    .filter(Tenant.id == tenant_id)
-                    .first()
-                )
-                if not result:
-                    logger.warning(f"Tenant {tenant_id} not found in DB")
-                    return {"error": "Tenant not found"}, 404
-
-                tenant, config = result
-                tenant_data = serialize_tenant(tenant, config)
-
-                # Save to cache
-                cache.set(f"tenant:{tenant_id}", json.dumps(tenant_data), timeout=3600)
-
-        # --- BASE PAYLOAD ---
-        webhook_payload = {
-            "event_type": event_type.upper(),   # <---- include type
-            "tenant_id": str(tenant_id),
-            "request_id": str(request_id),
-            "status": status,
-            "amount": str(amount) if isinstance(amount, Decimal) else amount,
-            "request_ref": str(request_ref),
-            "currency": currency,
-            "created_at": created_at.isoformat(),
-        }
+            tenant_data = get_tenant_webhook_data(tenant_id)
+            if not tenant_data:
+                logger.warning(f"Tenant {tenant_id} not found in DB")
+                return {"error": "Tenant not found"}, 404
+
+        webhook_payload = build_webhook_payload(
+            tenant_id, request_id, status, amount, request_ref, currency,
+            transaction_ref=transaction_ref,
+            remarks=remarks,
+            created_at=created_at,
+            event_type=event_type,
+            mpesa_account_number=mpesa_account_number,
+            b2b_account=b2b_account,
+            mpesa_number=mpesa_number,
+        )
 
-        # --- CONDITIONAL FIELDS ---
-        if event_type.upper() == "COLLECTION":
-            if status.upper() == "FAILED":
-                webhook_payload["remarks"] = remarks or "Collection failed"
-            elif status.upper() == "SUCCESS":
-                webhook_payload["transaction_ref"] = transaction_ref
-                mpesa_number = mpesa_number if mpesa_number else None
-                webhook_payload["mpesa_number"] = mpesa_number
-        elif event_type.upper() == "DISBURSEMENT":
-            if status.upper() == "FAILED":
-                webhook_payload["remarks"] = remarks or "Disbursement failed"
-            elif status.upper() == "SUCCESS":
-                webhook_payload["transaction_ref"] = transaction_ref
-                mpesa_account_number = mpesa_account_number if mpesa_account_number else None
-                b2b_account = b2b_account if b2b_account else None
-                webhook_payload["mpesa_account_number"] = mpesa_account_number
-                webhook_payload["b2b_account"] = b2b_account
-                # you can also add destination account details if available
-                # webhook_payload["to_account"] = "..." 
-
-        elif event_type.upper() == "PAYOUT":
-            if status.upper() == "FAILED":
-                webhook_payload["remarks"] = remarks or "Payout failed"
-            elif status.upper() == "SUCCESS":
-                webhook_payload["transaction_ref"] = transaction_ref
-                webhook_payload["mpesa_account_number"] = mpesa_account_number
-                webhook_payload["b2b_account"] = b2b_account
-                
         callback_url = tenant_data["config"].get("callback_url")
         if not callback_url:
             logger.info(f"No callback_url configured for tenant {tenant_id}")
             return {"message": "No callback URL configured"}, 200
 
+        if current_app.config.get("WEBHOOK_ENGINE_ENABLED"):
+            batched = bool(tenant_data["config"].get("webhook_batching"))
+            queue_webhook(tenant_id, callback_url, webhook_payload, batched=batched)
+            return {"message": f"{event_type} webhook queued"}, 202
+
         # --- SEND WEBHOOK ---
-        resp = requests.post(callback_url, json=webhook_payload, timeout=10)
+        body = json.dumps(webhook_payload)
+        headers = {"Content-Type": "application/json"}
+        with current_app.app_context():
+            secret = get_webhook_secret(tenant_id)
+        if secret:
+            headers["X-Webhook-Signature"] = sign_webhook(secret, body)
+        resp = requests.post(callback_url, data=body, headers=headers, timeout=10)
         resp.raise_for_status()
 
         logger.info(
@@ -0,0 +1,246 @@
+"""
+Asyncio STK push dispatcher.
+
+Runs as its own process and keeps hundreds of STK requests in flight on one
+event loop instead of blocking one Celery worker per request:
+
+    python -m workers.stk_dispatcher
+
+Collection ids are taken from the Redis list STK_QUEUE_KEY into this
+process's processing list (utils.reliable_queue), loaded and turned into
+payloads in a worker thread, sent concurrently with aiohttp (bounded by a
+semaphore per shortcode), and the resulting status updates are written
+back with one commit per batch. At most STK_DISPATCHER_MAX_BATCHES batches
+are in flight and ids are only taken when one can start, so a backlog
+stays on the queue for the other dispatchers instead of piling up behind
+this process's thread and database pools. Ids leave the processing list
+once their push was sent (or turned out not to be needed); a batch that
+fails before sending is put back on the queue, and the batches of a
+crashed dispatcher are restored by the others.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import ssl
+
+import aiohttp
+import redis.asyncio as aioredis
+from flask import current_app
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import joinedload
+
+from models import ApiCollection, db
+from utils.mpesa_auth import get_mpesa_auth_token
+from utils.mpesa_client import STK_PUSH_PATH
+from utils.mpesa_rate_limit import PRIORITY_HIGH, RateLimitTimeout, acquire_async
+from utils.payment_state import INITIATED, PENDING, TRANSITIONS
+from utils.reliable_queue import ReliableQueue
+from utils.status_cache import COLLECTION, invalidate_status
+from workers.initiate_mpesa import build_stk_payload, initiate_payment
+
+logger = logging.getLogger(__name__)
+
+STK_QUEUE_KEY = "stk:pending"
+HEARTBEAT_TTL = 30  # seconds without a heartbeat before a dispatcher's batches are restored
+RETRY_DELAY = 5  # seconds before a failed batch is put back
+
+# _send() result for a push that was not sent and should be tried again
+DEFERRED = object()
+
+
+def queue_stk_push(api_collection_id):
+    """
+    Hand a collection to the dispatcher, or to the Celery task when the
+    dispatcher is not enabled.
+    """
+    if current_app.config.get("STK_DISPATCHER_ENABLED"):
+        current_app.redis.rpush(STK_QUEUE_KEY, str(api_collection_id))
+    else:
+        initiate_payment.delay(api_collection_id)
+
+
+class StkDispatcher:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get("STK_DISPATCHER_BATCH_SIZE", 200)
+        self.concurrency = app.config.get("STK_DISPATCHER_CONCURRENCY", 100)
+        self.max_batches = app.config.get("STK_DISPATCHER_MAX_BATCHES", 4)
+        self._semaphores = {}
+        self._inflight = set()
+        self._slots = None
+        self._stopping = None
+        self._queue = None
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_batches)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        r = self._redis()
+        name = f"{socket.gethostname()}-{os.getpid()}"
+        self._queue = ReliableQueue(r, STK_QUEUE_KEY, name, heartbeat_ttl=HEARTBEAT_TTL)
+        await self._queue.heartbeat()
+        keeper = asyncio.create_task(self._keep_alive())
+
+        config = self.app.config
+        base_url = config.get("MPESA_BASE_URL", "https://api.safaricom.co.ke")
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=config.get("MPESA_CONNECT_TIMEOUT", 5), sock_read=config.get("MPESA_READ_TIMEOUT", 30)
+        )
+        connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+
+        async with aiohttp.ClientSession(base_url=base_url, timeout=timeout, connector=connector) as session:
+            logger.info(f"STK dispatcher {name} started")
+            while not self._stopping.is_set():
+                # only take ids when a batch can start on them
+                await self._slots.acquire()
+                ids = await self._queue.take(self.batch_size, timeout=1)
+                if not ids:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._dispatch(session, ids))
+                self._inflight.add(task)
+                task.add_done_callback(self._done)
+
+            if self._inflight:
+                await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        keeper.cancel()
+        await self._queue.stop()
+        await r.aclose()
+        logger.info("STK dispatcher stopped")
+
+    def _done(self, task):
+        self._inflight.discard(task)
+        self._slots.release()
+
+    async def _keep_alive(self):
+        """
+        Heartbeat for this dispatcher, and restore the batches of dead ones.
+        """
+        while True:
+            try:
+                await self._queue.heartbeat()
+                await self._queue.reap()
+            except Exception as e:
+                logger.warning(f"STK dispatcher heartbeat failed: {e}")
+            await asyncio.sleep(HEARTBEAT_TTL / 3)
+
+    def _redis(self):
+        url = self.app.config["CACHE_REDIS_URL"]
+        kwargs = {"decode_responses": True}
+        if url.startswith("rediss://"):
+            kwargs["ssl_cert_reqs"] = ssl.CERT_NONE
+        return aioredis.Redis.from_url(url, **kwargs)
+
+    async def _dispatch(self, session, ids):
+        loop = asyncio.get_running_loop()
+        try:
+            payloads = await loop.run_in_executor(None, self._load_payloads, ids)
+            results = []
+            if payloads:
+                auth_token = await loop.run_in_executor(None, self._auth_token)
+                if not auth_token:
+                    raise RuntimeError("Failed to get M-Pesa authorization token")
+
+                results = await asyncio.gather(*[
+                    self._send(session, auth_token, collection_id, payload)
+                    for collection_id, payload in payloads
+                ])
+        except Exception as e:
+            logger.exception(f"STK dispatch failed for batch of {len(ids)}, requeueing: {e}")
+            await asyncio.sleep(RETRY_DELAY)
+            await self._queue.requeue(ids)
+            return
+
+        # sent pushes are done with even if recording them fails: resending
+        # would prompt the customer twice, and their callback settles the
+        # collection either way
+        await loop.run_in_executor(None, self._write_results, [r for r in results if isinstance(r, dict)])
+        deferred = [
+            str(collection_id)
+            for (collection_id, _), result in zip(payloads, results)
+            if result is DEFERRED
+        ]
+        await self._queue.requeue(deferred)
+        await self._queue.ack([collection_id for collection_id in ids if collection_id not in deferred])
+
+    def _load_payloads(self, ids):
+        with self.app.app_context():
+            collections = (
+                ApiCollection.query
+                .options(joinedload(ApiCollection.tenant))
+                .filter(ApiCollection.id.in_(ids), ApiCollection.status == PENDING)
+                .all()
+            )
+            payloads = []
+            for api_collection in collections:
+                payload = build_stk_payload(api_collection)
+                if payload:
+                    payloads.append((api_collection.id, payload))
+            db.session.remove()
+            return payloads
+
+    def _auth_token(self):
+        with self.app.app_context():
+            return get_mpesa_auth_token()
+
+    def _semaphore(self, shortcode):
+        if shortcode not in self._semaphores:
+            self._semaphores[shortcode] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[shortcode]
+
+    async def _send(self, session, auth_token, collection_id, payload):
+        headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
+        async with self._semaphore(payload["BusinessShortCode"]):
+            try:
+                await acquire_async("stk", self._queue.r, self.app.config, priority=PRIORITY_HIGH)
+                async with session.post(STK_PUSH_PATH, json=payload, headers=headers) as response:
+                    response_data = await response.json(content_type=None)
+                    if response.status == 200:
+                        logger.info(f"Payment request {collection_id} successfully initiated: {response_data}")
+                        return {
+                            "collection_id": collection_id,
+                            "checkout_request_id": response_data.get("CheckoutRequestID"),
+                        }
+                    logger.error(f"Failed to initiate payment for {collection_id}: {response_data}")
+            except RateLimitTimeout as e:
+                # not sent; put it back for a later batch
+                logger.warning(f"Payment request {collection_id} deferred: {e}")
+                return DEFERRED
+            except Exception as e:
+                logger.exception(f"Error initiating payment for {collection_id}: {e}")
+        return None
+
+    def _write_results(self, results):
+        if not results:
+            return
+        with self.app.app_context():
+            # conditional on the current status, so a callback that beat the
+            # write is not overwritten
+            table = ApiCollection.__table__
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("collection_id"), table.c.status.in_(TRANSITIONS[INITIATED]))
+                .values(status=INITIATED, mpesa_checkout_request_id=bindparam("checkout_request_id"))
+            )
+            try:
+                db.session.execute(stmt, results)
+                db.session.commit()
+                invalidate_status(COLLECTION, [str(result["collection_id"]) for result in results])
+            except Exception as e:
+                db.session.rollback()
+                logger.exception(f"Failed to record {len(results)} STK results: {e}")
+            finally:
+                db.session.remove()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(StkDispatcher(app).run())
@@ -1,7 +1,8 @@
 import logging
 from celery_app import celery
-from models import db
+from models import db, Tenant, PendingWalletCredit
 from utils.wallet import WalletService
+from datetime import datetime, timedelta
 from decimal import Decimal
 from flask import current_app
 
@@ -14,10 +15,24 @@ def logg_wallet(self, tenant_id, amount, transaction_ref, gateway="mpesa", txn_t
     """
     try:
         with current_app.app_context():
-            
+
             # Ensure amount is Decimal
             amount = Decimal(amount)
 
+            # Credits can be coalesced per tenant by the batched poster
+            if txn_type == "credit" and current_app.config.get("WALLET_BATCH_POSTING"):
+                WalletService.stage_credit(
+                    tenant_id=tenant_id,
+                    amount=amount,
+                    transaction_ref=transaction_ref,
+                    gateway=gateway,
+                    account_no=account_no,
+                    payment_link_id=payment_link_id
+                )
+                schedule_wallet_batch(tenant_id)
+                logger.info(f"Wallet credit staged for batch posting: txn_ref={transaction_ref}, tenant_id={tenant_id}")
+                return
+
             # Log transaction via WalletService
             txn, ledger = WalletService.log_transaction(
                 tenant_id=tenant_id,
@@ -31,9 +46,129 @@ def logg_wallet(self, tenant_id, amount, transaction_ref, gateway="mpesa", txn_t
                 b2b_account=b2b_account
             )
 
+            if txn is None:
+                logger.info(f"Wallet transaction already posted, skipping: txn_ref={transaction_ref}, tenant_id={tenant_id}")
+                return
+
             logger.info(f"Wallet transaction logged successfully: txn_id={txn.transaction_ref}, tenant_id={tenant_id}")
 
     except Exception as e:
         db.session.rollback()
         logger.exception(f"Failed to log wallet transaction for tenant {tenant_id}: {e}")
         raise self.retry(exc=e)
+
+
+def schedule_wallet_batch(tenant_id, countdown=None):
+    """
+    Make sure one drain task is pending for the tenant. The marker is cleared
+    when the drain starts, so credits staged after that schedule the next one.
+    """
+    config = current_app.config
+    delay = config.get("WALLET_BATCH_MAX_DELAY", 0.5) if countdown is None else countdown
+    marker = f"wallet:batch:{tenant_id}"
+
+    # marker outlives the countdown so a lost task cannot block a tenant for long
+    if current_app.redis.set(marker, 1, nx=True, ex=max(int(delay * 10), 60)):
+        try:
+            post_wallet_batch.apply_async(args=[str(tenant_id)], countdown=delay)
+        except Exception:
+            # nothing was scheduled; let the retry (or the sweep) try again
+            current_app.redis.delete(marker)
+            raise
+
+
+@celery.task(bind=True, name="workers.post_wallet_batch", max_retries=3, default_retry_delay=5)
+def post_wallet_batch(self, tenant_id):
+    """
+    Drain staged credits for a tenant in batches of WALLET_BATCH_MAX_SIZE.
+    """
+    try:
+        with current_app.app_context():
+            current_app.redis.delete(f"wallet:batch:{tenant_id}")
+
+            max_batch = current_app.config.get("WALLET_BATCH_MAX_SIZE", 200)
+            posted, has_more = WalletService.post_credit_batch(tenant_id, max_batch)
+            logger.info(f"Posted {posted} staged wallet credits for tenant {tenant_id}")
+
+            if has_more:
+                schedule_wallet_batch(tenant_id, countdown=0)
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to post wallet batch for tenant {tenant_id}: {e}")
+        raise self.retry(exc=e)
+
+
+@celery.task(bind=True, name="workers.sweep_wallet_batches", max_retries=3, default_retry_delay=30)
+def sweep_wallet_batches(self):
+    """
+    Periodic (Celery beat) drain of credits staged longer than
+    WALLET_BATCH_SWEEP_AGE, whose drain task was never published or ran out
+    of retries; otherwise they wait for the tenant's next credit.
+    """
+    try:
+        with current_app.app_context():
+            age = current_app.config.get("WALLET_BATCH_SWEEP_AGE", 10)
+            cutoff = datetime.utcnow() - timedelta(seconds=age)
+            tenant_ids = [
+                tenant_id for (tenant_id,) in
+                db.session.query(PendingWalletCredit.tenant_id)
+                .filter(PendingWalletCredit.created_at < cutoff)
+                .distinct()
+                .all()
+            ]
+            db.session.commit()
+
+            for tenant_id in tenant_ids:
+                schedule_wallet_batch(tenant_id, countdown=0)
+            if tenant_ids:
+                logger.warning(f"Scheduled stale wallet credit batches for {len(tenant_ids)} tenants")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to sweep wallet batches: {e}")
+        raise self.retry(exc=e)
+
+
+@celery.task(bind=True, name="workers.compact_platform_fees", max_retries=3, default_retry_delay=30)
+def compact_platform_fees(self):
+    """
+    Periodic (Celery beat) roll-up of platform fee entries into the platform wallet.
+    """
+    try:
+        with current_app.app_context():
+            moved = WalletService.compact_platform_fees()
+            logger.info(f"Compacted platform fees: {moved}")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to compact platform fees: {e}")
+        raise self.retry(exc=e)
+
+
+@celery.task(bind=True, name="workers.reconcile_wallet_stats", max_retries=3, default_retry_delay=300)
+def reconcile_wallet_stats(self):
+    """
+    Nightly (Celery beat) check of the running wallet totals against the
+    transactions; drifted totals are corrected and logged.
+    """
+    try:
+        with current_app.app_context():
+            tenant_ids = [tenant_id for (tenant_id,) in db.session.query(Tenant.id).all()]
+            corrected = 0
+            for tenant_id in tenant_ids:
+                try:
+                    drift = WalletService.reconcile_stats(tenant_id)
+                except Exception as e:
+                    logger.exception(f"Failed to reconcile wallet stats for tenant {tenant_id}: {e}")
+                    continue
+                if drift:
+                    corrected += 1
+                    logger.warning(f"Wallet stats for tenant {tenant_id} drifted, corrected: {drift}")
+
+            logger.info(f"Reconciled wallet stats for {len(tenant_ids)} tenants, {corrected} corrected")
+
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Failed to reconcile wallet stats: {e}")
+        raise self.retry(exc=e)
@@ -0,0 +1,456 @@
+"""
+Asyncio webhook delivery engine.
+
+Runs as its own process so tenant callbacks no longer hold Celery workers
+for up to 10s each:
+
+    python -m workers.webhook_engine
+
+Jobs are taken from the Redis list WEBHOOK_QUEUE_KEY into this engine's
+processing list (utils.reliable_queue) and POSTed with one pooled aiohttp
+session. A job leaves the processing list in the same transaction that
+records its outcome (delivered, parked for retry or dead-lettered), and the
+jobs of a crashed engine are restored by the others. Each tenant gets its own concurrency cap, and a
+tenant with too many deliveries already waiting has new jobs deferred, so
+one slow endpoint cannot take over the engine. Failed deliveries are
+retried with jittered exponential backoff from the WEBHOOK_RETRY_KEY
+sorted set; after WEBHOOK_MAX_ATTEMPTS they go to WEBHOOK_DEAD_KEY.
+
+Every event carries an event_id and a per-tenant sequence so receivers can
+dedupe and order them. Tenants with TenantConfig.webhook_batching get their
+events coalesced into one POST of {"batch_id", "events": [...]}, sent once
+WEBHOOK_BATCH_MAX_SIZE events are waiting or WEBHOOK_BATCH_MAX_DELAY after
+the first one; a due batch is turned into a job on the pending list in one
+script, so events are never out of Redis in between. Deliveries to tenants
+with a webhook_secret are signed:
+
+    X-Webhook-Signature: t=<unix time>,v1=<hex HMAC-SHA256(secret, "<t>.<body>")>
+
+Engines cache secrets briefly; a rotation is published on
+WEBHOOK_SECRET_CHANNEL so every engine signs with the new one right away.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import ssl
+import time
+import uuid
+
+import aiohttp
+import redis.asyncio as aioredis
+from flask import current_app
+
+from models import db, TenantConfig
+from utils.reliable_queue import ReliableQueue
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_KEY = "webhooks:pending"
+WEBHOOK_RETRY_KEY = "webhooks:retry"
+WEBHOOK_DEAD_KEY = "webhooks:dead"
+WEBHOOK_DEAD_MAXLEN = 10000
+WEBHOOK_BATCH_DUE_KEY = "webhooks:batch:due"
+WEBHOOK_SECRET_CHANNEL = "webhooks:secret:rotated"
+SECRET_CACHE_SECONDS = 60
+HEARTBEAT_TTL = 30  # seconds without a heartbeat before an engine's jobs are restored
+
+# KEYS[1]: retry zset, KEYS[2]: pending list; ARGV[1]: now, ARGV[2]: limit
+# Moves due retries back to the pending list atomically, so several engine
+# processes never pick up the same job.
+_PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+    redis.call('RPUSH', KEYS[2], unpack(due))
+end
+return #due
+"""
+
+# KEYS[1]: tenant batch list, KEYS[2]: batch due zset
+# ARGV[1]: event, ARGV[2]: tenant id, ARGV[3]: flush-by time, ARGV[4]: max size, ARGV[5]: now
+# The first event of a batch sets its deadline; a full batch is due at once.
+_ADD_TO_BATCH = """
+local n = redis.call('RPUSH', KEYS[1], ARGV[1])
+if n >= tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[2], ARGV[5], ARGV[2])
+else
+    redis.call('ZADD', KEYS[2], 'NX', ARGV[3], ARGV[2])
+end
+return n
+"""
+
+# KEYS[1]: batch due zset, KEYS[2]: tenant batch list, KEYS[3]: pending list
+# ARGV[1]: tenant id, ARGV[2]: max size, ARGV[3]: due time for any leftovers,
+# ARGV[4]: batch id
+# Only the process that removes the tenant from the due set gets the batch.
+# The events are wrapped verbatim into a batch job on the pending list
+# (expanded by WebhookEngine._batch_job) without leaving Redis.
+_CLAIM_BATCH = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+local events = redis.call('LPOP', KEYS[2], tonumber(ARGV[2]))
+if redis.call('LLEN', KEYS[2]) > 0 then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+end
+if not events then
+    return 0
+end
+redis.call('RPUSH', KEYS[3], '{"id":"' .. ARGV[4] .. '","tenant_id":"' .. ARGV[1] ..
+    '","batch":[' .. table.concat(events, ',') .. '],"attempt":0}')
+return #events
+"""
+
+
+def _batch_key(tenant_id):
+    return f"webhooks:batch:{tenant_id}"
+
+
+def sign_webhook(secret, body, timestamp=None):
+    timestamp = int(timestamp or time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def get_webhook_secret(tenant_id):
+    """
+    Tenant's webhook signing secret, cached apart from tenant:<id> (which is
+    returned to the dashboard).
+    """
+    cache = current_app.cache
+    cached = cache.get(f"webhook_secret:{tenant_id}")
+    if cached is not None:
+        return cached or None
+
+    config = TenantConfig.query.filter_by(tenant_id=tenant_id).first()
+    secret = config.webhook_secret if config else None
+    cache.set(f"webhook_secret:{tenant_id}", secret or "", timeout=300)
+    return secret
+
+
+def invalidate_webhook_secret(tenant_id):
+    """
+    Drop a tenant's cached secret here and in every delivery engine. Call
+    after a rotation is committed.
+    """
+    current_app.cache.delete(f"webhook_secret:{tenant_id}")
+    try:
+        current_app.redis.publish(WEBHOOK_SECRET_CHANNEL, str(tenant_id))
+    except Exception as e:
+        logger.error(f"Failed to publish webhook secret rotation for tenant {tenant_id}: {e}")
+
+
+def queue_webhook(tenant_id, url, payload, batched=False):
+    """
+    Hand a webhook to the delivery engine, or add it to the tenant's
+    pending batch.
+    """
+    r = current_app.redis
+    tenant_id = str(tenant_id)
+    event_id = str(uuid.uuid4())
+    payload = dict(payload, event_id=event_id, sequence=r.incr(f"webhooks:seq:{tenant_id}"))
+
+    if batched:
+        now = time.time()
+        event = json.dumps({"url": url, "payload": payload})
+        r.eval(
+            _ADD_TO_BATCH, 2, _batch_key(tenant_id), WEBHOOK_BATCH_DUE_KEY,
+            event, tenant_id, now + current_app.config.get("WEBHOOK_BATCH_MAX_DELAY", 0.5),
+            current_app.config.get("WEBHOOK_BATCH_MAX_SIZE", 100), now,
+        )
+        return event_id
+
+    job = {
+        "id": event_id,
+        "tenant_id": tenant_id,
+        "url": url,
+        "payload": payload,
+        "attempt": 0,
+    }
+    r.rpush(WEBHOOK_QUEUE_KEY, json.dumps(job))
+    return event_id
+
+
+def retry_delay(attempt, base, cap):
+    """
+    Exponential backoff with jitter: half fixed, half random.
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class WebhookEngine:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config.get("WEBHOOK_ENGINE_BATCH_SIZE", 200)
+        self.max_in_flight = app.config.get("WEBHOOK_ENGINE_MAX_IN_FLIGHT", 2000)
+        self.tenant_concurrency = app.config.get("WEBHOOK_TENANT_CONCURRENCY", 10)
+        self.tenant_max_pending = app.config.get("WEBHOOK_TENANT_MAX_PENDING", 200)
+        self.timeout = app.config.get("WEBHOOK_TIMEOUT", 10)
+        self.max_attempts = app.config.get("WEBHOOK_MAX_ATTEMPTS", 8)
+        self.retry_base = app.config.get("WEBHOOK_RETRY_BASE", 5)
+        self.retry_cap = app.config.get("WEBHOOK_RETRY_CAP", 3600)
+        self.batch_max_size = app.config.get("WEBHOOK_BATCH_MAX_SIZE", 100)
+        self.batch_max_delay = app.config.get("WEBHOOK_BATCH_MAX_DELAY", 0.5)
+        self._secrets = {}
+        self._session = None
+        self._semaphores = {}
+        self._pending = {}
+        self._inflight = set()
+        self._slots = None
+        self._stopping = None
+        self._r = None
+        self._queue = None
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        r = self._r = self._redis()
+        name = f"{socket.gethostname()}-{os.getpid()}"
+        self._queue = ReliableQueue(r, WEBHOOK_QUEUE_KEY, name, heartbeat_ttl=HEARTBEAT_TTL)
+        await self._queue.heartbeat()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+        background = [
+            asyncio.create_task(self._promote_retries(r)),
+            asyncio.create_task(self._flush_batches(r)),
+            asyncio.create_task(self._watch_secrets(r)),
+            asyncio.create_task(self._keep_alive()),
+        ]
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            self._session = session
+            logger.info(f"Webhook engine {name} started")
+            while not self._stopping.is_set():
+                jobs = await self._queue.take(self.batch_size, timeout=1)
+                for raw in jobs:
+                    await self._start(self._handle(session, raw))
+
+            if self._inflight:
+                await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        for task in background:
+            task.cancel()
+        await self._queue.stop()
+        await r.aclose()
+        logger.info("Webhook engine stopped")
+
+    async def _start(self, coro):
+        await self._slots.acquire()
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._inflight.discard(task)
+        self._slots.release()
+
+    def _redis(self):
+        url = self.app.config["CACHE_REDIS_URL"]
+        kwargs = {"decode_responses": True}
+        if url.startswith("rediss://"):
+            kwargs["ssl_cert_reqs"] = ssl.CERT_NONE
+        return aioredis.Redis.from_url(url, **kwargs)
+
+    async def _keep_alive(self):
+        """
+        Heartbeat for this engine, and restore the jobs of dead ones.
+        """
+        while True:
+            try:
+                await self._queue.heartbeat()
+                await self._queue.reap()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Webhook engine heartbeat failed: {e}")
+            await asyncio.sleep(HEARTBEAT_TTL / 3)
+
+    async def _watch_secrets(self, r):
+        """
+        Evict rotated secrets as soon as the rotation is published.
+        """
+        while True:
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(WEBHOOK_SECRET_CHANNEL)
+                # rotations missed while not subscribed
+                self._secrets.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._secrets.pop(message["data"], None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Webhook secret listener disconnected: {e}")
+                self._secrets.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def _promote_retries(self, r):
+        while True:
+            try:
+                moved = await r.eval(_PROMOTE_DUE, 2, WEBHOOK_RETRY_KEY, WEBHOOK_QUEUE_KEY, time.time(), 500)
+                if moved:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to promote webhook retries: {e}")
+            await asyncio.sleep(1)
+
+    async def _flush_batches(self, r):
+        while True:
+            try:
+                now = time.time()
+                due = await r.zrangebyscore(WEBHOOK_BATCH_DUE_KEY, "-inf", now, start=0, num=100)
+                for tenant_id in due:
+                    await r.eval(
+                        _CLAIM_BATCH, 3, WEBHOOK_BATCH_DUE_KEY, _batch_key(tenant_id), WEBHOOK_QUEUE_KEY,
+                        tenant_id, self.batch_max_size, now + self.batch_max_delay, str(uuid.uuid4()),
+                    )
+                if due:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Failed to flush webhook batches: {e}")
+            await asyncio.sleep(0.05)
+
+    def _batch_job(self, job):
+        """
+        Expand a batch job queued by _CLAIM_BATCH into a deliverable one.
+        """
+        events = job["batch"]
+        payloads = sorted((event["payload"] for event in events), key=lambda p: p.get("sequence", 0))
+        return {
+            "id": job["id"],
+            "tenant_id": job["tenant_id"],
+            "url": events[-1]["url"],
+            "payload": {"batch_id": job["id"], "tenant_id": job["tenant_id"], "count": len(payloads), "events": payloads},
+            "attempt": job["attempt"],
+        }
+
+    async def _secret(self, tenant_id):
+        cached = self._secrets.get(tenant_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        loop = asyncio.get_running_loop()
+        secret = await loop.run_in_executor(None, self._load_secret, tenant_id)
+        self._secrets[tenant_id] = (secret, time.monotonic() + SECRET_CACHE_SECONDS)
+        return secret
+
+    def _load_secret(self, tenant_id):
+        with self.app.app_context():
+            try:
+                return get_webhook_secret(tenant_id)
+            finally:
+                db.session.remove()
+
+    def _semaphore(self, tenant_id):
+        if tenant_id not in self._semaphores:
+            self._semaphores[tenant_id] = asyncio.Semaphore(self.tenant_concurrency)
+        return self._semaphores[tenant_id]
+
+    async def _handle(self, session, raw):
+        try:
+            job = json.loads(raw)
+            if "batch" in job:
+                job = self._batch_job(job)
+        except (KeyError, TypeError, ValueError):
+            logger.error(f"Dropping malformed webhook job: {raw!r}")
+            await self._queue.ack([raw])
+            return
+        try:
+            await self._process(session, job, raw)
+        except Exception as e:
+            # outcome not recorded; the job stays in the processing list and
+            # is restored by another engine if this one goes away
+            logger.exception(f"Failed to record outcome of webhook {job.get('id')}: {e}")
+
+    async def _settle(self, raw, retry_at=None, job=None, dead=False):
+        """
+        Take a job off the processing list, parking `job` for retry at
+        `retry_at` or dead-lettering it in the same transaction.
+        """
+        pipe = self._r.pipeline(transaction=True)
+        if dead:
+            pipe.lpush(WEBHOOK_DEAD_KEY, json.dumps(job))
+            pipe.ltrim(WEBHOOK_DEAD_KEY, 0, WEBHOOK_DEAD_MAXLEN - 1)
+        elif retry_at is not None:
+            pipe.zadd(WEBHOOK_RETRY_KEY, {json.dumps(job): retry_at})
+        pipe.lrem(self._queue.processing_key, 1, raw)
+        await pipe.execute()
+
+    async def _process(self, session, job, raw):
+        tenant_id = job["tenant_id"]
+        if self._pending.get(tenant_id, 0) >= self.tenant_max_pending:
+            # this tenant is backed up; park the job instead of holding a slot
+            await self._settle(raw, retry_at=time.time() + self.retry_base, job=job)
+            return
+
+        self._pending[tenant_id] = self._pending.get(tenant_id, 0) + 1
+        try:
+            async with self._semaphore(tenant_id):
+                error = await self._deliver(session, job)
+        finally:
+            self._pending[tenant_id] -= 1
+            if not self._pending[tenant_id]:
+                del self._pending[tenant_id]
+
+        if error:
+            await self._failed(job, error, raw)
+        else:
+            await self._settle(raw)
+
+    async def _deliver(self, session, job):
+        body = json.dumps(job["payload"])
+        headers = {
+            "Content-Type": "application/json",
+            "X-Webhook-Id": job["id"],
+            "X-Webhook-Attempt": str(job["attempt"] + 1),
+        }
+        try:
+            secret = await self._secret(job["tenant_id"])
+            if secret:
+                headers["X-Webhook-Signature"] = sign_webhook(secret, body)
+            async with session.post(job["url"], data=body, headers=headers) as response:
+                if 200 <= response.status < 300:
+                    logger.info(f"Webhook {job['id']} delivered to tenant {job['tenant_id']}")
+                    return None
+                return f"HTTP {response.status}"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    async def _failed(self, job, error, raw):
+        job["attempt"] += 1
+        job["last_error"] = error
+        if job["attempt"] >= self.max_attempts:
+            logger.error(f"Webhook {job['id']} for tenant {job['tenant_id']} dead-lettered: {error}")
+            await self._settle(raw, job=job, dead=True)
+            return
+
+        delay = retry_delay(job["attempt"], self.retry_base, self.retry_cap)
+        logger.warning(
+            f"Webhook {job['id']} for tenant {job['tenant_id']} failed ({error}), "
+            f"retry {job['attempt']} in {delay:.0f}s"
+        )
+        await self._settle(raw, retry_at=time.time() + delay, job=job)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(WebhookEngine(app).run())